@@ -0,0 +1,131 @@
+"""Benchmark: many concurrent sessions against the simulated backend.
+
+Runs ``--sessions`` full Orchestrator sessions (subconscious loop, S_loud
+batching, summaries, user turns every ``--turn-every`` seconds) for
+``--duration`` seconds with both layers on the ``simulated`` backend, in a
+temporary database. Timing and fault rates come from the flags, as does
+the scheduler's concurrency limit for the backend.
+
+Reports user-turn latency (from sending the message to the first reply
+chunk on the WebSocket), subconscious cycles per second and the per-call
+telemetry, scheduler and resilience stats.
+
+    cd backend && python benchmarks/bench_capacity.py --sessions 30 --duration 30
+    cd backend && python benchmarks/bench_capacity.py --error-rate 0.05 --timeout-rate 0.01
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import orchestrator  # noqa: E402
+from database import repository as db  # noqa: E402
+from llm.resilience import resilience_stats  # noqa: E402
+from llm.scheduler import get_scheduler, scheduler_stats  # noqa: E402
+from llm.telemetry import summarize_calls  # noqa: E402
+
+
+def percentile(values: list[float], p: int) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+async def run_session(index: int, sessions: int, model_config: dict, duration: float,
+                      turn_every: float, latencies: list[float]) -> int:
+    first_chunk: list[float] = []
+
+    async def send_ws(message: dict):
+        if message["type"] == "ed_agent_chunk" and not first_chunk:
+            first_chunk.append(time.perf_counter())
+
+    orch = orchestrator.Orchestrator(send_ws)
+    await orch.create_session(f"bench-{index}", "default.md", model_config=model_config,
+                              summary_frequency=5)
+    deadline = time.monotonic() + duration
+    turn = 0
+    try:
+        # Stagger the sessions' turns
+        await asyncio.sleep(turn_every * index / sessions)
+        while time.monotonic() < deadline:
+            turn += 1
+            first_chunk.clear()
+            start = time.perf_counter()
+            await orch.handle_user_message(f"Session {index}, message {turn}: what do you make of this?")
+            if first_chunk:
+                latencies.append((first_chunk[0] - start) * 1000)
+            await asyncio.sleep(turn_every)
+    finally:
+        await orch.stop()
+    return orch.subconscious_cycle
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds")
+    parser.add_argument("--turn-every", type=float, default=5.0, help="seconds between user messages")
+    parser.add_argument("--ttft-ms", type=float, default=400)
+    parser.add_argument("--tokens-per-sec", type=float, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--deadline", type=float, default=10.0, help="per-call deadline, seconds")
+    parser.add_argument("--concurrency", type=int, default=4, help="scheduler limit for the backend")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    # Injected faults are expected; keep their tracebacks out of the report
+    logging.basicConfig(level=logging.CRITICAL)
+
+    layer = {
+        "backend": "simulated",
+        "model": "simulated",
+        "deadline": args.deadline,
+        "simulation": {
+            "seed": args.seed,
+            "ttft_ms": {"median": args.ttft_ms, "sigma": 0.5},
+            "tokens_per_sec": {"median": args.tokens_per_sec, "sigma": 0.3},
+            "error_rate": args.error_rate,
+            "timeout_rate": args.timeout_rate,
+            "malformed_rate": args.malformed_rate,
+        },
+    }
+    model_config = {"c_model": dict(layer), "s_model": dict(layer, max_tokens=2048)}
+    get_scheduler().limits["simulated"] = {"concurrency": args.concurrency, "tpm": None}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        orchestrator.LOGS_DIR = Path(tmp) / "logs"
+        await db.init_db(Path(tmp) / "bench.db")
+        latencies: list[float] = []
+        started = time.monotonic()
+        cycles = await asyncio.gather(*(
+            run_session(i, args.sessions, model_config, args.duration, args.turn_every, latencies)
+            for i in range(args.sessions)
+        ))
+        elapsed = time.monotonic() - started
+        await db.flush_writes()
+        calls = await db.get_llm_calls(3600)
+        await db.close_db()
+
+    print(f"{args.sessions} sessions for {elapsed:.1f}s")
+    if latencies:
+        print(f"user turn to first chunk: p50 {statistics.median(latencies):.0f}ms  "
+              f"p90 {percentile(latencies, 90):.0f}ms  p99 {percentile(latencies, 99):.0f}ms  "
+              f"({len(latencies)} turns)")
+    print(f"subconscious cycles: {sum(cycles)} ({sum(cycles) / elapsed:.1f}/s)")
+    for group in summarize_calls(calls, ("layer", "purpose")):
+        print(f"  {group['layer']:12s} {group['purpose']:10s} calls {group['calls']:5d}  "
+              f"errors {group['errors']:4d}  latency p50 {group['latency_ms']['p50']}ms "
+              f"p99 {group['latency_ms']['p99']}ms  queue p99 {group['queue_ms']['p99']}ms")
+    print(json.dumps({"scheduler": scheduler_stats(), "resilience": resilience_stats()}, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
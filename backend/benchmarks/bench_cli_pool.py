@@ -0,0 +1,122 @@
+"""Benchmark: time to first token of ClaudeCLIAdapter, cold spawn vs worker pool.
+
+Puts a stub ``claude`` executable first on PATH. The stub sleeps
+``--startup`` seconds before reading its input (standing in for Node boot
+and auth), reads its system prompt file and stdin like the real CLI, then
+streams a canned reply in both the plain ``--print`` and the stream-json
+protocols. Each mode runs ``--calls`` sequential generate_stream() calls
+with ``--gap`` seconds between them, as a session's cycles would.
+``--prompt-kb`` sizes the system prompt and the user message; multi-MB
+prompts used to exceed ARG_MAX when they were passed as arguments.
+
+    cd backend && python benchmarks/bench_cli_pool.py --startup 0.8 --calls 20
+    cd backend && python benchmarks/bench_cli_pool.py --prompt-kb 4096
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from llm.claude_cli import ClaudeCLIAdapter  # noqa: E402
+from llm.cli_pool import CLIWorkerPool  # noqa: E402
+
+STUB = '''#!{python}
+import json, sys, time
+time.sleep({startup})
+with open(sys.argv[sys.argv.index("--system-prompt-file") + 1], encoding="utf-8") as f:
+    system = f.read()
+words = ["<S_quiet>", "thinking ", "about ", "it", "</S_quiet>"]
+
+def emit(event):
+    sys.stdout.write(json.dumps(event) + "\\n")
+    sys.stdout.flush()
+
+if "stream-json" not in sys.argv:
+    prompt = sys.stdin.read()
+    words[2] = f"about {{len(system)}}+{{len(prompt)}} chars "
+    for w in words:
+        sys.stdout.write(w)
+        sys.stdout.flush()
+        time.sleep({token_delay})
+    sys.exit(0)
+
+emit({{"type": "system", "subtype": "init"}})
+for line in sys.stdin:
+    if not line.strip():
+        continue
+    prompt = json.loads(line)["message"]["content"]
+    words[2] = f"about {{len(system)}}+{{len(prompt)}} chars "
+    for w in words:
+        emit({{"type": "stream_event", "event": {{"type": "content_block_delta",
+              "delta": {{"type": "text_delta", "text": w}}}}}})
+        time.sleep({token_delay})
+    emit({{"type": "result", "subtype": "success", "is_error": False, "result": "".join(words)}})
+'''
+
+
+async def run(adapter: ClaudeCLIAdapter, system: str, user: str,
+              calls: int, gap: float) -> list[float]:
+    messages = [{"role": "user", "content": user}]
+    expected = f"about {len(system)}+{len(user)} chars"
+    ttft = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        first = None
+        reply = ""
+        async for chunk in adapter.generate_stream(system, messages):
+            if first is None:
+                first = time.perf_counter() - start
+            reply += chunk
+        assert expected in reply, reply
+        ttft.append(first * 1000)
+        await asyncio.sleep(gap)
+    return ttft
+
+
+def report(name: str, ttft: list[float]):
+    ordered = sorted(ttft)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{name:8s} first {ttft[0]:8.1f}ms  p50 {statistics.median(ttft):8.1f}ms  "
+          f"p95 {p95:8.1f}ms  mean {statistics.mean(ttft):8.1f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--startup", type=float, default=0.5, help="simulated CLI boot time (s)")
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--gap", type=float, default=1.0, help="idle time between calls (s)")
+    parser.add_argument("--prompt-kb", type=int, default=0, help="pad system prompt and user message to this size")
+    args = parser.parse_args()
+
+    system = "You are a subconscious." + "\u00e9" * (args.prompt_kb * 512)
+    user = "No new information." + "-" * (args.prompt_kb * 1024)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stub = Path(tmp) / "claude"
+        stub.write_text(STUB.format(python=sys.executable, startup=args.startup,
+                                    token_delay=args.token_delay))
+        stub.chmod(0o755)
+        os.environ["PATH"] = f"{tmp}{os.pathsep}{os.environ.get('PATH', '')}"
+
+        cold = ClaudeCLIAdapter(model="stub", pooled=False)
+        report("cold", await run(cold, system, user, args.calls, args.gap))
+
+        pool = CLIWorkerPool(max_size=4)
+        pooled = ClaudeCLIAdapter(model="stub", pool=pool)
+        pooled.prewarm(system)
+        await asyncio.sleep(args.gap)  # session setup happens meanwhile
+        report("pooled", await run(pooled, system, user, args.calls, args.gap))
+        print(pool.stats())
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,141 @@
+"""Benchmark: connect-per-call vs. the pooled repository.
+
+Simulates N concurrent sessions, each running subconscious-style cycles
+(S_loud + S_quiet + mood writes, then a history read), and reports ops/sec.
+The pooled side writes the way the orchestrator does, through the
+write-behind queue.
+
+    cd backend && python benchmarks/bench_db_pool.py --sessions 20 --cycles 50
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import aiosqlite
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import repository as db  # noqa: E402
+from database.schema import SCHEMA_SQL  # noqa: E402
+
+OPS_PER_CYCLE = 5
+
+
+# --- Baseline: the previous connect-per-call repository ---
+
+async def _legacy_db(path: Path) -> aiosqlite.Connection:
+    conn = await aiosqlite.connect(str(path))
+    conn.row_factory = aiosqlite.Row
+    await conn.execute("PRAGMA journal_mode=WAL")
+    await conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+
+async def _legacy_write(path: Path, sql: str, params: tuple):
+    conn = await _legacy_db(path)
+    try:
+        await conn.execute(sql, params)
+        await conn.commit()
+    finally:
+        await conn.close()
+
+
+async def _legacy_read(path: Path, sql: str, params: tuple):
+    conn = await _legacy_db(path)
+    try:
+        cursor = await conn.execute(sql, params)
+        return await cursor.fetchall()
+    finally:
+        await conn.close()
+
+
+async def legacy_cycle(path: Path, session_id: str, cycle: int):
+    msg = "INSERT INTO messages (session_id, layer, tag, content, cycle_number) VALUES (?, ?, ?, ?, ?)"
+    await _legacy_write(path, msg, (session_id, "subconscious", "S_loud", f"loud {cycle}", cycle))
+    await _legacy_write(path, msg, (session_id, "subconscious", "S_quiet", f"quiet {cycle}", cycle))
+    await _legacy_write(
+        path,
+        "INSERT INTO mood_and_criteria (session_id, mood, criteria, cycle_number) VALUES (?, ?, ?, ?)",
+        (session_id, "calm", "clarity", cycle),
+    )
+    await _legacy_read(
+        path,
+        "SELECT * FROM mood_and_criteria WHERE session_id = ? ORDER BY created_at DESC LIMIT 1",
+        (session_id,),
+    )
+    await _legacy_read(
+        path,
+        "SELECT * FROM messages WHERE session_id = ? ORDER BY created_at DESC LIMIT 20",
+        (session_id,),
+    )
+
+
+async def pooled_cycle(session_id: str, cycle: int):
+    # The orchestrator's write path: one unit through the write-behind queue
+    await db.queue_unit([
+        db.message_record(session_id, "subconscious", "S_loud", f"loud {cycle}", cycle),
+        db.message_record(session_id, "subconscious", "S_quiet", f"quiet {cycle}", cycle),
+        db.mood_and_criteria_record(session_id, "calm", "clarity", cycle),
+    ])
+    await db.end_cycle()
+    await db.get_latest_mood_and_criteria(session_id)
+    await db.get_messages(session_id, limit=20)
+
+
+async def _run(sessions: list[str], cycles: int, cycle_fn) -> float:
+    async def session_loop(sid: str):
+        for c in range(1, cycles + 1):
+            await cycle_fn(sid, c)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session_loop(sid) for sid in sessions))
+    elapsed = time.perf_counter() - start
+    return len(sessions) * cycles * OPS_PER_CYCLE / elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--cycles", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = Path(tmp) / "legacy.db"
+        conn = await _legacy_db(legacy_path)
+        await conn.executescript(SCHEMA_SQL)
+        legacy_sessions = [str(uuid.uuid4()) for _ in range(args.sessions)]
+        for sid in legacy_sessions:
+            await conn.execute(
+                "INSERT INTO sessions (id, name, persona_core_path, model_config) VALUES (?, ?, ?, ?)",
+                (sid, "bench", "default.md", "{}"),
+            )
+        await conn.commit()
+        await conn.close()
+
+        legacy_ops = await _run(
+            legacy_sessions, args.cycles,
+            lambda sid, c: legacy_cycle(legacy_path, sid, c),
+        )
+
+        await db.init_db(Path(tmp) / "pooled.db")
+        pooled_sessions = [str(uuid.uuid4()) for _ in range(args.sessions)]
+        for sid in pooled_sessions:
+            await db.create_session(sid, "bench", "default.md", {})
+        pooled_ops = await _run(pooled_sessions, args.cycles, pooled_cycle)
+        await db.flush_writes()
+        stats = db.pool_stats()
+        await db.close_db()
+
+    print(f"sessions={args.sessions} cycles={args.cycles} ops/cycle={OPS_PER_CYCLE}")
+    print(f"connect-per-call: {legacy_ops:10.1f} ops/sec")
+    print(f"pooled:           {pooled_ops:10.1f} ops/sec  ({pooled_ops / legacy_ops:.1f}x)")
+    print(f"pool stats: {stats}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+"""Benchmark: reading slices of a large segmented session log.
+
+Writes ``--size-mb`` of subconscious-style records through the LogWriter
+(rolling and gzipping segments as it goes), then times iter_log() for the
+tail, a slice from the middle and a cycle range, with peak Python memory
+per read. Compare with the old behaviour, read_jsonl() of the whole file,
+via --full.
+
+    cd backend && python benchmarks/bench_log_read.py --size-mb 2048
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.jsonl import closed_segments, iter_log, read_jsonl  # noqa: E402
+from utils.log_writer import LogWriter  # noqa: E402
+
+RECORDS_PER_CYCLE = 3
+
+
+async def build_log(path: Path, size_mb: int, record_size: int, segment_mb: int) -> int:
+    writer = LogWriter(segment_bytes=segment_mb * 1024 * 1024, fsync="none")
+    text = "lorem ipsum " * (record_size // 12)
+    target = size_mb * 1024 * 1024
+    written = 0
+    records = 0
+    while written < target:
+        cycle = records // RECORDS_PER_CYCLE
+        writer.append(path, {"tag": "S_loud", "content": text, "cycle_number": cycle})
+        written += record_size + 80
+        records += 1
+        if records % 5000 == 0:
+            await writer.flush()
+    await writer.stop()
+    return records
+
+
+def _timed(name: str, fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = fn()
+    elapsed = (time.perf_counter() - start) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:28s} {elapsed:9.2f}ms  {count:8d} records  peak {peak / 1024:9.1f} KiB")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--record-size", type=int, default=600)
+    parser.add_argument("--segment-mb", type=int, default=64)
+    parser.add_argument("--full", action="store_true", help="also time read_jsonl() of the whole log")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "subconscious.jsonl"
+        start = time.perf_counter()
+        records = await build_log(path, args.size_mb, args.record_size, args.segment_mb)
+        print(f"log: {records} records, {len(closed_segments(path))} closed segments, "
+              f"written in {time.perf_counter() - start:.1f}s")
+
+        last_cycle = (records - 1) // RECORDS_PER_CYCLE
+        _timed("tail 100", lambda: sum(1 for _ in iter_log(path, offset=-100)))
+        _timed("tail 1000", lambda: sum(1 for _ in iter_log(path, offset=-1000)))
+        _timed("middle, 100 from offset", lambda: sum(1 for _ in iter_log(path, offset=records // 2, limit=100)))
+        _timed("first 100", lambda: sum(1 for _ in iter_log(path, limit=100)))
+        _timed("cycle range (10 cycles)", lambda: sum(
+            1 for _ in iter_log(path, cycle_from=last_cycle // 3, cycle_to=last_cycle // 3 + 9)))
+        _timed("last 5 cycles", lambda: sum(1 for _ in iter_log(path, cycle_from=last_cycle - 4)))
+        if args.full:
+            _timed("read_jsonl (whole log)", lambda: len(read_jsonl(path)))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
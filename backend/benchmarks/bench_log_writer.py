@@ -0,0 +1,102 @@
+"""Benchmark: event-loop lag with synchronous append_jsonl vs. the LogWriter.
+
+Simulates N concurrent sessions each writing five JSONL records per cycle
+(the subconscious cycle's S_loud/S_quiet/mood lines plus an ID_loud/ID_quiet
+pair) while a probe task measures how late the loop wakes it up.
+
+    cd backend && python benchmarks/bench_log_writer.py --sessions 50 --cycles 200
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.jsonl import append_jsonl  # noqa: E402
+from utils.log_writer import LogWriter  # noqa: E402
+
+PROBE_INTERVAL = 0.001
+
+
+async def _probe(lags: list[float], stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append((time.perf_counter() - start - PROBE_INTERVAL) * 1000)
+
+
+def _cycle_records(cycle: int, size: int) -> list[tuple[str, dict]]:
+    text = "x" * size
+    return [
+        ("subconscious.jsonl", {"tag": "S_loud", "content": text, "cycle_number": cycle}),
+        ("subconscious.jsonl", {"tag": "S_quiet", "content": text, "cycle_number": cycle}),
+        ("mood_and_criteria.jsonl", {"mood": "calm", "criteria": "clarity", "cycle_number": cycle}),
+        ("internal_dialog.jsonl", {"tag": "ID_loud", "content": text, "cycle_number": cycle}),
+        ("internal_dialog.jsonl", {"tag": "ID_quiet", "content": text, "cycle_number": cycle}),
+    ]
+
+
+async def _run(root: Path, sessions: int, cycles: int, size: int, delay: float,
+               append) -> tuple[float, list[float]]:
+    lags: list[float] = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_probe(lags, stop))
+
+    async def session_loop(i: int):
+        log_dir = root / f"session-{i:04d}"
+        for c in range(cycles):
+            for name, record in _cycle_records(c, size):
+                append(log_dir / name, record)
+            # Stand-in for the LLM call between cycles
+            await asyncio.sleep(delay)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session_loop(i) for i in range(sessions)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe
+    return elapsed, lags
+
+
+def _report(name: str, elapsed: float, lags: list[float], records: int):
+    lags.sort()
+    p99 = lags[int(len(lags) * 0.99) - 1] if lags else 0.0
+    print(f"{name:14s} {records / elapsed:10.0f} records/s  loop lag "
+          f"p50={statistics.median(lags) if lags else 0:6.2f}ms  p99={p99:7.2f}ms  "
+          f"max={max(lags, default=0):7.2f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--cycles", type=int, default=200)
+    parser.add_argument("--size", type=int, default=800, help="content bytes per record")
+    parser.add_argument("--delay", type=float, default=0.01, help="seconds between a session's cycles")
+    parser.add_argument("--dir", type=Path, default=None,
+                        help="write logs under this directory (e.g. a slow or network volume)")
+    parser.add_argument("--fsync", choices=("none", "interval", "always"), default="interval")
+    args = parser.parse_args()
+    records = args.sessions * args.cycles * 5
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        elapsed, lags = await _run(Path(tmp) / "sync", args.sessions, args.cycles, args.size, args.delay,
+                                  append_jsonl)
+        _report("append_jsonl", elapsed, lags, records)
+
+        writer = LogWriter(fsync=args.fsync)
+        elapsed, lags = await _run(Path(tmp) / "async", args.sessions, args.cycles, args.size, args.delay,
+                                  writer.append)
+        start = time.perf_counter()
+        await writer.stop()
+        drain = time.perf_counter() - start
+        _report("LogWriter", elapsed, lags, records)
+        print(f"LogWriter drain on stop: {drain * 1000:.1f}ms  stats: {writer.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
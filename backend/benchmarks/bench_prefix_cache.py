@@ -0,0 +1,139 @@
+"""Benchmark: prompt evaluation per subconscious cycle against a llama.cpp stand-in.
+
+Starts a small OpenAI-compatible server that imitates llama.cpp's prompt
+cache: it keeps the last prompt of each of ``--slots`` slots, evaluates only
+the part of a new prompt past the common prefix (when the request sends
+``cache_prompt``) and sleeps ``--token-ms`` per evaluated token. Requests
+without ``id_slot`` get the least recently used slot.
+
+``--sessions`` sessions run SubconsciousLayer cycles in turn, each with its
+growing S_quiet/S_loud histories, for every combination of prompt layout and
+cache hints; the table shows tokens evaluated and prompt-eval time per cycle.
+
+    cd backend && python benchmarks/bench_prefix_cache.py --cycles 40
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import socket
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import uvicorn  # noqa: E402
+from fastapi import FastAPI, Request  # noqa: E402
+
+from layers.subconscious import SubconsciousLayer  # noqa: E402
+from layers.transcript import LAYOUT_CLASSIC, LAYOUT_PREFIX_STABLE  # noqa: E402
+from llm.openai_compat import OpenAICompatAdapter  # noqa: E402
+
+CHARS_PER_TOKEN = 4
+
+
+class StandInServer:
+    def __init__(self, slots: int, token_ms: float):
+        self.token_ms = token_ms
+        self.slots: list[str] = [""] * slots
+        self.last_used = [0.0] * slots
+        self.evals: list[dict] = []
+        self.app = FastAPI()
+        self.app.post("/v1/chat/completions")(self.complete)
+
+    async def complete(self, request: Request):
+        body = await request.json()
+        prompt = "".join(f"<|{m['role']}|>{m['content']}" for m in body["messages"])
+        slot = body.get("id_slot")
+        if slot is None or not 0 <= slot < len(self.slots):
+            slot = min(range(len(self.slots)), key=lambda i: self.last_used[i])
+        cached = 0
+        if body.get("cache_prompt"):
+            previous = self.slots[slot]
+            limit = min(len(previous), len(prompt))
+            while cached < limit and previous[cached] == prompt[cached]:
+                cached += 1
+        evaluated = (len(prompt) - cached) // CHARS_PER_TOKEN + 1
+        prompt_ms = evaluated * self.token_ms
+        await asyncio.sleep(prompt_ms / 1000)
+        self.slots[slot] = prompt
+        self.last_used[slot] = time.monotonic()
+        self.evals.append({"prompt_n": evaluated, "cache_n": cached // CHARS_PER_TOKEN,
+                           "prompt_ms": prompt_ms})
+        n = len(self.evals)
+        content = (f"<S_quiet>Note {n}: the conversation keeps circling the same worry.</S_quiet>"
+                   f"<S_loud>Impulse {n}: ask what they actually need.</S_loud>"
+                   "<M_and_C><mood>curious</mood><criteria>honesty</criteria></M_and_C>")
+        return {
+            "id": f"cmpl-{n}", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": evaluated, "completion_tokens": 40, "total_tokens": evaluated + 40},
+        }
+
+
+async def run_sessions(endpoint: str, server: StandInServer, layout: str, slots: int,
+                       sessions: int, cycles: int, persona: str) -> list[dict]:
+    layers = [
+        SubconsciousLayer(
+            OpenAICompatAdapter(model="stand-in", endpoint=endpoint, slots=slots,
+                                slot_owner=f"bench-{layout}-{slots}-{i}:subconscious"),
+            layout=layout,
+        )
+        for i in range(sessions)
+    ]
+    histories = [{"s_quiet": [], "s_loud": []} for _ in range(sessions)]
+    server.evals.clear()
+    for cycle in range(1, cycles + 1):
+        for layer, history in zip(layers, histories):
+            result = await layer.process(
+                persona_core=persona,
+                ed_user=f"Message {cycle}: I keep going back and forth on this." if cycle % 3 == 1 else "",
+                s_quiet_history="\n---\n".join(history["s_quiet"][-10:]),
+                s_loud_history="\n---\n".join(history["s_loud"][-10:]),
+                cycle=cycle,
+            )
+            history["s_quiet"].append(result["s_quiet"])
+            history["s_loud"].append(result["s_loud"])
+    return list(server.evals)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cycles", type=int, default=30)
+    parser.add_argument("--sessions", type=int, default=2)
+    parser.add_argument("--slots", type=int, default=2)
+    parser.add_argument("--token-ms", type=float, default=0.2, help="prompt eval cost per token")
+    parser.add_argument("--persona-kb", type=int, default=8)
+    args = parser.parse_args()
+
+    server = StandInServer(args.slots, args.token_ms)
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    uv = uvicorn.Server(uvicorn.Config(server.app, host="127.0.0.1", port=port, log_level="warning"))
+    serve = asyncio.create_task(uv.serve())
+    while not uv.started:
+        await asyncio.sleep(0.05)
+    endpoint = f"http://127.0.0.1:{port}/v1"
+    persona = ("You are the subconscious of a thoughtful agent. " * 50)[: args.persona_kb * 1024]
+
+    print(f"{args.sessions} sessions x {args.cycles} cycles, {args.slots} server slots")
+    print(f"{'layout':14s} {'hints':6s} {'tokens/cycle':>13s} {'cached/cycle':>13s} {'prompt ms/cycle':>16s}")
+    try:
+        for layout, slots in [(LAYOUT_CLASSIC, 0), (LAYOUT_CLASSIC, args.slots),
+                              (LAYOUT_PREFIX_STABLE, args.slots)]:
+            evals = await run_sessions(endpoint, server, layout, slots,
+                                       args.sessions, args.cycles, persona)
+            print(f"{layout:14s} {'yes' if slots else 'no':6s} "
+                  f"{statistics.mean(e['prompt_n'] for e in evals):13.0f} "
+                  f"{statistics.mean(e['cache_n'] for e in evals):13.0f} "
+                  f"{statistics.mean(e['prompt_ms'] for e in evals):16.1f}")
+    finally:
+        uv.should_exit = True
+        await serve
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
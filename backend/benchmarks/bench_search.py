@@ -0,0 +1,119 @@
+"""Benchmark: /api/search latency against a synthetic corpus.
+
+Builds a throwaway database with ``--rows`` messages spread over ``--sessions``
+sessions (plus one summary per 100 messages), then times repository.search()
+for a mix of rare, common and filtered queries.
+
+    cd backend && python benchmarks/bench_search.py --rows 1000000
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import itertools
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import repository as db  # noqa: E402
+
+LAYERS = [("external", "ED_user"), ("external", "ED_agent"), ("internal", "ID_loud"),
+          ("internal", "ID_quiet"), ("subconscious", "S_loud"), ("subconscious", "S_quiet")]
+
+
+def _vocabulary(rng: random.Random, size: int) -> list[str]:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+
+async def build_corpus(rows: int, sessions: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    vocab = _vocabulary(rng, 20000)
+    # Zipf-like skew so some terms are common and most are rare
+    cum_weights = list(itertools.accumulate(1 / (i + 1) for i in range(len(vocab))))
+    session_ids = [f"bench-{i:05d}" for i in range(sessions)]
+
+    pool = await db.get_pool()
+    async with pool.writer() as conn:
+        await conn.executemany(
+            "INSERT INTO sessions (id, name, persona_core_path, model_config) VALUES (?, ?, ?, '{}')",
+            [(sid, sid, "default.md") for sid in session_ids],
+        )
+        batch = []
+        summaries = []
+        for i in range(rows):
+            sid = session_ids[i % sessions]
+            layer, tag = LAYERS[i % len(LAYERS)]
+            content = " ".join(rng.choices(vocab, cum_weights=cum_weights, k=rng.randint(10, 60)))
+            cycle = i // sessions
+            batch.append((sid, layer, tag, content, cycle))
+            if i % 100 == 0:
+                summaries.append((sid, "subconscious",
+                                  " ".join(rng.choices(vocab, cum_weights=cum_weights, k=80)), cycle, cycle + 10))
+            if len(batch) >= 10000:
+                await conn.executemany(
+                    "INSERT INTO messages (session_id, layer, tag, content, cycle_number) VALUES (?, ?, ?, ?, ?)",
+                    batch,
+                )
+                await conn.commit()
+                batch.clear()
+        if batch:
+            await conn.executemany(
+                "INSERT INTO messages (session_id, layer, tag, content, cycle_number) VALUES (?, ?, ?, ?, ?)",
+                batch,
+            )
+        await conn.executemany(
+            "INSERT INTO context_summaries (session_id, layer, summary, cycle_from, cycle_to) VALUES (?, ?, ?, ?, ?)",
+            summaries,
+        )
+        await conn.commit()
+    return vocab
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        await db.init_db(Path(tmp) / "search.db")
+        start = time.perf_counter()
+        vocab = await build_corpus(args.rows, args.sessions, args.seed)
+        print(f"corpus: {args.rows} messages indexed in {time.perf_counter() - start:.1f}s")
+
+        rng = random.Random(args.seed + 1)
+        cases = {
+            "common term": lambda: {"query": vocab[rng.randint(0, 20)]},
+            "rare term": lambda: {"query": vocab[rng.randint(5000, 19999)]},
+            "two terms": lambda: {"query": f"{vocab[rng.randint(0, 200)]} {vocab[rng.randint(0, 200)]}"},
+            "prefix": lambda: {"query": vocab[rng.randint(0, 200)][:3] + "*"},
+            "session filter": lambda: {"query": vocab[rng.randint(0, 200)],
+                                       "session_id": f"bench-{rng.randrange(args.sessions):05d}"},
+            "layer+cycle filter": lambda: {"query": vocab[rng.randint(0, 200)], "layer": "subconscious",
+                                           "cycle_from": 10, "cycle_to": 200},
+            "page 5": lambda: {"query": vocab[rng.randint(0, 20)], "offset": 80},
+        }
+        for name, make in cases.items():
+            timings = []
+            for _ in range(args.queries):
+                kwargs = make()
+                query = kwargs.pop("query")
+                t0 = time.perf_counter()
+                await db.search(query, **kwargs)
+                timings.append((time.perf_counter() - t0) * 1000)
+            timings.sort()
+            p95 = timings[int(len(timings) * 0.95) - 1]
+            print(f"{name:20s} p50={statistics.median(timings):8.2f}ms  p95={p95:8.2f}ms")
+
+        await db.close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
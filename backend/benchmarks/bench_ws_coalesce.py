@@ -0,0 +1,142 @@
+"""Benchmark: WebSocket frames and server CPU per streamed reply, with and
+without outbound frame coalescing.
+
+Starts the app under uvicorn in a subprocess per mode, with its data in a
+temporary directory and ``WS_COALESCE_INTERVAL_MS`` set to 0 (every chunk
+is a frame) or to the configured value. A ``websockets`` client creates a
+session on the ``simulated`` backend, pauses the subconscious loop and sends
+``--replies`` user messages, each streamed at ``--tokens-per-sec`` with
+``--reply-tokens`` tokens. Reports frames per reply, frames/sec while
+streaming and server CPU time (from /proc) per reply.
+
+    cd backend && python benchmarks/bench_ws_coalesce.py --replies 20 --tokens-per-sec 400
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import websockets
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+SERVER = '''
+import sys
+from pathlib import Path
+sys.path.insert(0, {backend!r})
+import config
+data = Path({data!r})
+config.DATA_DIR, config.DB_PATH = data, data / "bench.db"
+config.LOGS_DIR, config.ARCHIVE_DIR = data / "logs", data / "archive"
+config.WS_COALESCE_INTERVAL_MS = {interval}
+import logging, uvicorn
+import main
+logging.getLogger("agentcsd").setLevel(logging.WARNING)
+uvicorn.run(main.app, host="127.0.0.1", port={port}, log_level="warning")
+'''
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def cpu_seconds(pid: int) -> float:
+    # utime and stime, fields 14 and 15 of /proc/<pid>/stat
+    fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def connect(port: int, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return await websockets.connect(f"ws://127.0.0.1:{port}/ws", max_size=None)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def run_mode(interval: int, args) -> dict:
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        code = SERVER.format(backend=str(BACKEND_DIR), data=tmp, interval=interval, port=port)
+        server = subprocess.Popen([sys.executable, "-c", code], cwd=BACKEND_DIR)
+        try:
+            ws = await connect(port)
+            layer = {
+                "backend": "simulated",
+                "model": "simulated",
+                "simulation": {
+                    "seed": 1,
+                    "ttft_ms": {"median": 20, "sigma": 0.0},
+                    "tokens_per_sec": {"median": args.tokens_per_sec, "sigma": 0.0},
+                    "no_external_rate": 0.0,
+                    # Sized so the reply streams about --reply-tokens tokens
+                    "templates": {"internal": "<ID_quiet>{thought}</ID_quiet>\n<ID_loud>"
+                                  + "lor " * args.reply_tokens + "</ID_loud>"},
+                },
+            }
+            await ws.send(json.dumps({"type": "create_session", "name": "bench",
+                                      "model_config": {"c_model": layer, "s_model": layer}}))
+            while json.loads(await ws.recv())["type"] != "session_created":
+                pass
+            await ws.send(json.dumps({"type": "pause_session"}))
+
+            frames = chunks = 0
+            streaming = 0.0
+            cpu_start = cpu_seconds(server.pid)
+            for turn in range(args.replies):
+                await ws.send(json.dumps({"type": "user_message", "content": f"message {turn}"}))
+                first = None
+                while True:
+                    message = json.loads(await ws.recv())
+                    frames += 1
+                    if message["type"] == "ed_agent_chunk":
+                        chunks += 1
+                        first = first or time.perf_counter()
+                    elif message["type"] == "ed_agent_done":
+                        streaming += time.perf_counter() - (first or time.perf_counter())
+                        break
+            cpu = cpu_seconds(server.pid) - cpu_start
+            await ws.close()
+        finally:
+            server.terminate()
+            server.wait()
+    return {
+        "frames_per_reply": frames / args.replies,
+        "chunk_frames_per_reply": chunks / args.replies,
+        "chunk_frames_per_sec": chunks / streaming if streaming else 0.0,
+        "cpu_ms_per_reply": cpu * 1000 / args.replies,
+    }
+
+
+async def main():
+    from config import WS_COALESCE_INTERVAL_MS
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--replies", type=int, default=20)
+    parser.add_argument("--reply-tokens", type=int, default=400)
+    parser.add_argument("--tokens-per-sec", type=float, default=400)
+    parser.add_argument("--interval-ms", type=int, default=WS_COALESCE_INTERVAL_MS)
+    args = parser.parse_args()
+
+    for label, interval in (("uncoalesced", 0), (f"coalesced {args.interval_ms}ms", args.interval_ms)):
+        result = await run_mode(interval, args)
+        print(f"{label:16s} frames/reply {result['frames_per_reply']:7.1f}  "
+              f"chunk frames/reply {result['chunk_frames_per_reply']:7.1f}  "
+              f"chunk frames/s {result['chunk_frames_per_sec']:7.1f}  "
+              f"server cpu/reply {result['cpu_ms_per_reply']:6.1f}ms")
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, str(BACKEND_DIR))
+    asyncio.run(main())
@@ -4,12 +4,52 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
 DB_PATH = DATA_DIR / "agentcsd.db"
 LOGS_DIR = DATA_DIR / "logs"
+ARCHIVE_DIR = DATA_DIR / "archive"
 PERSONAS_DIR = BASE_DIR / "personas"
 
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 LOGS_DIR.mkdir(parents=True, exist_ok=True)
+ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
 PERSONAS_DIR.mkdir(parents=True, exist_ok=True)
 
+# SQLite connection pool: one writer connection plus N read-only readers
+DB_READER_POOL_SIZE = 4
+DB_BUSY_TIMEOUT_MS = 5000
+
+# Write-behind persistence: messages, mood and summaries are group-committed
+WRITE_BEHIND_BATCH_SIZE = 200      # records per batch before a forced flush
+WRITE_BEHIND_MAX_LATENCY = 0.05    # seconds a record may wait before its batch commits
+WRITE_BEHIND_MAX_PENDING = 10000   # records queued or committing before writers wait
+DB_DURABILITY = "batched"          # "batched" (synchronous=NORMAL) or "cycle" (fsync per cycle)
+
+# Cold storage: idle sessions move out of the hot tables into ARCHIVE_DIR
+ARCHIVE_IDLE_DAYS = 30             # archive sessions with no activity for this long
+ARCHIVE_SWEEP_INTERVAL = 3600      # seconds between background archive sweeps
+INCREMENTAL_VACUUM_PAGES = 1000    # pages released per incremental_vacuum step
+DB_CONVERT_INCREMENTAL_VACUUM = False  # convert an existing database at startup (full VACUUM: slow, ~2x disk)
+
+# Session JSONL logs: buffered and written off the event loop by utils.log_writer
+LOG_FLUSH_BYTES = 64 * 1024        # buffered bytes before a forced flush
+LOG_FLUSH_INTERVAL = 0.2           # seconds a line may wait before it is written
+LOG_MAX_OPEN_FILES = 64            # LRU cap on open log file handles
+LOG_FSYNC = "interval"             # "none", "interval" or "always"
+LOG_FSYNC_INTERVAL = 1.0           # seconds between fsyncs with the "interval" policy
+LOG_SEGMENT_BYTES = 64 * 1024 * 1024  # roll the active log into a gzipped segment past this size
+LOG_INDEX_EVERY = 1000             # records between sparse index entries (also the gzip member size)
+LOG_COMPRESS_LEVEL = 6             # gzip level for closed segments
+
+# Streaming ZIP export
+EXPORT_CHUNK_SIZE = 64 * 1024      # bytes per response chunk
+EXPORT_MAX_CHUNKS = 16             # chunks buffered between the ZIP thread and the client
+EXPORT_MAX_SESSIONS = 100          # sessions per bulk export request
+
+# Claude CLI worker pool
+CLI_POOL_MAX_SIZE = 8              # live CLI processes across all pools; 0 starts one process per call
+CLI_POOL_SPARES = 1                # prewarmed idle workers per (model, tools, system prompt)
+CLI_POOL_MAX_REQUESTS = 1          # requests before a worker is recycled; above 1 the CLI conversation carries over
+CLI_POOL_IDLE_TTL = 600            # seconds an idle worker is kept before it is shut down
+CLI_POOL_HEALTH_INTERVAL = 30      # seconds between health checks of idle workers
+
 DEFAULT_MODEL_CONFIG = {
     "c_model": {
         "backend": "claude_code_cli",
@@ -27,9 +67,99 @@ DEFAULT_MODEL_CONFIG = {
 
 DEFAULT_SUMMARY_FREQUENCY = 10
 
+# LLM telemetry: USD per million (input, output, cache read, cache write)
+# tokens, matched by longest model name prefix; unlisted models get no cost
+LLM_PRICING = {
+    "claude-opus-4-5": (5.0, 25.0, 0.50, 6.25),
+    "claude-opus-4": (15.0, 75.0, 1.50, 18.75),
+    "claude-sonnet-4": (3.0, 15.0, 0.30, 3.75),
+    "claude-haiku-4-5": (1.0, 5.0, 0.10, 1.25),
+    "claude-3-5-haiku": (0.80, 4.0, 0.08, 1.0),
+}
+LLM_METRICS_WINDOW = 24 * 3600     # default window of /api/metrics/llm, seconds
+
+# Process-wide LLM scheduler: concurrent calls and tokens per minute (None =
+# unlimited) per backend, shared by all sessions
+LLM_SCHEDULER_LIMITS = {
+    "claude_code_cli": {"concurrency": 4, "tpm": None},
+    "anthropic_api": {"concurrency": 8, "tpm": 400_000},
+    "openai_compatible": {"concurrency": 2, "tpm": None},
+}
+LLM_SCHEDULER_DEFAULT_LIMIT = {"concurrency": 4, "tpm": None}
+
+# LLM call resilience (llm/resilience.py)
+LLM_DEADLINES = {"internal": 120, "subconscious": 180}  # seconds per call by layer; model config "deadline" overrides
+LLM_RETRIES = 2                    # extra attempts after a retryable error (rate limit, overload, 5xx, connection)
+LLM_RETRY_BASE_DELAY = 0.5         # seconds; attempt n waits uniform(0, base * 2**n)
+LLM_RETRY_MAX_DELAY = 8.0
+LLM_HEDGE_PURPOSES = ("user_turn", "s_loud")  # call purposes that may send a hedged second request
+LLM_HEDGE_PERCENTILE = 95          # hedge once a call runs past this percentile of recent latency
+LLM_HEDGE_MIN_SAMPLES = 20         # recent calls needed before hedging
+LLM_HEDGE_MIN_DELAY = 1.0          # never hedge sooner than this, seconds
+LLM_HEDGE_WINDOW = 200             # recent latencies kept per backend/model
+LLM_BREAKER_FAILURES = 5           # consecutive failures that open a backend's circuit
+LLM_BREAKER_COOLDOWN = 30          # seconds before an open circuit lets a probe call through
+LLM_EARLY_STOP = True              # stop generating once a layer's REQUIRED_TAGS have all closed
+
+# Simulated backend ("backend": "simulated"); a layer's model config
+# "simulation" dict overrides any of these
+SIMULATED_PROFILE = {
+    "seed": None,                  # int for reproducible output and timing
+    "ttft_ms": {"median": 400, "sigma": 0.5},       # lognormal time to first token
+    "tokens_per_sec": {"median": 60, "sigma": 0.3},  # lognormal, drawn per call
+    "error_rate": 0.0,             # calls failing with a retryable overload error
+    "timeout_rate": 0.0,           # calls hanging for hang_seconds
+    "hang_seconds": 600,
+    "malformed_rate": 0.0,         # outputs with broken or missing tags
+    "trigger_rate": 0.05,          # subconscious cycles with <trigger>true</trigger>
+    "empty_s_loud_rate": 0.2,      # subconscious cycles with nothing to say
+    "no_external_rate": 0.1,       # internal replies of [NO_EXTERNAL_OUTPUT]
+    "templates": None,             # {"internal"|"subconscious"|"summary": format string}
+}
+
+# Shared HTTP clients of the API backends (llm/clients.py)
+LLM_HTTP_MAX_CONNECTIONS = 100     # per client (backend, endpoint, API key)
+LLM_HTTP_KEEPALIVE = 20            # idle keep-alive connections kept per client
+LLM_HTTP_KEEPALIVE_EXPIRY = 120    # seconds an idle connection stays open
+LLM_CLIENT_IDLE_TTL = 300          # seconds a client no adapter holds is kept before closing
+
+# Outbound WebSocket frame coalescing (utils/ws_coalescer.py)
+WS_COALESCE_INTERVAL_MS = 30       # max age of a merged chunk frame; 0 sends every frame as-is
+WS_COALESCE_MAX_BYTES = 4096       # send a merged chunk frame once its content reaches this size
+WS_COALESCE_MAX_QUEUE = 256        # frames queued per connection before senders wait for the socket
+
+# Token budgets per prompt section (layers/context_budget.py); a layer's
+# model config "context_budget" overrides them. Histories keep the newest
+# entries that fit, longer texts are cut in the middle
+CONTEXT_BUDGETS = {
+    "internal": {
+        "user": 4000,              # the user's message
+        "s_loud": 1500,            # S_loud impulses delivered with the call
+        "id_quiet_history": 3000,
+    },
+    "subconscious": {
+        "persona": 12000,
+        "input": 2000,             # each of ED_user, ED_agent, ID_loud, ID_quiet
+        "s_quiet_history": 3000,
+        "s_loud_history": 2000,
+    },
+}
+
+# Prefix-stable prompt layout (model config "prompt_layout": "prefix_stable")
+PREFIX_STABLE_MAX_TURNS = 10       # earlier calls replayed as turns; halved once exceeded
+
+# Message history pagination (REST and WebSocket load_history)
+HISTORY_PAGE_SIZE = 100
+HISTORY_PAGE_MAX = 500
+
+# Session list pagination
+SESSION_LIST_PAGE_SIZE = 50
+SESSION_LIST_PAGE_MAX = 200
+
 # S_loud batching constants
 S_LOUD_BATCH_DELAY = 5.0   # seconds to wait before draining queue
 S_LOUD_BATCH_MAX = 5        # max queued S_loud before forced drain
+S_LOUD_PREEMPT = True       # a user message cancels an in-flight S_loud generation; its entries join the user turn
 
 INTERNAL_DIALOG_SYSTEM_PROMPT = """\
 You are a process that thinks and converses with a human.
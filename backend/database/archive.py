@@ -0,0 +1,290 @@
+from __future__ import annotations
+import asyncio
+import gzip
+import json
+import logging
+from pathlib import Path
+from typing import Callable
+
+from config import ARCHIVE_DIR, ARCHIVE_IDLE_DAYS, ARCHIVE_SWEEP_INTERVAL, INCREMENTAL_VACUUM_PAGES
+from database import repository as db
+
+logger = logging.getLogger("agentcsd.db.archive")
+
+# Hot tables holding per-session rows, in restore order
+ARCHIVED_TABLES = ("messages", "mood_and_criteria", "context_summaries", "orchestrator_checkpoints")
+_PAGE_SIZE = 1000
+
+
+def archive_path(session_id: str) -> Path:
+    return ARCHIVE_DIR / f"{session_id}.ndjson.gz"
+
+
+def is_archived_on_disk(session_id: str) -> bool:
+    return archive_path(session_id).exists()
+
+
+def delete_archive(session_id: str):
+    archive_path(session_id).unlink(missing_ok=True)
+
+
+def _write_lines(f, lines: list[dict]):
+    f.write("".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines).encode("utf-8"))
+
+
+def _row_key(table: str) -> str:
+    return "rowid" if table == "orchestrator_checkpoints" else "id"
+
+
+async def _max_key(conn, table: str, session_id: str) -> int:
+    key = _row_key(table)
+    cursor = await conn.execute(
+        f"SELECT coalesce(max({key}), -1) FROM {table} WHERE session_id = ?", (session_id,))
+    (upper,) = await cursor.fetchone()
+    return upper
+
+
+async def _iter_rows(table: str, session_id: str, upper: int | None = None):
+    """Yield a session's rows from a hot table in pages, so memory stays
+    bounded; only rows keyed up to ``upper`` when it is given."""
+    key = _row_key(table)
+    last = -1
+    bound = f" AND {key} <= {int(upper)}" if upper is not None else ""
+    pool = await db.get_pool()
+    while True:
+        async with pool.reader() as conn:
+            cursor = await conn.execute(
+                f"SELECT {key} AS _key, * FROM {table} WHERE session_id = ? AND {key} > ?{bound} "
+                f"ORDER BY {key} LIMIT ?",
+                (session_id, last, _PAGE_SIZE),
+            )
+            rows = await cursor.fetchall()
+        if not rows:
+            return
+        last = rows[-1]["_key"]
+        page = []
+        for r in rows:
+            d = dict(r)
+            d.pop("_key")
+            page.append(d)
+        yield page
+        if len(rows) < _PAGE_SIZE:
+            return
+
+
+class SessionBusyError(RuntimeError):
+    """The session was resumed or written to while it was being archived."""
+
+
+async def archive_session(session_id: str,
+                          is_active: Callable[[str], bool] = lambda _: False) -> Path:
+    """Move a session's hot rows into a compressed NDJSON archive file.
+
+    The sessions row stays behind with status 'archived', so the session is
+    still listed and can be restored on demand. Rows are dumped up to each
+    table's max id at the start; if the session is resumed (``is_active``)
+    or gets newer rows before the delete, nothing is deleted and
+    SessionBusyError is raised.
+    """
+    session = await db.get_session(session_id)
+    if not session:
+        raise ValueError(f"Session not found: {session_id}")
+    if session["status"] == "archived":
+        return archive_path(session_id)
+
+    await db.flush_writes()
+    pool = await db.get_pool()
+    async with pool.reader() as conn:
+        upper = {table: await _max_key(conn, table, session_id) for table in ARCHIVED_TABLES}
+    path = archive_path(session_id)
+    tmp = path.with_suffix(".tmp")
+    f = await asyncio.to_thread(gzip.open, tmp, "wb")
+    counts = {}
+    committed = False
+    try:
+        try:
+            await asyncio.to_thread(_write_lines, f, [{"table": "sessions", "row": session}])
+            for table in ARCHIVED_TABLES:
+                counts[table] = 0
+                async for page in _iter_rows(table, session_id, upper[table]):
+                    counts[table] += len(page)
+                    await asyncio.to_thread(_write_lines, f, [{"table": table, "row": r} for r in page])
+        finally:
+            await asyncio.to_thread(f.close)
+
+        async with pool.writer() as conn:
+            # Re-checked under the writer: nothing can be written in between
+            cursor = await conn.execute(
+                "SELECT status, updated_at FROM sessions WHERE id = ?", (session_id,))
+            current = await cursor.fetchone()
+            changed = current is None or (current["status"], current["updated_at"]) \
+                != (session["status"], session["updated_at"])
+            for table in ARCHIVED_TABLES:
+                if changed:
+                    break
+                changed = await _max_key(conn, table, session_id) != upper[table]
+            if changed or is_active(session_id):
+                raise SessionBusyError(f"Session {session_id} changed while being archived")
+            for table in reversed(ARCHIVED_TABLES):
+                await conn.execute(
+                    f"DELETE FROM {table} WHERE session_id = ? AND {_row_key(table)} <= ?",
+                    (session_id, upper[table]),
+                )
+            await conn.execute(
+                "UPDATE sessions SET status = 'archived', updated_at = datetime('now') WHERE id = ?",
+                (session_id,),
+            )
+            tmp.replace(path)
+            await conn.commit()
+            committed = True
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        if not committed:
+            path.unlink(missing_ok=True)
+        raise
+
+    logger.info("Archived session %s to %s (%s)", session_id, path.name, counts)
+    return path
+
+
+def _read_lines(f, count: int) -> list[dict]:
+    lines = []
+    while len(lines) < count:
+        line = f.readline()
+        if not line:
+            break
+        if line.strip():
+            lines.append(json.loads(line))
+    return lines
+
+
+async def _insert_rows(conn, table: str, rows: list[dict]):
+    # Original ids are kept, so history cursors stay valid
+    columns = list(rows[0].keys())
+    placeholders = ", ".join("?" for _ in columns)
+    await conn.executemany(
+        f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+        [tuple(r[c] for c in columns) for r in rows],
+    )
+
+
+async def restore_session(session_id: str) -> bool:
+    """Load an archived session back into the hot tables. Returns False if not archived.
+
+    The archive is read and inserted a page at a time, in one transaction.
+    """
+    path = archive_path(session_id)
+    if not path.exists():
+        return False
+
+    f = await asyncio.to_thread(gzip.open, path, "rt", encoding="utf-8")
+    pool = await db.get_pool()
+    try:
+        async with pool.writer() as conn:
+            # The stats row outlived archival; keep it as is rather than letting
+            # the insert triggers count the restored rows a second time
+            cursor = await conn.execute("SELECT * FROM session_stats WHERE session_id = ?", (session_id,))
+            stats = await cursor.fetchone()
+            while lines := await asyncio.to_thread(_read_lines, f, _PAGE_SIZE):
+                # Lines are grouped by table; each run goes in as one executemany
+                start = 0
+                for i in range(1, len(lines) + 1):
+                    if i == len(lines) or lines[i]["table"] != lines[start]["table"]:
+                        table = lines[start]["table"]
+                        if table in ARCHIVED_TABLES:
+                            await _insert_rows(conn, table, [line["row"] for line in lines[start:i]])
+                        start = i
+            if stats is not None:
+                stats = dict(stats)
+                await conn.execute(
+                    f"INSERT OR REPLACE INTO session_stats ({', '.join(stats)}) "
+                    f"VALUES ({', '.join('?' for _ in stats)})",
+                    tuple(stats.values()),
+                )
+            await conn.execute(
+                "UPDATE sessions SET status = 'paused', updated_at = datetime('now') WHERE id = ?",
+                (session_id,),
+            )
+            await conn.commit()
+    finally:
+        await asyncio.to_thread(f.close)
+
+    path.unlink()
+    logger.info("Restored session %s from archive", session_id)
+    return True
+
+
+async def find_idle_sessions(days: int = ARCHIVE_IDLE_DAYS) -> list[str]:
+    """Sessions with no update and no new message for ``days`` days."""
+    cutoff = f"-{int(days)} days"
+    pool = await db.get_pool()
+    async with pool.reader() as conn:
+        cursor = await conn.execute(
+            "SELECT s.id FROM sessions s LEFT JOIN session_stats st ON st.session_id = s.id "
+            "WHERE s.status != 'archived' AND s.updated_at < datetime('now', ?) "
+            "AND coalesce(st.last_activity, '') < datetime('now', ?)",
+            (cutoff, cutoff),
+        )
+        rows = await cursor.fetchall()
+    return [r["id"] for r in rows]
+
+
+async def incremental_vacuum(pages: int = INCREMENTAL_VACUUM_PAGES) -> int:
+    """Return free pages to the filesystem a chunk at a time.
+
+    The writer is released between chunks so foreground writes are never
+    stuck behind one long vacuum. Returns the number of pages released.
+    """
+    pool = await db.get_pool()
+    released = 0
+    while True:
+        async with pool.writer() as conn:
+            cursor = await conn.execute("PRAGMA freelist_count")
+            (free,) = await cursor.fetchone()
+            if free == 0:
+                return released
+            # executescript steps the pragma to completion; execute() would
+            # stop after the first step and free a single page
+            await conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+            cursor = await conn.execute("PRAGMA freelist_count")
+            (left,) = await cursor.fetchone()
+        if left >= free:
+            return released
+        released += free - left
+        await asyncio.sleep(0)
+
+
+async def archive_idle_sessions(is_active: Callable[[str], bool] = lambda _: False,
+                                days: int = ARCHIVE_IDLE_DAYS) -> list[str]:
+    archived = []
+    for session_id in await find_idle_sessions(days):
+        if is_active(session_id):
+            continue
+        try:
+            await archive_session(session_id, is_active)
+            archived.append(session_id)
+        except SessionBusyError as e:
+            logger.info("Skipped archiving: %s", e)
+        except Exception as e:
+            logger.error("Failed to archive session %s: %s", session_id, e, exc_info=True)
+    return archived
+
+
+async def archive_loop(is_active: Callable[[str], bool] = lambda _: False,
+                       interval: float = ARCHIVE_SWEEP_INTERVAL):
+    """Background sweep: archive idle sessions, then vacuum the freed pages."""
+    while True:
+        try:
+            archived = await archive_idle_sessions(is_active)
+            released = await incremental_vacuum()
+            if archived or released:
+                logger.info("Archive sweep: %d sessions archived, %d pages released",
+                            len(archived), released)
+        except asyncio.CancelledError:
+            break
+        except Exception as e:
+            logger.error("Archive sweep error: %s", e, exc_info=True)
+        try:
+            await asyncio.sleep(interval)
+        except asyncio.CancelledError:
+            break
@@ -0,0 +1,33 @@
+from __future__ import annotations
+import json
+import sqlite3
+from pathlib import Path
+from typing import Iterator
+
+from database.archive import ARCHIVED_TABLES
+
+_FETCH_SIZE = 500
+
+
+def iter_table_ndjson(db_path: Path, table: str, session_id: str) -> Iterator[bytes]:
+    """A session's rows from one table as NDJSON chunks, for export threads.
+
+    Uses its own blocking read-only connection, so it is meant to run off the
+    event loop and never competes with the async pool for a reader.
+    """
+    if table not in ARCHIVED_TABLES and table != "sessions":
+        raise ValueError(f"Table not exportable: {table}")
+    key = "id" if table == "sessions" else "session_id"
+    conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        cursor = conn.execute(f"SELECT * FROM {table} WHERE {key} = ? ORDER BY rowid", (session_id,))
+        while True:
+            rows = cursor.fetchmany(_FETCH_SIZE)
+            if not rows:
+                return
+            yield "".join(
+                json.dumps(dict(r), ensure_ascii=False) + "\n" for r in rows
+            ).encode("utf-8")
+    finally:
+        conn.close()
@@ -0,0 +1,132 @@
+from __future__ import annotations
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator
+
+import aiosqlite
+
+
+class ConnectionPool:
+    """Long-lived SQLite connections: one writer plus a pool of read-only readers.
+
+    SQLite allows a single writer at a time, so every write goes through the
+    dedicated writer connection under a lock. Reads run concurrently on
+    read-only connections, which WAL mode lets proceed alongside the writer.
+    """
+
+    def __init__(self, db_path: Path | str, readers: int = 4,
+                 busy_timeout_ms: int = 5000):
+        self.db_path = Path(db_path)
+        self.size = max(1, readers)
+        self.busy_timeout_ms = busy_timeout_ms
+
+        self._writer: aiosqlite.Connection | None = None
+        self._writer_lock = asyncio.Lock()
+        self._readers: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+        self._all_readers: list[aiosqlite.Connection] = []
+        self._closed = True
+
+        # Stats
+        self._reads = 0
+        self._writes = 0
+        self._read_wait = 0.0
+        self._write_wait = 0.0
+        self._max_read_wait = 0.0
+        self._max_write_wait = 0.0
+        self._opened_at: float | None = None
+
+    @property
+    def is_open(self) -> bool:
+        return not self._closed
+
+    async def open(self):
+        if not self._closed:
+            return
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # The writer goes first: it switches the file to WAL, which the
+        # read-only connections need in order to open alongside it.
+        writer = await aiosqlite.connect(str(self.db_path))
+        writer.row_factory = aiosqlite.Row
+        await writer.execute("PRAGMA journal_mode=WAL")
+        await writer.execute("PRAGMA foreign_keys=ON")
+        await writer.execute("PRAGMA synchronous=NORMAL")
+        await writer.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+        self._writer = writer
+
+        uri = f"{self.db_path.resolve().as_uri()}?mode=ro"
+        for _ in range(self.size):
+            reader = await aiosqlite.connect(uri, uri=True)
+            reader.row_factory = aiosqlite.Row
+            await reader.execute("PRAGMA query_only=ON")
+            await reader.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+            self._all_readers.append(reader)
+            self._readers.put_nowait(reader)
+
+        self._closed = False
+        self._opened_at = time.monotonic()
+
+    async def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        async with self._writer_lock:
+            for reader in self._all_readers:
+                await reader.close()
+            self._all_readers.clear()
+            self._readers = asyncio.Queue()
+            if self._writer is not None:
+                await self._writer.close()
+                self._writer = None
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Borrow a read-only connection for the duration of the block."""
+        start = time.monotonic()
+        conn = await self._readers.get()
+        waited = time.monotonic() - start
+        self._reads += 1
+        self._read_wait += waited
+        self._max_read_wait = max(self._max_read_wait, waited)
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Hold the writer connection exclusively for the duration of the block.
+
+        The block is responsible for committing; anything left uncommitted
+        is rolled back when the block raises.
+        """
+        start = time.monotonic()
+        async with self._writer_lock:
+            waited = time.monotonic() - start
+            self._writes += 1
+            self._write_wait += waited
+            self._max_write_wait = max(self._max_write_wait, waited)
+            try:
+                yield self._writer
+            except BaseException:
+                if self._writer is not None and self._writer.in_transaction:
+                    await self._writer.rollback()
+                raise
+
+    def stats(self) -> dict:
+        return {
+            "db_path": str(self.db_path),
+            "open": not self._closed,
+            "readers": self.size,
+            "readers_idle": self._readers.qsize(),
+            "writer_busy": self._writer_lock.locked(),
+            "reads": self._reads,
+            "writes": self._writes,
+            "avg_read_wait_ms": round(self._read_wait / self._reads * 1000, 3) if self._reads else 0.0,
+            "avg_write_wait_ms": round(self._write_wait / self._writes * 1000, 3) if self._writes else 0.0,
+            "max_read_wait_ms": round(self._max_read_wait * 1000, 3),
+            "max_write_wait_ms": round(self._max_write_wait * 1000, 3),
+            "uptime_s": round(time.monotonic() - self._opened_at, 1) if self._opened_at else 0.0,
+        }
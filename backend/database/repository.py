@@ -1,195 +1,534 @@
 from __future__ import annotations
+import asyncio
 import json
-import aiosqlite
-from config import DB_PATH
-from database.schema import SCHEMA_SQL
+import logging
+from pathlib import Path
+from config import (
+    DB_PATH, DB_READER_POOL_SIZE, DB_BUSY_TIMEOUT_MS,
+    WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_MAX_LATENCY, WRITE_BEHIND_MAX_PENDING, DB_DURABILITY,
+    DB_CONVERT_INCREMENTAL_VACUUM,
+    SESSION_LIST_PAGE_SIZE,
+)
+from database.pool import ConnectionPool
+from database.schema import SCHEMA_SQL, MIGRATIONS
+from database.writer import WriteBehindQueue
 
+_pool: ConnectionPool | None = None
+_pool_lock = asyncio.Lock()
+_writer: WriteBehindQueue | None = None
 
-async def get_db() -> aiosqlite.Connection:
-    db = await aiosqlite.connect(str(DB_PATH))
-    db.row_factory = aiosqlite.Row
-    await db.execute("PRAGMA journal_mode=WAL")
-    await db.execute("PRAGMA foreign_keys=ON")
-    return db
+logger = logging.getLogger("agentcsd.db")
 
 
-async def init_db():
-    db = await get_db()
+async def init_db(db_path: Path | str = DB_PATH,
+                  readers: int = DB_READER_POOL_SIZE) -> ConnectionPool:
+    """Open the process-wide connection pool and apply the schema."""
+    global _pool
+    async with _pool_lock:
+        if _pool is not None and _pool.is_open:
+            return _pool
+        pool = ConnectionPool(db_path, readers=readers,
+                              busy_timeout_ms=DB_BUSY_TIMEOUT_MS)
+        await pool.open()
+        async with pool.writer() as db:
+            await _ensure_incremental_vacuum(db)
+            await db.executescript(SCHEMA_SQL)
+            if DB_DURABILITY == "cycle":
+                await db.execute("PRAGMA synchronous=FULL")
+            await db.commit()
+            await _migrate(db)
+        _pool = pool
+        return pool
+
+
+async def _ensure_incremental_vacuum(db, convert: bool = DB_CONVERT_INCREMENTAL_VACUUM):
+    """Switch the file to auto_vacuum=INCREMENTAL so archival can hand pages back.
+
+    Once the file has a header (WAL mode already wrote one) the mode change
+    only takes effect after a one-off VACUUM. That is instant on a new file;
+    an existing database is only converted when ``convert`` is set, since
+    the VACUUM rewrites the whole file.
+    """
+    cursor = await db.execute("PRAGMA auto_vacuum")
+    (mode,) = await cursor.fetchone()
+    if mode == 2:
+        return
+    cursor = await db.execute("SELECT count(*) FROM sqlite_master")
+    (objects,) = await cursor.fetchone()
+    if objects and not convert:
+        logger.info("Database is not in incremental auto-vacuum mode, so archived sessions "
+                    "do not free disk space. Convert it offline with "
+                    "`python main.py --convert-incremental-vacuum` (rewrites the file, "
+                    "needs about twice its size free).")
+        return
+    logger.info("Converting database to incremental auto-vacuum (one-off VACUUM)...")
+    await db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    await db.execute("VACUUM")
+
+
+async def convert_incremental_vacuum(db_path: Path | str = DB_PATH):
+    """Offline conversion of an existing database to incremental auto-vacuum."""
+    pool = ConnectionPool(db_path, readers=1, busy_timeout_ms=DB_BUSY_TIMEOUT_MS)
+    await pool.open()
     try:
-        await db.executescript(SCHEMA_SQL)
-        await db.commit()
+        async with pool.writer() as db:
+            await _ensure_incremental_vacuum(db, convert=True)
     finally:
-        await db.close()
+        await pool.close()
+
+
+async def _migrate(db):
+    cursor = await db.execute("PRAGMA user_version")
+    (version,) = await cursor.fetchone()
+    for target in range(version + 1, len(MIGRATIONS) + 1):
+        logger.info("Applying database migration %d", target)
+        await db.executescript(
+            f"BEGIN;\n{MIGRATIONS[target - 1]}\nPRAGMA user_version={target};\nCOMMIT;"
+        )
+
+
+async def close_db():
+    """Flush queued writes, then close every pooled connection."""
+    global _pool
+    if _writer is not None:
+        await _writer.stop()
+    async with _pool_lock:
+        if _pool is not None:
+            await _pool.close()
+            _pool = None
+
+
+async def get_pool() -> ConnectionPool:
+    """Return the open pool, opening it lazily for callers outside the app lifespan."""
+    if _pool is not None and _pool.is_open:
+        return _pool
+    return await init_db()
+
+
+def pool_stats() -> dict:
+    if _pool is None:
+        return {"open": False}
+    return _pool.stats()
+
+
+# --- Write-behind persistence ---
+
+def _get_writer() -> WriteBehindQueue:
+    global _writer
+    if _writer is None:
+        _writer = WriteBehindQueue(
+            get_pool,
+            batch_size=WRITE_BEHIND_BATCH_SIZE,
+            max_latency=WRITE_BEHIND_MAX_LATENCY,
+            durability=DB_DURABILITY,
+            max_pending=WRITE_BEHIND_MAX_PENDING,
+        )
+    return _writer
+
+
+async def flush_writes():
+    """Wait until every queued record has been committed."""
+    if _writer is not None:
+        await _writer.flush()
+
+
+async def end_cycle():
+    """Mark a cycle boundary; waits for the commit only in "cycle" durability mode."""
+    if _writer is not None:
+        await _writer.end_cycle()
+
+
+def writer_stats() -> dict:
+    return _get_writer().stats()
+
+
+async def queue_unit(records: list[tuple[str, tuple]]):
+    """Queue records built with the *_record helpers to commit in one
+    transaction; waits only while the write-behind queue is full."""
+    await _get_writer().put_unit(records)
+
+
+def queue_unit_nowait(records: list[tuple[str, tuple]]):
+    """queue_unit() for callers that cannot wait; raises asyncio.QueueFull
+    when the write-behind queue is full."""
+    _get_writer().enqueue_unit(records)
+
+
+def message_record(session_id: str, layer: str, tag: str, content: str,
+                   cycle_number: int | None = None) -> tuple[str, tuple]:
+    return ("message", (session_id, layer, tag, content, cycle_number))
+
+
+def mood_and_criteria_record(session_id: str, mood: str, criteria: str,
+                             cycle_number: int) -> tuple[str, tuple]:
+    return ("mood_and_criteria", (session_id, mood, criteria, cycle_number))
+
+
+def context_summary_record(session_id: str, layer: str, summary: str,
+                           cycle_from: int, cycle_to: int) -> tuple[str, tuple]:
+    return ("context_summary", (session_id, layer, summary, cycle_from, cycle_to))
+
+
+def checkpoint_record(session_id: str, cycle: int, state: dict) -> tuple[str, tuple]:
+    return ("checkpoint", (session_id, cycle, json.dumps(state, ensure_ascii=False)))
+
+
+_LLM_CALL_COLUMNS = (
+    "session_id", "layer", "purpose", "cycle_number", "backend", "model",
+    "streamed", "status", "error", "queue_ms", "ttft_ms", "latency_ms",
+    "input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens",
+    "tokens_estimated", "cost_usd", "stopped_early", "wasted_tokens",
+)
+
+
+def llm_call_record(call: dict) -> tuple[str, tuple]:
+    """Record for one llm_calls row; ``call`` is keyed by column name."""
+    return ("llm_call", tuple(call.get(column) for column in _LLM_CALL_COLUMNS))
 
 
 # --- Sessions ---
 
 async def create_session(session_id: str, name: str, persona_core_path: str,
                          model_config: dict, summary_frequency: int = 10) -> dict:
-    db = await get_db()
-    try:
+    pool = await get_pool()
+    async with pool.writer() as db:
         await db.execute(
             "INSERT INTO sessions (id, name, persona_core_path, model_config, summary_frequency) VALUES (?, ?, ?, ?, ?)",
             (session_id, name, persona_core_path, json.dumps(model_config), summary_frequency),
         )
         await db.commit()
-        return await get_session(session_id)
-    finally:
-        await db.close()
+    return await get_session(session_id)
 
 
 async def get_session(session_id: str) -> dict | None:
-    db = await get_db()
-    try:
+    pool = await get_pool()
+    async with pool.reader() as db:
         cursor = await db.execute("SELECT * FROM sessions WHERE id = ?", (session_id,))
         row = await cursor.fetchone()
-        if row is None:
-            return None
-        d = dict(row)
-        d["model_config"] = json.loads(d["model_config"])
-        return d
-    finally:
-        await db.close()
+    if row is None:
+        return None
+    d = dict(row)
+    d["model_config"] = json.loads(d["model_config"])
+    return d
 
 
-async def list_sessions() -> list[dict]:
-    db = await get_db()
-    try:
-        cursor = await db.execute("SELECT * FROM sessions ORDER BY updated_at DESC")
+# Sortable session-list columns and the (indexed) ORDER BY each one uses
+SESSION_SORT_COLUMNS = {
+    "updated_at": "s.updated_at {dir}, s.id {dir}",
+    "created_at": "s.created_at {dir}, s.id {dir}",
+    "name": "s.name {dir}, s.id {dir}",
+    "last_activity": "st.last_activity {dir}, st.session_id {dir}",
+    "message_count": "st.message_count {dir}, st.session_id {dir}",
+    "last_cycle": "st.last_cycle {dir}, st.session_id {dir}",
+}
+
+
+async def list_sessions(limit: int = SESSION_LIST_PAGE_SIZE, offset: int = 0, sort: str = "updated_at",
+                        order: str = "desc", status: str | None = None) -> list[dict]:
+    """One page of sessions joined with their materialized stats."""
+    if sort not in SESSION_SORT_COLUMNS:
+        raise ValueError(f"Unknown sort column: {sort}")
+    direction = "ASC" if order.lower() == "asc" else "DESC"
+    where = ""
+    params: list = []
+    if status:
+        where = "WHERE s.status = ?"
+        params.append(status)
+    params += [limit, offset]
+    pool = await get_pool()
+    async with pool.reader() as db:
+        cursor = await db.execute(
+            "SELECT s.*, st.message_count, st.external_count, st.internal_count, "
+            "st.subconscious_count, st.last_cycle, st.last_mood, st.last_activity "
+            "FROM sessions s JOIN session_stats st ON st.session_id = s.id "
+            f"{where} ORDER BY {SESSION_SORT_COLUMNS[sort].format(dir=direction)} "
+            "LIMIT ? OFFSET ?",
+            params,
+        )
         rows = await cursor.fetchall()
-        result = []
-        for row in rows:
-            d = dict(row)
-            d["model_config"] = json.loads(d["model_config"])
-            result.append(d)
-        return result
-    finally:
-        await db.close()
+    result = []
+    for row in rows:
+        d = dict(row)
+        d["model_config"] = json.loads(d["model_config"])
+        result.append(d)
+    return result
 
 
 async def update_session(session_id: str, **kwargs) -> dict | None:
-    db = await get_db()
-    try:
-        sets = []
-        vals = []
-        for k, v in kwargs.items():
-            if k == "model_config":
-                v = json.dumps(v)
-            sets.append(f"{k} = ?")
-            vals.append(v)
-        sets.append("updated_at = datetime('now')")
-        vals.append(session_id)
+    sets = []
+    vals = []
+    for k, v in kwargs.items():
+        if k == "model_config":
+            v = json.dumps(v)
+        sets.append(f"{k} = ?")
+        vals.append(v)
+    sets.append("updated_at = datetime('now')")
+    vals.append(session_id)
+    pool = await get_pool()
+    async with pool.writer() as db:
         await db.execute(
             f"UPDATE sessions SET {', '.join(sets)} WHERE id = ?", vals
         )
         await db.commit()
-        return await get_session(session_id)
-    finally:
-        await db.close()
+    return await get_session(session_id)
 
 
 async def delete_session(session_id: str):
-    db = await get_db()
-    try:
+    await flush_writes()
+    pool = await get_pool()
+    async with pool.writer() as db:
         await db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
         await db.execute("DELETE FROM mood_and_criteria WHERE session_id = ?", (session_id,))
         await db.execute("DELETE FROM context_summaries WHERE session_id = ?", (session_id,))
+        await db.execute("DELETE FROM orchestrator_checkpoints WHERE session_id = ?", (session_id,))
+        await db.execute("DELETE FROM session_stats WHERE session_id = ?", (session_id,))
+        await db.execute("DELETE FROM llm_calls WHERE session_id = ?", (session_id,))
         await db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
         await db.commit()
-    finally:
-        await db.close()
 
 
 # --- Messages ---
 
-async def save_message(session_id: str, layer: str, tag: str, content: str,
-                       cycle_number: int | None = None) -> int:
-    db = await get_db()
-    try:
-        cursor = await db.execute(
-            "INSERT INTO messages (session_id, layer, tag, content, cycle_number) VALUES (?, ?, ?, ?, ?)",
-            (session_id, layer, tag, content, cycle_number),
-        )
-        await db.commit()
-        return cursor.lastrowid
-    finally:
-        await db.close()
-
-
 async def get_messages(session_id: str, layer: str | None = None,
                        tag: str | None = None, limit: int = 100) -> list[dict]:
-    db = await get_db()
-    try:
-        query = "SELECT * FROM messages WHERE session_id = ?"
-        params: list = [session_id]
-        if layer:
-            query += " AND layer = ?"
-            params.append(layer)
-        if tag:
-            query += " AND tag = ?"
-            params.append(tag)
-        query += " ORDER BY created_at DESC LIMIT ?"
-        params.append(limit)
+    query = "SELECT * FROM messages WHERE session_id = ?"
+    params: list = [session_id]
+    if layer:
+        query += " AND layer = ?"
+        params.append(layer)
+    if tag:
+        query += " AND tag = ?"
+        params.append(tag)
+    query += " ORDER BY id DESC LIMIT ?"
+    params.append(limit)
+    pool = await get_pool()
+    async with pool.reader() as db:
         cursor = await db.execute(query, params)
         rows = await cursor.fetchall()
-        return [dict(r) for r in reversed(rows)]
-    finally:
-        await db.close()
+    return [dict(r) for r in reversed(rows)]
 
 
-# --- Mood and Criteria ---
+async def get_messages_page(session_id: str, before_id: int | None = None,
+                            after_id: int | None = None, limit: int = 100,
+                            layer: str | None = None, tag: str | None = None,
+                            cycle_from: int | None = None,
+                            cycle_to: int | None = None) -> dict:
+    """Keyset-paginated message history ordered by the monotonic message id.
 
-async def save_mood_and_criteria(session_id: str, mood: str, criteria: str,
-                                 cycle_number: int) -> int:
-    db = await get_db()
-    try:
-        cursor = await db.execute(
-            "INSERT INTO mood_and_criteria (session_id, mood, criteria, cycle_number) VALUES (?, ?, ?, ?)",
-            (session_id, mood, criteria, cycle_number),
-        )
-        await db.commit()
-        return cursor.lastrowid
-    finally:
-        await db.close()
+    Without cursors the newest ``limit`` messages are returned. ``before_id``
+    pages backwards (older messages), ``after_id`` pages forwards. Messages
+    are always returned in ascending id order; ``next_before``/``next_after``
+    are the cursors for the adjacent pages, None when there is nothing more.
+    """
+    query = "SELECT * FROM messages WHERE session_id = ?"
+    params: list = [session_id]
+    if layer:
+        query += " AND layer = ?"
+        params.append(layer)
+    if tag:
+        query += " AND tag = ?"
+        params.append(tag)
+    if cycle_from is not None:
+        query += " AND cycle_number >= ?"
+        params.append(cycle_from)
+    if cycle_to is not None:
+        query += " AND cycle_number <= ?"
+        params.append(cycle_to)
+
+    forward = after_id is not None and before_id is None
+    if before_id is not None:
+        query += " AND id < ?"
+        params.append(before_id)
+    if after_id is not None:
+        query += " AND id > ?"
+        params.append(after_id)
+    query += " ORDER BY id ASC LIMIT ?" if forward else " ORDER BY id DESC LIMIT ?"
+    # One extra row tells us whether another page exists
+    params.append(limit + 1)
+
+    pool = await get_pool()
+    async with pool.reader() as db:
+        cursor = await db.execute(query, params)
+        rows = await cursor.fetchall()
+
+    has_more = len(rows) > limit
+    messages = [dict(r) for r in rows[:limit]]
+    if not forward:
+        messages.reverse()
+
+    next_before = next_after = None
+    if messages:
+        if forward:
+            next_after = messages[-1]["id"] if has_more else None
+            next_before = messages[0]["id"]
+        else:
+            next_before = messages[0]["id"] if has_more else None
+            next_after = messages[-1]["id"] if before_id is not None else None
+    return {
+        "messages": messages,
+        "next_before": next_before,
+        "next_after": next_after,
+        "has_more": has_more,
+    }
 
 
+# --- Mood and Criteria ---
+
 async def get_latest_mood_and_criteria(session_id: str) -> dict | None:
-    db = await get_db()
-    try:
+    pool = await get_pool()
+    async with pool.reader() as db:
         cursor = await db.execute(
             "SELECT * FROM mood_and_criteria WHERE session_id = ? ORDER BY created_at DESC LIMIT 1",
             (session_id,),
         )
         row = await cursor.fetchone()
-        return dict(row) if row else None
-    finally:
-        await db.close()
+    return dict(row) if row else None
 
 
 # --- Context Summaries ---
 
-async def save_context_summary(session_id: str, layer: str, summary: str,
-                               cycle_from: int, cycle_to: int) -> int:
-    db = await get_db()
-    try:
+async def get_context_summaries(session_id: str, layer: str) -> list[dict]:
+    pool = await get_pool()
+    async with pool.reader() as db:
         cursor = await db.execute(
-            "INSERT INTO context_summaries (session_id, layer, summary, cycle_from, cycle_to) VALUES (?, ?, ?, ?, ?)",
-            (session_id, layer, summary, cycle_from, cycle_to),
+            "SELECT * FROM context_summaries WHERE session_id = ? AND layer = ? ORDER BY cycle_from",
+            (session_id, layer),
         )
-        await db.commit()
-        return cursor.lastrowid
-    finally:
-        await db.close()
+        rows = await cursor.fetchall()
+    return [dict(r) for r in rows]
 
 
-async def get_context_summaries(session_id: str, layer: str) -> list[dict]:
-    db = await get_db()
-    try:
+# --- Checkpoints ---
+
+async def get_checkpoint(session_id: str) -> dict | None:
+    pool = await get_pool()
+    async with pool.reader() as db:
         cursor = await db.execute(
-            "SELECT * FROM context_summaries WHERE session_id = ? AND layer = ? ORDER BY cycle_from",
-            (session_id, layer),
+            "SELECT * FROM orchestrator_checkpoints WHERE session_id = ?", (session_id,),
         )
+        row = await cursor.fetchone()
+    if row is None:
+        return None
+    d = dict(row)
+    d["state"] = json.loads(d["state"])
+    return d
+
+
+# --- LLM telemetry ---
+
+async def get_llm_calls(since_seconds: int, session_id: str | None = None,
+                        limit: int = 100000) -> list[dict]:
+    """Newest llm_calls rows from the last ``since_seconds``, at most ``limit``."""
+    sql = "SELECT * FROM llm_calls WHERE created_at >= datetime('now', ?)"
+    params: list = [f"-{int(since_seconds)} seconds"]
+    if session_id:
+        sql += " AND session_id = ?"
+        params.append(session_id)
+    sql += " ORDER BY id DESC LIMIT ?"
+    params.append(limit)
+    pool = await get_pool()
+    async with pool.reader() as db:
+        cursor = await db.execute(sql, params)
         rows = await cursor.fetchall()
-        return [dict(r) for r in rows]
-    finally:
-        await db.close()
+    return [dict(r) for r in rows]
+
+
+# --- Search ---
+
+def _fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query: every term must match, each quoted
+    so punctuation can't be parsed as query syntax. A trailing * keeps prefix search."""
+    terms = []
+    for raw in text.split():
+        prefix = raw.endswith("*")
+        term = raw.rstrip("*").replace('"', '""')
+        if term:
+            terms.append(f'"{term}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+async def search(query: str, session_id: str | None = None,
+                 layer: str | None = None, tag: str | None = None,
+                 cycle_from: int | None = None, cycle_to: int | None = None,
+                 source: str = "all", limit: int = 20, offset: int = 0) -> dict:
+    """Ranked full-text search over messages and context summaries.
+
+    ``source`` is "messages", "summaries" or "all". Summaries have no tag, so
+    a tag filter restricts results to messages; a cycle range matches the
+    summaries whose cycle span overlaps it.
+    """
+    match = _fts_query(query)
+    if not match:
+        return {"results": [], "has_more": False, "limit": limit, "offset": offset}
+
+    parts: list[str] = []
+    params: list = []
+
+    if source in ("all", "messages"):
+        sql = (
+            "SELECT 'message' AS source, m.id, m.session_id, m.layer, m.tag, "
+            "m.cycle_number AS cycle_from, m.cycle_number AS cycle_to, m.created_at, "
+            "snippet(messages_fts, 0, '<mark>', '</mark>', '…', 16) AS snippet, "
+            "bm25(messages_fts) AS rank "
+            "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+            "WHERE messages_fts MATCH ?"
+        )
+        params.append(match)
+        if session_id:
+            sql += " AND m.session_id = ?"
+            params.append(session_id)
+        if layer:
+            sql += " AND m.layer = ?"
+            params.append(layer)
+        if tag:
+            sql += " AND m.tag = ?"
+            params.append(tag)
+        if cycle_from is not None:
+            sql += " AND m.cycle_number >= ?"
+            params.append(cycle_from)
+        if cycle_to is not None:
+            sql += " AND m.cycle_number <= ?"
+            params.append(cycle_to)
+        parts.append(sql)
+
+    if source in ("all", "summaries") and not tag:
+        sql = (
+            "SELECT 'summary' AS source, c.id, c.session_id, c.layer, NULL AS tag, "
+            "c.cycle_from, c.cycle_to, c.created_at, "
+            "snippet(summaries_fts, 0, '<mark>', '</mark>', '…', 16) AS snippet, "
+            "bm25(summaries_fts) AS rank "
+            "FROM summaries_fts JOIN context_summaries c ON c.id = summaries_fts.rowid "
+            "WHERE summaries_fts MATCH ?"
+        )
+        params.append(match)
+        if session_id:
+            sql += " AND c.session_id = ?"
+            params.append(session_id)
+        if layer:
+            sql += " AND c.layer = ?"
+            params.append(layer)
+        if cycle_from is not None:
+            sql += " AND c.cycle_to >= ?"
+            params.append(cycle_from)
+        if cycle_to is not None:
+            sql += " AND c.cycle_from <= ?"
+            params.append(cycle_to)
+        parts.append(sql)
+
+    if not parts:
+        return {"results": [], "has_more": False, "limit": limit, "offset": offset}
+
+    query_sql = " UNION ALL ".join(parts) + " ORDER BY rank LIMIT ? OFFSET ?"
+    params.extend([limit + 1, offset])
+
+    pool = await get_pool()
+    async with pool.reader() as db:
+        cursor = await db.execute(query_sql, params)
+        rows = await cursor.fetchall()
+
+    return {
+        "results": [dict(r) for r in rows[:limit]],
+        "has_more": len(rows) > limit,
+        "limit": limit,
+        "offset": offset,
+    }
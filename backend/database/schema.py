@@ -39,6 +39,165 @@ CREATE TABLE IF NOT EXISTS context_summaries (
   created_at TEXT NOT NULL DEFAULT (datetime('now'))
 );
 
-CREATE INDEX IF NOT EXISTS idx_messages_session ON messages(session_id, layer, created_at);
+-- Serialized orchestrator state, rewritten once per cycle in the same
+-- transaction as that cycle's messages so resume is a single key lookup
+CREATE TABLE IF NOT EXISTS orchestrator_checkpoints (
+  session_id TEXT PRIMARY KEY REFERENCES sessions(id),
+  cycle INTEGER NOT NULL,
+  state TEXT NOT NULL,
+  updated_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+
+-- Keyset pagination walks messages by their monotonic id within a session
+DROP INDEX IF EXISTS idx_messages_session;
+CREATE INDEX IF NOT EXISTS idx_messages_session_id ON messages(session_id, id);
+CREATE INDEX IF NOT EXISTS idx_messages_session_layer ON messages(session_id, layer, id);
+CREATE INDEX IF NOT EXISTS idx_messages_session_tag ON messages(session_id, tag, id);
+CREATE INDEX IF NOT EXISTS idx_messages_session_cycle ON messages(session_id, cycle_number, id);
 CREATE INDEX IF NOT EXISTS idx_mc_session ON mood_and_criteria(session_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_cs_session ON context_summaries(session_id, layer, cycle_from);
+CREATE INDEX IF NOT EXISTS idx_sessions_status ON sessions(status, updated_at);
 """
+
+
+# Versioned migrations, applied in order on startup and tracked with
+# PRAGMA user_version (migration N leaves the database at version N).
+MIGRATIONS: list[str] = [
+    # 1: full-text search over messages and context summaries. External-content
+    # FTS5 tables index the base tables without duplicating their text and are
+    # kept in sync by triggers; 'rebuild' backfills existing rows.
+    """\
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+  content, content='messages', content_rowid='id',
+  tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+  INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+  INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF content ON messages BEGIN
+  INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+  INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+END;
+INSERT INTO messages_fts(messages_fts) VALUES ('rebuild');
+
+CREATE VIRTUAL TABLE IF NOT EXISTS summaries_fts USING fts5(
+  summary, content='context_summaries', content_rowid='id',
+  tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS summaries_fts_ai AFTER INSERT ON context_summaries BEGIN
+  INSERT INTO summaries_fts(rowid, summary) VALUES (new.id, new.summary);
+END;
+CREATE TRIGGER IF NOT EXISTS summaries_fts_ad AFTER DELETE ON context_summaries BEGIN
+  INSERT INTO summaries_fts(summaries_fts, rowid, summary) VALUES ('delete', old.id, old.summary);
+END;
+CREATE TRIGGER IF NOT EXISTS summaries_fts_au AFTER UPDATE OF summary ON context_summaries BEGIN
+  INSERT INTO summaries_fts(summaries_fts, rowid, summary) VALUES ('delete', old.id, old.summary);
+  INSERT INTO summaries_fts(rowid, summary) VALUES (new.id, new.summary);
+END;
+INSERT INTO summaries_fts(summaries_fts) VALUES ('rebuild');
+""",
+    # 2: per-session counters for the session list. Triggers keep one row per
+    # session current as messages and moods are inserted, so listing and
+    # sorting sessions never scans messages. Rows survive archival (which
+    # deletes hot rows) and go away with the session itself.
+    """CREATE TABLE IF NOT EXISTS session_stats (
+  session_id TEXT PRIMARY KEY REFERENCES sessions(id),
+  message_count INTEGER NOT NULL DEFAULT 0,
+  external_count INTEGER NOT NULL DEFAULT 0,
+  internal_count INTEGER NOT NULL DEFAULT 0,
+  subconscious_count INTEGER NOT NULL DEFAULT 0,
+  last_cycle INTEGER,
+  last_mood TEXT,
+  last_activity TEXT NOT NULL DEFAULT (datetime('now'))
+);
+CREATE INDEX IF NOT EXISTS idx_session_stats_activity ON session_stats(last_activity, session_id);
+CREATE INDEX IF NOT EXISTS idx_session_stats_messages ON session_stats(message_count, session_id);
+CREATE INDEX IF NOT EXISTS idx_session_stats_cycle ON session_stats(last_cycle, session_id);
+CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions(updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_sessions_created ON sessions(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_sessions_name ON sessions(name, id);
+
+CREATE TRIGGER IF NOT EXISTS session_stats_session_ai AFTER INSERT ON sessions BEGIN
+  INSERT OR IGNORE INTO session_stats(session_id, last_activity) VALUES (new.id, new.created_at);
+END;
+CREATE TRIGGER IF NOT EXISTS session_stats_session_ad AFTER DELETE ON sessions BEGIN
+  DELETE FROM session_stats WHERE session_id = old.id;
+END;
+CREATE TRIGGER IF NOT EXISTS session_stats_message_ai AFTER INSERT ON messages BEGIN
+  UPDATE session_stats SET
+    message_count = message_count + 1,
+    external_count = external_count + (new.layer = 'external'),
+    internal_count = internal_count + (new.layer = 'internal'),
+    subconscious_count = subconscious_count + (new.layer = 'subconscious'),
+    last_cycle = max(coalesce(last_cycle, 0), coalesce(new.cycle_number, 0)),
+    last_activity = max(last_activity, new.created_at)
+  WHERE session_id = new.session_id;
+END;
+CREATE TRIGGER IF NOT EXISTS session_stats_mood_ai AFTER INSERT ON mood_and_criteria BEGIN
+  UPDATE session_stats SET
+    last_mood = new.mood,
+    last_cycle = max(coalesce(last_cycle, 0), new.cycle_number),
+    last_activity = max(last_activity, new.created_at)
+  WHERE session_id = new.session_id;
+END;
+
+INSERT OR IGNORE INTO session_stats(
+  session_id, message_count, external_count, internal_count, subconscious_count,
+  last_cycle, last_mood, last_activity
+)
+SELECT s.id,
+  coalesce(m.total, 0), coalesce(m.external, 0), coalesce(m.internal, 0), coalesce(m.subconscious, 0),
+  max(coalesce(m.last_cycle, 0), coalesce(mc.cycle_number, 0)),
+  mc.mood,
+  max(s.created_at, coalesce(m.last_at, ''), coalesce(mc.created_at, ''))
+FROM sessions s
+LEFT JOIN (
+  SELECT session_id, count(*) AS total,
+    sum(layer = 'external') AS external, sum(layer = 'internal') AS internal,
+    sum(layer = 'subconscious') AS subconscious,
+    max(cycle_number) AS last_cycle, max(created_at) AS last_at
+  FROM messages GROUP BY session_id
+) m ON m.session_id = s.id
+LEFT JOIN mood_and_criteria mc ON mc.id = (
+  SELECT id FROM mood_and_criteria WHERE session_id = s.id ORDER BY id DESC LIMIT 1
+);
+""",
+    # 3: one row per LLM call, written by llm.telemetry through the
+    # write-behind queue. Token counts come from provider usage when the
+    # backend reports it and are estimated from text length otherwise.
+    """CREATE TABLE IF NOT EXISTS llm_calls (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  session_id TEXT,
+  layer TEXT,
+  purpose TEXT,
+  cycle_number INTEGER,
+  backend TEXT NOT NULL,
+  model TEXT NOT NULL,
+  streamed INTEGER NOT NULL DEFAULT 0,
+  status TEXT NOT NULL,
+  error TEXT,
+  queue_ms REAL NOT NULL DEFAULT 0,
+  ttft_ms REAL,
+  latency_ms REAL NOT NULL,
+  input_tokens INTEGER NOT NULL DEFAULT 0,
+  output_tokens INTEGER NOT NULL DEFAULT 0,
+  cache_read_tokens INTEGER NOT NULL DEFAULT 0,
+  cache_write_tokens INTEGER NOT NULL DEFAULT 0,
+  tokens_estimated INTEGER NOT NULL DEFAULT 0,
+  cost_usd REAL,
+  created_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+CREATE INDEX IF NOT EXISTS idx_llm_calls_created ON llm_calls(created_at);
+CREATE INDEX IF NOT EXISTS idx_llm_calls_session ON llm_calls(session_id, id);
+""",
+    # 4: early stopping of generation once a layer's required tags are
+    # closed (llm.telemetry). wasted_tokens estimates the output after the
+    # last required tag, which the layer discards.
+    """\
+ALTER TABLE llm_calls ADD COLUMN stopped_early INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE llm_calls ADD COLUMN wasted_tokens INTEGER NOT NULL DEFAULT 0;
+""",
+]
@@ -0,0 +1,271 @@
+from __future__ import annotations
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+import aiosqlite
+
+from database.pool import ConnectionPool
+
+logger = logging.getLogger("agentcsd.db.writer")
+
+# Statements the write-behind stage knows how to batch, keyed by record kind
+STATEMENTS: dict[str, str] = {
+    "message": "INSERT INTO messages (session_id, layer, tag, content, cycle_number) VALUES (?, ?, ?, ?, ?)",
+    "mood_and_criteria": "INSERT INTO mood_and_criteria (session_id, mood, criteria, cycle_number) VALUES (?, ?, ?, ?)",
+    "context_summary": "INSERT INTO context_summaries (session_id, layer, summary, cycle_from, cycle_to) VALUES (?, ?, ?, ?, ?)",
+    "llm_call": (
+        "INSERT INTO llm_calls (session_id, layer, purpose, cycle_number, backend, model, "
+        "streamed, status, error, queue_ms, ttft_ms, latency_ms, input_tokens, output_tokens, "
+        "cache_read_tokens, cache_write_tokens, tokens_estimated, cost_usd, stopped_early, "
+        "wasted_tokens) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    ),
+    "checkpoint": (
+        "INSERT INTO orchestrator_checkpoints (session_id, cycle, state, updated_at) "
+        "VALUES (?, ?, ?, datetime('now')) "
+        "ON CONFLICT(session_id) DO UPDATE SET cycle = excluded.cycle, "
+        "state = excluded.state, updated_at = excluded.updated_at"
+    ),
+}
+
+DURABILITY_MODES = ("batched", "cycle")
+
+
+class WriteBehindQueue:
+    """Group-commit stage shared by every orchestrator in the process.
+
+    Records are queued without waiting on SQLite and committed in batches,
+    one transaction per batch, using executemany per statement. A batch is
+    flushed when it reaches ``batch_size`` records or ``max_latency``
+    seconds after its first record, whichever comes first. At most
+    ``max_pending`` records wait or commit at a time: put_unit() waits for
+    room, enqueue_unit() raises ``asyncio.QueueFull``.
+
+    Durability modes:
+      - ``batched``: synchronous=NORMAL; commits happen on the batch window
+        and callers never wait for them.
+      - ``cycle``: synchronous=FULL (fsync on every commit); ``end_cycle()``
+        flushes and waits, so a cycle's records are durable once it returns.
+    """
+
+    def __init__(self, get_pool: Callable[[], Awaitable[ConnectionPool]],
+                 batch_size: int = 200, max_latency: float = 0.05,
+                 durability: str = "batched", max_pending: int = 10000):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability}")
+        self._get_pool = get_pool
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.durability = durability
+        self.max_pending = max_pending
+
+        # Each unit is a list of (kind, params) records committed together
+        self._units: list[list[tuple[str, tuple]]] = []
+        self._pending_records = 0
+        self._committing_records = 0  # detached by the flush in progress
+        self._has_room = asyncio.Event()
+        self._has_room.set()
+        self._has_data = asyncio.Event()
+        self._flush_now = asyncio.Event()
+        self._flush_waiters: list[asyncio.Future] = []
+        # Done when the batch being committed right now is
+        self._inflight: asyncio.Future | None = None
+        self._task: asyncio.Task | None = None
+
+        # Stats
+        self._batches = 0
+        self._records = 0
+        self._failures = 0
+        self._full_waits = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued, then stop the background task."""
+        if not self.running:
+            if self._units:
+                await self._flush_batch()
+            return
+        await self.flush()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def enqueue(self, kind: str, params: tuple):
+        self.enqueue_unit([(kind, params)])
+
+    def enqueue_unit(self, records: list[tuple[str, tuple]]):
+        """Queue records that must be committed in the same transaction.
+
+        Raises ``asyncio.QueueFull`` when ``max_pending`` records are already
+        waiting; callers that must not lose the records use put_unit().
+        """
+        if not records:
+            return
+        for kind, _ in records:
+            if kind not in STATEMENTS:
+                raise ValueError(f"Unknown write-behind record kind: {kind}")
+        if self._outstanding() >= self.max_pending:
+            self._flush_now.set()
+            raise asyncio.QueueFull(f"{self._outstanding()} write-behind records pending")
+        self._append(records)
+
+    async def put_unit(self, records: list[tuple[str, tuple]]):
+        """enqueue_unit(), waiting while ``max_pending`` records are pending
+        (the writer has stalled or fallen behind)."""
+        if not records:
+            return
+        while self._outstanding() >= self.max_pending:
+            if not self.running:
+                self.start()
+            self._full_waits += 1
+            self._has_room.clear()
+            self._has_data.set()
+            self._flush_now.set()
+            await self._has_room.wait()
+        self.enqueue_unit(records)
+
+    def _outstanding(self) -> int:
+        return self._pending_records + self._committing_records
+
+    def _append(self, records: list[tuple[str, tuple]]):
+        if not self.running:
+            self.start()
+        self._units.append(list(records))
+        self._pending_records += len(records)
+        self._has_data.set()
+        if self._pending_records >= self.batch_size:
+            self._flush_now.set()
+
+    async def flush(self):
+        """Commit everything queued so far and wait for it."""
+        if not self._units and not self._flush_waiters:
+            # The last records may be in the batch being committed
+            if self._inflight is not None:
+                await asyncio.shield(self._inflight)
+            return
+        if not self.running:
+            if self._inflight is not None:
+                await asyncio.shield(self._inflight)
+            await self._flush_batch()
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._flush_waiters.append(fut)
+        self._has_data.set()
+        self._flush_now.set()
+        await fut
+
+    async def end_cycle(self):
+        """Cycle boundary: waits for durability in ``cycle`` mode, no-op otherwise."""
+        if self.durability == "cycle":
+            await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await self._has_data.wait()
+                try:
+                    await asyncio.wait_for(self._flush_now.wait(), timeout=self.max_latency)
+                except asyncio.TimeoutError:
+                    pass
+                await self._flush_batch()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error("Write-behind flush error: %s", e, exc_info=True)
+                await asyncio.sleep(0.5)
+
+    async def _flush_batch(self):
+        units = self._units
+        waiters = self._flush_waiters
+        self._units = []
+        self._flush_waiters = []
+        self._committing_records, self._pending_records = self._pending_records, 0
+        self._has_data.clear()
+        self._flush_now.clear()
+        inflight = self._inflight = asyncio.get_running_loop().create_future()
+
+        try:
+            if units:
+                await self._commit(units)
+        except BaseException:
+            # Whatever _commit() did not get to goes back to the front of the
+            # queue, to be retried by the next flush
+            if units:
+                self._units[:0] = units
+                self._pending_records += sum(len(unit) for unit in units)
+                self._has_data.set()
+            raise
+        finally:
+            self._committing_records = 0
+            self._has_room.set()
+            if self._inflight is inflight:
+                self._inflight = None
+            inflight.set_result(None)
+            for fut in waiters:
+                if not fut.done():
+                    fut.set_result(None)
+
+    async def _commit(self, units: list[list[tuple[str, tuple]]]):
+        """Commit ``units``, removing each from the list once it is committed
+        or dropped; on an unexpected error the list holds what is left."""
+        grouped: dict[str, list[tuple]] = {}
+        count = 0
+        for unit in units:
+            for kind, params in unit:
+                grouped.setdefault(kind, []).append(params)
+                count += 1
+
+        pool = await self._get_pool()
+        async with pool.writer() as db:
+            try:
+                for kind, rows in grouped.items():
+                    await db.executemany(STATEMENTS[kind], rows)
+                await db.commit()
+                units.clear()
+                self._batches += 1
+                self._records += count
+                return
+            except aiosqlite.Error as e:
+                await db.rollback()
+                logger.warning("Batch of %d records failed (%s); retrying per unit", count, e)
+
+            # One bad unit (e.g. a session deleted meanwhile) must not sink the batch
+            while units:
+                unit = units[0]
+                try:
+                    for kind, params in unit:
+                        await db.execute(STATEMENTS[kind], params)
+                    await db.commit()
+                    self._records += len(unit)
+                except aiosqlite.Error as e:
+                    await db.rollback()
+                    self._failures += len(unit)
+                    logger.error("Dropping %d write-behind records: %s", len(unit), e)
+                del units[0]
+            self._batches += 1
+
+    def stats(self) -> dict:
+        return {
+            "durability": self.durability,
+            "batch_size": self.batch_size,
+            "max_latency_ms": round(self.max_latency * 1000, 1),
+            "queued_records": self._pending_records,
+            "committing_records": self._committing_records,
+            "max_pending": self.max_pending,
+            "full_waits": self._full_waits,
+            "batches": self._batches,
+            "records": self._records,
+            "failed_records": self._failures,
+            "avg_batch": round(self._records / self._batches, 1) if self._batches else 0.0,
+        }
@@ -0,0 +1,139 @@
+from __future__ import annotations
+import logging
+import re
+
+logger = logging.getLogger("agentcsd.context")
+
+HISTORY_SEPARATOR = "\n---\n"
+# History entries that replace older ones (see Orchestrator._maybe_summarize);
+# packed before the newest entries so the gist of the past survives
+SUMMARY_PREFIX = "[Previous summary]: "
+TRUNCATION_MARK = " [...] "
+MIN_PARTIAL_TOKENS = 32  # don't bother packing a truncated entry smaller than this
+
+_WORD = re.compile(r"[^\W\d_]+")
+_NUMBER = re.compile(r"\d+")
+_SYMBOL = re.compile(r"[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Fast local token estimate, close to BPE tokenizers on Latin-script text.
+
+    Words count one token plus one per 8 letters (4 outside ASCII), numbers
+    one per 3 digits, every other symbol one; whitespace is free.
+    """
+    if not text:
+        return 0
+    tokens = len(_SYMBOL.findall(text))
+    for number in _NUMBER.findall(text):
+        tokens += (len(number) + 2) // 3
+    for word in _WORD.findall(text):
+        tokens += 1 + len(word) // (8 if word.isascii() else 4)
+    return tokens
+
+
+def truncate_tokens(text: str, budget: int) -> str:
+    """Cut the middle of ``text`` until it fits ``budget`` tokens; keeps the
+    start (two thirds) and the end."""
+    tokens = estimate_tokens(text)
+    if tokens <= budget:
+        return text
+    if budget <= 0:
+        return ""
+    chars = int(len(text) * budget / tokens)
+    while chars > 0:
+        head = chars * 2 // 3
+        cut = text[:head].rstrip() + TRUNCATION_MARK + text[len(text) - (chars - head):].lstrip()
+        if estimate_tokens(cut) <= budget:
+            return cut
+        chars = int(chars * 0.9)
+    return ""
+
+
+class ContextBudget:
+    """Fits the sections of one layer's prompts into per-section token budgets.
+
+    ``fit`` cuts a single text down to its section's budget; ``pack`` keeps
+    the newest history entries that fit (a leading summary entry first),
+    truncating the entry that crosses the budget. Each call adds the
+    section's usage to the report of the prompt being assembled, which
+    ``report()`` returns and resets.
+    """
+
+    def __init__(self, budgets: dict[str, int], overrides: dict[str, int] | None = None):
+        self.budgets = {**budgets, **(overrides or {})}
+        self._sections: dict[str, dict] = {}
+        # Entries of each history that fit at the last pack, for summarization
+        self.kept: dict[str, int] = {}
+
+    def _record(self, section: str, tokens: int, entries: int, kept: int, truncated: bool):
+        usage = self._sections.setdefault(section, {
+            "tokens": 0, "budget": self.budgets.get(section), "entries": 0, "kept": 0, "truncated": 0,
+        })
+        usage["tokens"] += tokens
+        usage["entries"] += entries
+        usage["kept"] += kept
+        usage["truncated"] += int(truncated)
+
+    def fit(self, section: str, text: str) -> str:
+        budget = self.budgets.get(section)
+        if not text or budget is None:
+            self._record(section, estimate_tokens(text), int(bool(text)), int(bool(text)), False)
+            return text
+        fitted = truncate_tokens(text, budget)
+        self._record(section, estimate_tokens(fitted), 1, 1, fitted is not text)
+        return fitted
+
+    def select(self, section: str, entries: list[str]) -> list[str]:
+        """Newest entries that fit the section's budget, oldest first."""
+        budget = self.budgets.get(section)
+        if budget is None:
+            self._record(section, sum(estimate_tokens(e) for e in entries), len(entries), len(entries), False)
+            self.kept[section] = len(entries)
+            return list(entries)
+
+        pinned = entries[0] if entries and entries[0].startswith(SUMMARY_PREFIX) else None
+        rest = entries[1:] if pinned is not None else entries
+        separator = estimate_tokens(HISTORY_SEPARATOR)
+        remaining = budget
+        head: list[str] = []
+        if pinned is not None:
+            # At most half the budget goes to the summary
+            summary = truncate_tokens(pinned, budget // 2)
+            if summary:
+                head.append(summary)
+                remaining -= estimate_tokens(summary) + separator
+
+        kept: list[str] = []
+        truncated = pinned is not None and head and head[0] is not pinned
+        for entry in reversed(rest):
+            cost = estimate_tokens(entry) + separator
+            if cost <= remaining:
+                kept.append(entry)
+                remaining -= cost
+                continue
+            # The entry crossing the budget goes in cut down, if enough is left
+            if remaining - separator >= MIN_PARTIAL_TOKENS or not kept:
+                partial = truncate_tokens(entry, remaining - separator)
+                if partial:
+                    kept.append(partial)
+                    truncated = True
+            break
+        kept.reverse()
+
+        selected = head + kept
+        self._record(section, sum(estimate_tokens(e) + separator for e in selected),
+                     len(entries), len(selected), bool(truncated))
+        self.kept[section] = len(kept)
+        if len(selected) < len(entries):
+            logger.debug("%s: kept %d of %d entries in %d tokens",
+                         section, len(selected), len(entries), budget - remaining)
+        return selected
+
+    def pack(self, section: str, entries: list[str]) -> str:
+        return HISTORY_SEPARATOR.join(self.select(section, entries))
+
+    def report(self) -> dict:
+        """Token usage per section of the prompt assembled since the last report."""
+        sections, self._sections = self._sections, {}
+        return {"sections": sections, "total": sum(s["tokens"] for s in sections.values())}
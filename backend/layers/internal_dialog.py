@@ -1,26 +1,46 @@
 from __future__ import annotations
+from contextlib import aclosing
 from typing import AsyncGenerator
-from config import INTERNAL_DIALOG_SYSTEM_PROMPT
-from llm.base import LLMAdapter
-from utils.xml_parser import extract_tag
+from config import INTERNAL_DIALOG_SYSTEM_PROMPT, LLM_EARLY_STOP, PREFIX_STABLE_MAX_TURNS
+from layers.transcript import LAYOUT_CLASSIC, LAYOUT_PREFIX_STABLE, Transcript
+from llm.base import LLMAdapter, SystemPrompt, prompt_segment
+from utils.xml_parser import StreamingTagParser, extract_tag
 
 NO_EXTERNAL_OUTPUT = "[NO_EXTERNAL_OUTPUT]"
 
 
+def _emotional_reading(mood: str, criteria: str) -> str:
+    if not mood and not criteria:
+        return ""
+    reading = "\n\nYour current emotional reading:\n"
+    if mood:
+        reading += f"You feel: {mood}\n"
+    if criteria:
+        reading += f"You believe what matters: {criteria}\n"
+    return reading
+
+
 class InternalDialogLayer:
-    def __init__(self, llm: LLMAdapter, max_tokens: int = 4096):
+    # Sections parse_response() reads; nothing after them is used
+    REQUIRED_TAGS = ("ID_loud", "ID_quiet")
+
+    def __init__(self, llm: LLMAdapter, max_tokens: int = 4096,
+                 layout: str = LAYOUT_CLASSIC, max_turns: int = PREFIX_STABLE_MAX_TURNS):
         self.llm = llm
         self.max_tokens = max_tokens
-
-    def build_system_prompt(self, mood: str = "", criteria: str = "") -> str:
-        prompt = INTERNAL_DIALOG_SYSTEM_PROMPT
-        if mood or criteria:
-            prompt += "\n\nYour current emotional reading:\n"
-            if mood:
-                prompt += f"You feel: {mood}\n"
-            if criteria:
-                prompt += f"You believe what matters: {criteria}\n"
-        return prompt
+        self.layout = layout
+        self.transcript = Transcript(max_turns)
+
+    def build_system_prompt(self, mood: str = "", criteria: str = "") -> list[dict]:
+        # The instructions never change and are cached; mood and criteria
+        # change between calls, so they go after the cache breakpoint, or
+        # into the user message with the prefix-stable layout
+        segments = [prompt_segment(INTERNAL_DIALOG_SYSTEM_PROMPT, cache=True)]
+        if self.layout != LAYOUT_PREFIX_STABLE:
+            reading = _emotional_reading(mood, criteria)
+            if reading:
+                segments.append(prompt_segment(reading))
+        return segments
 
     def build_user_message(self, ed_user: str = "",
                            s_loud_entries: list[dict] | None = None,
@@ -54,49 +74,86 @@ class InternalDialogLayer:
 
         return "\n".join(parts)
 
-    async def process(self, ed_user: str = "",
+    def build_request(self, ed_user: str = "",
                       s_loud_entries: list[dict] | None = None,
                       id_quiet_history: str = "", mood: str = "",
-                      criteria: str = "") -> dict:
+                      criteria: str = "") -> tuple[SystemPrompt, list[dict], str]:
+        """System prompt, messages and the new user message for one call."""
         system = self.build_system_prompt(mood, criteria)
+        if self.layout != LAYOUT_PREFIX_STABLE:
+            user_msg = self.build_user_message(ed_user, s_loud_entries, id_quiet_history)
+            return system, [{"role": "user", "content": user_msg}], user_msg
+
+        # Earlier turns carry the previous thoughts; the history string is
+        # only needed to seed a fresh transcript (new layer, resumed session)
+        if self.transcript.turns:
+            id_quiet_history = ""
         user_msg = self.build_user_message(ed_user, s_loud_entries, id_quiet_history)
+        user_msg += _emotional_reading(mood, criteria)
+        return system, self.transcript.messages(user_msg), user_msg
 
-        messages = [{"role": "user", "content": user_msg}]
-        response = await self.llm.generate(system, messages, self.max_tokens)
+    def record_turn(self, user_msg: str, raw: str):
+        if self.layout == LAYOUT_PREFIX_STABLE:
+            self.transcript.append(user_msg, raw)
 
-        return self.parse_response(response)
-
-    async def stream_raw(self, ed_user: str = "",
-                         s_loud_entries: list[dict] | None = None,
-                         id_quiet_history: str = "", mood: str = "",
-                         criteria: str = "") -> AsyncGenerator[str, None]:
-        """Stream raw LLM output chunks without parsing."""
-        system = self.build_system_prompt(mood, criteria)
-        user_msg = self.build_user_message(ed_user, s_loud_entries, id_quiet_history)
-        messages = [{"role": "user", "content": user_msg}]
-
-        async for chunk in self.llm.generate_stream(system, messages, self.max_tokens):
-            yield chunk
+    async def process(self, ed_user: str = "",
+                      s_loud_entries: list[dict] | None = None,
+                      id_quiet_history: str = "", mood: str = "",
+                      criteria: str = "") -> dict:
+        parser = self.stream_parser()
+        async for _ in self.stream_parsed(parser, ed_user, s_loud_entries,
+                                          id_quiet_history, mood, criteria):
+            pass
+        return self.parse_streamed(parser)
+
+    async def stream_parsed(self, parser: StreamingTagParser, ed_user: str = "",
+                            s_loud_entries: list[dict] | None = None,
+                            id_quiet_history: str = "", mood: str = "",
+                            criteria: str = "") -> AsyncGenerator[list[tuple[str | None, str]], None]:
+        """Stream the response through ``parser`` (from stream_parser()),
+        yielding the parsed pieces of each chunk. Generation is stopped once
+        every REQUIRED_TAGS section has closed (LLM_EARLY_STOP)."""
+        system, messages, user_msg = self.build_request(
+            ed_user, s_loud_entries, id_quiet_history, mood, criteria,
+        )
+
+        async with aclosing(self.llm.generate_stream(system, messages, self.max_tokens)) as chunks:
+            async for chunk in chunks:
+                yield parser.feed(chunk)
+                if LLM_EARLY_STOP and parser.complete:
+                    break
+        yield parser.close()
+        self.record_turn(user_msg, parser.raw)
+
+    def stream_parser(self) -> StreamingTagParser:
+        """Parser for one response: ID_loud/ID_quiet text as it arrives,
+        then the result through parse_streamed()."""
+        return StreamingTagParser(self.REQUIRED_TAGS, {"ID_loud": NO_EXTERNAL_OUTPUT})
 
     def parse_response(self, raw: str) -> dict:
         """Parse a complete raw response into ID_loud/ID_quiet."""
-        id_loud = extract_tag(raw, "ID_loud")
-        id_quiet = extract_tag(raw, "ID_quiet")
+        parser = self.stream_parser()
+        parser.feed(raw)
+        parser.close()
+        return self.parse_streamed(parser)
+
+    def parse_streamed(self, parser: StreamingTagParser) -> dict:
+        """Parse result of a response fed through stream_parser()."""
+        raw = parser.raw
+        id_loud = parser.result("ID_loud")
+        id_quiet = parser.result("ID_quiet")
+        if id_loud is None and id_quiet is None:
+            # No XML sections; try markdown-style headers
+            id_loud = extract_tag(raw, "ID_loud")
+            id_quiet = extract_tag(raw, "ID_quiet")
+        id_loud = id_loud or ""
+        id_quiet = id_quiet or ""
 
         if not id_loud and not id_quiet:
-            # Last resort: try splitting on "---" separator
-            # Some models output ID_quiet then --- then ID_loud
-            if "\n---\n" in raw:
-                parts = raw.split("\n---\n", 1)
-                # Heuristic: shorter part is likely the externalization
-                # But really we can't know — treat as internal_only to be safe
-                id_quiet = raw
-                id_loud = ""
-            else:
-                # Can't parse at all — treat entire output as internal thought
-                # to prevent leaking private reasoning to the user
-                id_quiet = raw
-                id_loud = ""
+            # Can't parse at all — treat entire output as internal thought
+            # to prevent leaking private reasoning to the user
+            id_quiet = raw
+            id_loud = ""
 
         # Treat [NO_EXTERNAL_OUTPUT] as empty externalization
         internal_only = False
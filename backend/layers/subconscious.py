@@ -1,11 +1,21 @@
-from llm.base import LLMAdapter
-from utils.xml_parser import extract_tag, extract_m_and_c
+from contextlib import aclosing
+from typing import AsyncGenerator
+from config import LLM_EARLY_STOP, PREFIX_STABLE_MAX_TURNS
+from layers.transcript import LAYOUT_CLASSIC, LAYOUT_PREFIX_STABLE, Transcript
+from llm.base import LLMAdapter, prompt_segment
+from utils.xml_parser import StreamingTagParser, extract_tag, extract_m_and_c
 
 
 class SubconsciousLayer:
-    def __init__(self, llm: LLMAdapter, max_tokens: int = 2048):
+    # Sections process() reads; nothing after them is used
+    REQUIRED_TAGS = ("S_loud", "S_quiet", "M_AND_C", "trigger")
+
+    def __init__(self, llm: LLMAdapter, max_tokens: int = 2048,
+                 layout: str = LAYOUT_CLASSIC, max_turns: int = PREFIX_STABLE_MAX_TURNS):
         self.llm = llm
         self.max_tokens = max_tokens
+        self.layout = layout
+        self.transcript = Transcript(max_turns)
 
     def build_user_message(self, ed_user: str = "", ed_agent: str = "",
                            id_quiet: str = "", id_loud: str = "",
@@ -52,25 +62,110 @@ class SubconsciousLayer:
                       ed_agent: str = "", id_quiet: str = "",
                       id_loud: str = "", s_quiet_history: str = "",
                       s_loud_history: str = "", cycle: int = 0) -> dict:
+        result = {}
+        async for section, value in self.process_stream(
+            persona_core, ed_user, ed_agent, id_quiet, id_loud,
+            s_quiet_history, s_loud_history, cycle,
+        ):
+            if section == "result":
+                result = value
+        return result
+
+    async def process_stream(self, persona_core: str, ed_user: str = "",
+                             ed_agent: str = "", id_quiet: str = "",
+                             id_loud: str = "", s_quiet_history: str = "",
+                             s_loud_history: str = "",
+                             cycle: int = 0) -> AsyncGenerator[tuple[str, object], None]:
+        """Streaming process(): yields ``(section, value)`` as soon as each
+        section's closing tag arrives — ("s_loud", str), ("s_quiet", str),
+        ("m_and_c", {"mood", "criteria"}), ("trigger", bool) — and last
+        ("result", dict) with process()'s result."""
+        prefix_stable = self.layout == LAYOUT_PREFIX_STABLE
+        if prefix_stable and self.transcript.turns:
+            # Earlier cycles are replayed as turns; the history windows only
+            # seed a fresh transcript (new layer, resumed session)
+            s_quiet_history = s_loud_history = ""
         user_msg = self.build_user_message(
             ed_user, ed_agent, id_quiet, id_loud,
             s_quiet_history, s_loud_history, cycle,
         )
 
-        messages = [{"role": "user", "content": user_msg}]
-        response = await self.llm.generate(persona_core, messages, self.max_tokens)
+        if prefix_stable:
+            messages = self.transcript.messages(user_msg)
+        else:
+            messages = [{"role": "user", "content": user_msg}]
+        # The persona core is identical every cycle: cache it
+        system = [prompt_segment(persona_core, cache=True)]
+        parser = StreamingTagParser(self.REQUIRED_TAGS)
+        sent: set[str] = set()
+        async with aclosing(self.llm.generate_stream(system, messages, self.max_tokens)) as chunks:
+            async for chunk in chunks:
+                parser.feed(chunk)
+                for section in self._closed_sections(parser, sent):
+                    yield section
+                # Nothing after the required sections is used
+                if LLM_EARLY_STOP and parser.complete:
+                    break
+        parser.close()
+        response = parser.raw
+        if prefix_stable:
+            self.transcript.append(user_msg, response)
+
+        if all(parser.result(tag) is None for tag in self.REQUIRED_TAGS):
+            # No XML sections; extract_tag falls back to markdown-style headers.
+            # Nothing was yielded while streaming, so every section goes now
+            result = self.parse_response(response)
+            yield "s_loud", result["s_loud"]
+            yield "s_quiet", result["s_quiet"]
+            yield "m_and_c", {"mood": result["mood"], "criteria": result["criteria"]}
+            yield "trigger", result["trigger"]
+        else:
+            for section in self._closed_sections(parser, sent):
+                yield section
+            m_and_c = _m_and_c(parser.result("M_AND_C") or "")
+            result = {
+                "s_loud": parser.result("S_loud") or "",
+                "s_quiet": parser.result("S_quiet") or "",
+                "mood": m_and_c["mood"],
+                "criteria": m_and_c["criteria"],
+                "trigger": _is_true(parser.result("trigger") or ""),
+                "raw": response,
+            }
+        yield "result", result
+
+    def _closed_sections(self, parser: StreamingTagParser, sent: set[str]):
+        for tag in self.REQUIRED_TAGS:
+            content = parser.result(tag)
+            if content is None or tag in sent:
+                continue
+            sent.add(tag)
+            if tag == "M_AND_C":
+                yield "m_and_c", _m_and_c(content)
+            elif tag == "trigger":
+                yield "trigger", _is_true(content)
+            else:
+                yield tag.lower(), content
 
+    def parse_response(self, response: str) -> dict:
+        """Parse a complete raw response."""
         s_loud = extract_tag(response, "S_loud")
         s_quiet = extract_tag(response, "S_quiet")
         m_and_c = extract_m_and_c(response)
-        trigger = extract_tag(response, "trigger").lower().strip()
-        should_trigger = trigger in ("true", "yes", "1")
+        trigger = extract_tag(response, "trigger")
 
         return {
             "s_loud": s_loud,
             "s_quiet": s_quiet,
             "mood": m_and_c["mood"],
             "criteria": m_and_c["criteria"],
-            "trigger": should_trigger,
+            "trigger": _is_true(trigger),
             "raw": response,
         }
+
+
+def _m_and_c(block: str) -> dict[str, str]:
+    return {"mood": extract_tag(block, "mood"), "criteria": extract_tag(block, "criteria")}
+
+
+def _is_true(trigger: str) -> bool:
+    return trigger.lower().strip() in ("true", "yes", "1")
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+# Prompt layouts a layer can assemble its calls with:
+#   classic        one user message per call, fresh inputs first, then
+#                  sliding windows of the histories
+#   prefix_stable  earlier calls replayed as conversation turns and only the
+#                  fresh inputs in the new user message, so every call
+#                  extends the previous prompt and a server KV cache
+#                  (llama.cpp, LM Studio) only evaluates the new tail
+LAYOUT_CLASSIC = "classic"
+LAYOUT_PREFIX_STABLE = "prefix_stable"
+
+
+class Transcript:
+    """Append-only turn history for the prefix-stable layout.
+
+    Turns are only appended; once there are more than ``max_turns`` the
+    oldest are dropped in one go down to half, so the prefix stays stable
+    for ``max_turns // 2`` calls between re-evaluations.
+    """
+
+    def __init__(self, max_turns: int = 10):
+        self.max_turns = max(2, max_turns)
+        self.turns: list[tuple[str, str]] = []
+
+    def messages(self, user_msg: str) -> list[dict]:
+        messages = []
+        for user, assistant in self.turns:
+            messages.append({"role": "user", "content": user})
+            messages.append({"role": "assistant", "content": assistant})
+        messages.append({"role": "user", "content": user_msg})
+        return messages
+
+    def append(self, user_msg: str, response: str):
+        self.turns.append((user_msg, response))
+        if len(self.turns) > self.max_turns:
+            del self.turns[: len(self.turns) - self.max_turns // 2]
+
+    def clear(self):
+        self.turns = []
@@ -1,32 +1,81 @@
 from __future__ import annotations
+import logging
 from typing import AsyncGenerator
-from llm.base import LLMAdapter
+from llm.base import LLMAdapter, SystemPrompt
+from llm.clients import acquire_client, release_client
+from llm.telemetry import note_usage
+
+logger = logging.getLogger("agentcsd.llm")
+
+# The API accepts at most this many cache_control breakpoints per request
+MAX_CACHE_BREAKPOINTS = 4
+
+
+def _system_blocks(system_prompt: SystemPrompt) -> str | list[dict]:
+    """System prompt in API form, with a cache breakpoint closing each cached run."""
+    if isinstance(system_prompt, str):
+        return system_prompt
+    blocks = []
+    breakpoints = []
+    for i, segment in enumerate(system_prompt):
+        if not segment["text"]:
+            continue
+        blocks.append({"type": "text", "text": segment["text"]})
+        following = system_prompt[i + 1] if i + 1 < len(system_prompt) else None
+        if segment.get("cache") and not (following and following.get("cache")):
+            breakpoints.append(blocks[-1])
+    # Keep the longest prefixes when there are too many runs
+    for block in breakpoints[-MAX_CACHE_BREAKPOINTS:]:
+        block["cache_control"] = {"type": "ephemeral"}
+    return blocks
+
+
+def _usage(usage) -> dict:
+    return {
+        "input_tokens": usage.input_tokens,
+        "output_tokens": usage.output_tokens,
+        "cache_read_tokens": getattr(usage, "cache_read_input_tokens", None) or 0,
+        "cache_write_tokens": getattr(usage, "cache_creation_input_tokens", None) or 0,
+    }
 
 
 class AnthropicAPIAdapter(LLMAdapter):
     def __init__(self, model: str = "claude-sonnet-4-5-20250929",
                  api_key: str | None = None):
-        import anthropic
         self.model = model
-        self.client = anthropic.AsyncAnthropic(api_key=api_key)
+        self._client_key, self.client = acquire_client("anthropic_api", None, api_key)
+
+    async def aclose(self):
+        if self._client_key is not None:
+            release_client(self._client_key)
+            self._client_key = None
+
+    def _record_usage(self, usage):
+        usage = _usage(usage)
+        note_usage(usage)
+        logger.debug("%s usage: %d in (%d cache read, %d cache write), %d out",
+                     self.model, usage["input_tokens"], usage["cache_read_tokens"],
+                     usage["cache_write_tokens"], usage["output_tokens"])
 
-    async def generate(self, system_prompt: str, messages: list[dict],
+    async def generate(self, system_prompt: SystemPrompt, messages: list[dict],
                        max_tokens: int = 4096) -> str:
         response = await self.client.messages.create(
             model=self.model,
             max_tokens=max_tokens,
-            system=system_prompt,
+            system=_system_blocks(system_prompt),
             messages=messages,
         )
+        self._record_usage(response.usage)
         return response.content[0].text
 
-    async def generate_stream(self, system_prompt: str, messages: list[dict],
+    async def generate_stream(self, system_prompt: SystemPrompt, messages: list[dict],
                               max_tokens: int = 4096) -> AsyncGenerator[str, None]:
         async with self.client.messages.stream(
             model=self.model,
             max_tokens=max_tokens,
-            system=system_prompt,
+            system=_system_blocks(system_prompt),
             messages=messages,
         ) as stream:
             async for text in stream.text_stream:
                 yield text
+            self._record_usage((await stream.get_final_message()).usage)
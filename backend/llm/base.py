@@ -2,15 +2,34 @@ from __future__ import annotations
 from abc import ABC, abstractmethod
 from typing import AsyncGenerator
 
+# A system prompt is a plain string or a list of segments, each
+# {"text": str, "cache": bool}. Cacheable segments are the stable prefix
+# and come first; per-call parts (mood, criteria) follow uncached.
+SystemPrompt = str | list[dict]
+
+
+def prompt_segment(text: str, cache: bool = False) -> dict:
+    return {"text": text, "cache": cache}
+
+
+def prompt_text(system_prompt: SystemPrompt) -> str:
+    """Flatten a system prompt for backends without prompt caching."""
+    if isinstance(system_prompt, str):
+        return system_prompt
+    return "".join(segment["text"] for segment in system_prompt)
+
 
 class LLMAdapter(ABC):
+    # Backends that know a call's token usage report it with
+    # llm.telemetry.note_usage()
+
     @abstractmethod
-    async def generate(self, system_prompt: str, messages: list[dict],
+    async def generate(self, system_prompt: SystemPrompt, messages: list[dict],
                        max_tokens: int = 4096) -> str:
         """Send prompt to LLM and return response text.
 
         Args:
-            system_prompt: The system-level instructions.
+            system_prompt: The system-level instructions, as text or segments.
             messages: List of {"role": "user"|"assistant", "content": "..."} dicts.
             max_tokens: Maximum tokens to generate.
 
@@ -19,7 +38,7 @@ class LLMAdapter(ABC):
         """
         pass
 
-    async def generate_stream(self, system_prompt: str, messages: list[dict],
+    async def generate_stream(self, system_prompt: SystemPrompt, messages: list[dict],
                               max_tokens: int = 4096) -> AsyncGenerator[str, None]:
         """Stream response chunks from LLM.
 
@@ -28,3 +47,15 @@ class LLMAdapter(ABC):
         """
         result = await self.generate(system_prompt, messages, max_tokens)
         yield result
+
+    def prewarm(self, system_prompt: SystemPrompt):
+        """Get ready for calls with this system prompt, in the background.
+
+        Default implementation does nothing.
+        """
+
+    async def aclose(self):
+        """Release shared resources (HTTP clients) held by this adapter.
+
+        Default implementation does nothing.
+        """
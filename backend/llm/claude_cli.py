@@ -1,99 +1,212 @@
 from __future__ import annotations
 import asyncio
 import codecs
+import hashlib
 import os
+from contextlib import aclosing
 from typing import AsyncGenerator
-from llm.base import LLMAdapter
+from llm.base import LLMAdapter, SystemPrompt, prompt_text
+from llm.cli_pool import CLIWorkerPool, PromptFile, get_cli_pool
+from llm.telemetry import note_usage
+
+# Adaptive stdout read size for streaming: grows while reads come back full
+READ_MIN = 4 * 1024
+READ_MAX = 1024 * 1024
+
+
+def _user_content(messages: list[dict]) -> str:
+    user_content = ""
+    for msg in messages:
+        if msg["role"] == "user":
+            user_content += msg["content"] + "\n"
+        elif msg["role"] == "assistant":
+            user_content += f"[Previous response]: {msg['content']}\n"
+    return user_content.strip()
+
+
+async def _feed(stdin: asyncio.StreamWriter, data: bytes):
+    try:
+        stdin.write(data)
+        await stdin.drain()
+        stdin.close()
+    except (BrokenPipeError, ConnectionResetError):
+        pass  # CLI exited early; its exit code tells why
+
+
+def _split_prompt(system_prompt: SystemPrompt) -> tuple[str, str]:
+    """(stable, tail): the system prompt up to its last cached segment, which
+    a pooled worker is started with, and the segments after it (the mood
+    reading), which change from call to call and go in the user message."""
+    if isinstance(system_prompt, str):
+        return system_prompt, ""
+    cached = [i for i, segment in enumerate(system_prompt) if segment.get("cache")]
+    if not cached:
+        return prompt_text(system_prompt), ""
+    return prompt_text(system_prompt[:cached[-1] + 1]), prompt_text(system_prompt[cached[-1] + 1:])
+
+
+def _cli_env() -> dict:
+    env = {k: v for k, v in os.environ.items()
+           if not k.startswith("CLAUDE")}
+    env["PATH"] = os.environ.get("PATH", "")
+    return env
 
 
 class ClaudeCLIAdapter(LLMAdapter):
     def __init__(self, model: str = "claude-sonnet-4-5-20250929",
-                 tools: list[str] | None = None, max_turns: int = 1):
+                 tools: list[str] | None = None, max_turns: int = 1,
+                 pooled: bool = True, pool: CLIWorkerPool | None = None):
         self.model = model
         self.tools = tools
         self.max_turns = max_turns
+        self.pooled = pooled
+        self._pool = pool
 
-    def _build_cmd_and_env(self, system_prompt: str, messages: list[dict]) -> tuple[list[str], dict]:
-        user_content = ""
-        for msg in messages:
-            if msg["role"] == "user":
-                user_content += msg["content"] + "\n"
-            elif msg["role"] == "assistant":
-                user_content += f"[Previous response]: {msg['content']}\n"
+    def _get_pool(self) -> CLIWorkerPool | None:
+        if not self.pooled:
+            return None
+        return self._pool or get_cli_pool()
 
+    def _base_cmd(self) -> list[str]:
+        # The system prompt goes in as --system-prompt-file and the user
+        # content over stdin, so prompt size is not bounded by ARG_MAX
         cmd = [
             "claude",
             "--print",
             "--model", self.model,
             "--max-turns", str(self.max_turns),
-            "--system-prompt", system_prompt,
         ]
         if self.tools:
             cmd.extend(["--tools", ",".join(self.tools)])
-        # "--" signals end-of-options so content starting with "-" isn't parsed as flags
-        cmd.append("--")
-        cmd.append(user_content.strip())
-
-        env = {k: v for k, v in os.environ.items()
-               if not k.startswith("CLAUDE")}
-        env["PATH"] = os.environ.get("PATH", "")
-
-        return cmd, env
-
-    async def generate(self, system_prompt: str, messages: list[dict],
-                       max_tokens: int = 4096) -> str:
-        cmd, env = self._build_cmd_and_env(system_prompt, messages)
+        return cmd
 
+    async def _spawn(self, system_prompt: SystemPrompt) -> tuple[asyncio.subprocess.Process, PromptFile]:
+        prompt = PromptFile(prompt_text(system_prompt))
         try:
             proc = await asyncio.create_subprocess_exec(
-                *cmd,
+                *self._base_cmd(), "--system-prompt-file", prompt.path,
+                stdin=asyncio.subprocess.PIPE,
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE,
-                env=env,
+                env=_cli_env(),
+                limit=READ_MAX,
+                pass_fds=prompt.pass_fds,
             )
-            stdout, stderr = await proc.communicate()
-
-            if proc.returncode != 0:
-                error_msg = stderr.decode().strip()
-                raise RuntimeError(f"Claude CLI error (code {proc.returncode}): {error_msg}")
-
-            return stdout.decode().strip()
         except FileNotFoundError:
+            prompt.close()
             raise RuntimeError(
                 "Claude CLI not found. Ensure 'claude' is installed and in PATH."
             )
+        prompt.spawned()
+        return proc, prompt
 
-    async def generate_stream(self, system_prompt: str, messages: list[dict],
-                              max_tokens: int = 4096) -> AsyncGenerator[str, None]:
-        cmd, env = self._build_cmd_and_env(system_prompt, messages)
+    # --- Pooled workers (stream-json over stdin/stdout) ---
+
+    def _worker_cmd(self) -> list[str]:
+        return self._base_cmd() + [
+            "--input-format", "stream-json",
+            "--output-format", "stream-json",
+            "--verbose",
+            "--include-partial-messages",
+        ]
 
+    def _pool_key(self, system_prompt: str) -> tuple:
+        digest = hashlib.sha1(system_prompt.encode("utf-8")).hexdigest()
+        return (self.model, tuple(self.tools or ()), self.max_turns, digest)
+
+    def prewarm(self, system_prompt: SystemPrompt):
+        pool = self._get_pool()
+        if pool is not None:
+            stable, _ = _split_prompt(system_prompt)
+            pool.prewarm(self._pool_key(stable), self._worker_cmd(), _cli_env(), stable)
+
+    async def _pooled_stream(self, pool: CLIWorkerPool, system_prompt: SystemPrompt,
+                             messages: list[dict], result: list[str]) -> AsyncGenerator[str, None]:
+        # Workers are keyed on the stable part of the prompt only, so a new
+        # mood reading does not need a new process
+        stable, tail = _split_prompt(system_prompt)
+        worker = await pool.acquire(
+            self._pool_key(stable), self._worker_cmd(), _cli_env(), stable,
+        )
+        ok = False
         try:
-            proc = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                env=env,
-            )
+            async for chunk in worker.request(_user_content(messages) + tail.rstrip()):
+                yield chunk
+            result.append(worker.result)
+            if worker.usage:
+                note_usage(worker.usage)
+            ok = True
+        finally:
+            # A worker abandoned mid-response still has output queued: never reuse it
+            pool.release(worker, ok)
+
+    async def generate(self, system_prompt: SystemPrompt, messages: list[dict],
+                       max_tokens: int = 4096) -> str:
+        pool = self._get_pool()
+        if pool is not None:
+            result: list[str] = []
+            async for _ in self._pooled_stream(pool, system_prompt, messages, result):
+                pass
+            return result[0].strip()
+
+        proc, prompt = await self._spawn(system_prompt)
+        try:
+            stdout, stderr = await proc.communicate(_user_content(messages).encode("utf-8"))
+        finally:
+            if proc.returncode is None:
+                # Cancelled (deadline, lost hedge): don't leave the CLI running
+                proc.kill()
+                await proc.wait()
+            prompt.close()
 
+        if proc.returncode != 0:
+            error_msg = stderr.decode().strip()
+            raise RuntimeError(f"Claude CLI error (code {proc.returncode}): {error_msg}")
+
+        return stdout.decode().strip()
+
+    async def generate_stream(self, system_prompt: SystemPrompt, messages: list[dict],
+                              max_tokens: int = 4096) -> AsyncGenerator[str, None]:
+        pool = self._get_pool()
+        if pool is not None:
+            async with aclosing(self._pooled_stream(pool, system_prompt, messages, [])) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+            return
+
+        proc, prompt = await self._spawn(system_prompt)
+        # Feed stdin and collect stderr alongside reading stdout, so neither
+        # a large prompt nor a chatty stderr can fill a pipe and stall the CLI
+        feed = asyncio.create_task(_feed(proc.stdin, _user_content(messages).encode("utf-8")))
+        errors = asyncio.create_task(proc.stderr.read())
+        try:
             decoder = codecs.getincrementaldecoder("utf-8")("replace")
+            size = READ_MIN
             while True:
-                chunk = await proc.stdout.read(256)
+                chunk = await proc.stdout.read(size)
                 if not chunk:
                     # Flush any remaining bytes in the decoder
                     tail = decoder.decode(b"", final=True)
                     if tail:
                         yield tail
                     break
+                # read() returns whatever is buffered, so a larger size only
+                # helps once output arrives faster than it is consumed
+                if len(chunk) == size:
+                    size = min(size * 2, READ_MAX)
                 text = decoder.decode(chunk)
                 if text:
                     yield text
 
             await proc.wait()
             if proc.returncode != 0:
-                stderr = await proc.stderr.read()
-                error_msg = stderr.decode().strip()
+                error_msg = (await errors).decode().strip()
                 raise RuntimeError(f"Claude CLI error (code {proc.returncode}): {error_msg}")
-        except FileNotFoundError:
-            raise RuntimeError(
-                "Claude CLI not found. Ensure 'claude' is installed and in PATH."
-            )
+        finally:
+            feed.cancel()
+            errors.cancel()
+            if proc.returncode is None:
+                # Consumer stopped early
+                proc.kill()
+                await proc.wait()
+            prompt.close()
@@ -0,0 +1,469 @@
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import deque
+from typing import AsyncGenerator, Hashable
+
+from config import (
+    CLI_POOL_MAX_SIZE, CLI_POOL_SPARES, CLI_POOL_MAX_REQUESTS,
+    CLI_POOL_IDLE_TTL, CLI_POOL_HEALTH_INTERVAL,
+)
+from llm.telemetry import note_queue_wait
+
+logger = logging.getLogger("agentcsd.cli_pool")
+
+# stream-json lines carry whole responses; the 64 KiB StreamReader default is too small
+STREAM_LIMIT = 64 * 1024 * 1024
+
+
+class PromptFile:
+    """A system prompt handed to the CLI with ``--system-prompt-file``.
+
+    Keeps long prompts out of argv (ARG_MAX, MAX_ARG_STRLEN) and the process
+    table. Backed by a memfd the child inherits and reads as /dev/fd/N where
+    the platform has one, otherwise by a private temp file.
+    """
+
+    def __init__(self, text: str):
+        data = text.encode("utf-8")
+        self.fd: int | None = None
+        self._tmp: str | None = None
+        if hasattr(os, "memfd_create") and os.path.isdir("/dev/fd"):
+            self.fd = os.memfd_create("claude-system-prompt")
+            with os.fdopen(self.fd, "wb", closefd=False) as f:
+                f.write(data)
+            self.path = f"/dev/fd/{self.fd}"
+        else:
+            fd, self._tmp = tempfile.mkstemp(prefix="claude-system-prompt-", suffix=".md")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            self.path = self._tmp
+
+    @property
+    def pass_fds(self) -> tuple[int, ...]:
+        return (self.fd,) if self.fd is not None else ()
+
+    def spawned(self):
+        """The child holds its own descriptor now; drop the parent's."""
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def close(self):
+        self.spawned()
+        if self._tmp is not None:
+            try:
+                os.unlink(self._tmp)
+            except FileNotFoundError:
+                pass
+            self._tmp = None
+
+
+class CLIWorker:
+    """One long-lived ``claude -p --input-format stream-json`` process.
+
+    Each request writes a user message line to stdin and reads events from
+    stdout until the turn's ``result`` event. The system prompt is passed as
+    a PromptFile that lives as long as the process.
+    """
+
+    def __init__(self, key: Hashable, cmd: list[str], env: dict, system_prompt: str):
+        self.key = key
+        self.cmd = cmd
+        self.env = env
+        self.system_prompt = system_prompt
+        self.proc: asyncio.subprocess.Process | None = None
+        self._prompt: PromptFile | None = None
+        self.requests = 0
+        self.closed = False  # handed to CLIWorkerPool._discard
+        self.result = ""
+        self.usage: dict | None = None
+        self.started_at = time.monotonic()
+        self.idle_since = self.started_at
+        self._stderr: deque[str] = deque(maxlen=20)
+        self._stderr_task: asyncio.Task | None = None
+
+    async def start(self):
+        self._prompt = PromptFile(self.system_prompt)
+        try:
+            self.proc = await asyncio.create_subprocess_exec(
+                *self.cmd, "--system-prompt-file", self._prompt.path,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env=self.env,
+                limit=STREAM_LIMIT,
+                pass_fds=self._prompt.pass_fds,
+            )
+        except FileNotFoundError:
+            self._prompt.close()
+            raise RuntimeError(
+                "Claude CLI not found. Ensure 'claude' is installed and in PATH."
+            )
+        except BaseException:
+            # asyncio kills a child whose spawn was cancelled; the prompt is ours
+            self._prompt.close()
+            raise
+        self._prompt.spawned()
+        self._stderr_task = asyncio.create_task(self._drain_stderr())
+
+    async def _drain_stderr(self):
+        # Keep the pipe from filling up; the tail goes into error messages
+        async for line in self.proc.stderr:
+            self._stderr.append(line.decode("utf-8", "replace").rstrip())
+
+    @property
+    def alive(self) -> bool:
+        return (self.proc is not None and self.proc.returncode is None
+                and not self.proc.stdout.at_eof())
+
+    def _error(self, what: str) -> str:
+        code = self.proc.returncode if self.proc else None
+        message = f"Claude CLI error ({what}, code {code})"
+        if self._stderr:
+            message += ": " + "\n".join(self._stderr)
+        return message
+
+    async def request(self, content: str) -> AsyncGenerator[str, None]:
+        """Send one user message and yield text deltas until its result.
+
+        The final result text is left in ``self.result`` and its token usage
+        and cost in ``self.usage``.
+        """
+        self.requests += 1
+        self.result = ""
+        self.usage = None
+        line = json.dumps({"type": "user", "message": {"role": "user", "content": content}},
+                          ensure_ascii=False)
+        try:
+            self.proc.stdin.write(line.encode("utf-8") + b"\n")
+            await self.proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            raise RuntimeError(self._error("worker exited"))
+
+        streamed = False
+        while True:
+            raw = await self.proc.stdout.readline()
+            if not raw:
+                # Reap the exit code and let the stderr drain catch up
+                try:
+                    await asyncio.wait_for(self.proc.wait(), 1.0)
+                except asyncio.TimeoutError:
+                    pass
+                raise RuntimeError(self._error("worker exited"))
+            try:
+                event = json.loads(raw)
+            except ValueError:
+                continue
+            etype = event.get("type")
+            if etype == "stream_event":
+                delta = event.get("event", {}).get("delta", {})
+                if delta.get("type") == "text_delta" and delta.get("text"):
+                    streamed = True
+                    yield delta["text"]
+            elif etype == "result":
+                if event.get("is_error"):
+                    raise RuntimeError(f"Claude CLI error: {event.get('result') or event.get('subtype')}")
+                self.result = event.get("result") or ""
+                usage = event.get("usage") or {}
+                if usage:
+                    self.usage = {
+                        "input_tokens": usage.get("input_tokens") or 0,
+                        "output_tokens": usage.get("output_tokens") or 0,
+                        "cache_read_tokens": usage.get("cache_read_input_tokens") or 0,
+                        "cache_write_tokens": usage.get("cache_creation_input_tokens") or 0,
+                        "cost_usd": event.get("total_cost_usd"),
+                    }
+                if not streamed and self.result:
+                    yield self.result
+                return
+
+    async def close(self, timeout: float = 2.0, kill: bool = False):
+        """Stop the process: EOF on stdin, then a kill after ``timeout``
+        seconds; at once with ``kill`` (a request abandoned mid-response)."""
+        if self.proc is None:
+            return
+        self._prompt.close()
+        if self.proc.returncode is None and not kill:
+            try:
+                self.proc.stdin.close()
+                await asyncio.wait_for(self.proc.wait(), timeout)
+            except (asyncio.TimeoutError, BrokenPipeError, ConnectionResetError):
+                pass
+        if self.proc.returncode is None:
+            self.proc.kill()
+            await self.proc.wait()
+        if self._stderr_task is not None:
+            self._stderr_task.cancel()
+
+
+class CLIWorkerPool:
+    """Idle CLI workers kept warm per pool key.
+
+    A CLI process fixes its model, tools and system prompt at startup, so the
+    key covers all of them. Taking a worker starts a replacement in the
+    background, so the next call with the same key finds one already booted.
+    Workers are recycled after ``max_requests`` requests (with 1, every call
+    starts from a fresh conversation), and at most ``max_size`` processes
+    are alive at once; idle workers of other keys are evicted to make room.
+    """
+
+    def __init__(self, max_size: int = 8, spares: int = 1, max_requests: int = 1,
+                 idle_ttl: float = 600, health_interval: float = 30):
+        self.max_size = max_size
+        self.spares = spares
+        self.max_requests = max_requests
+        self.idle_ttl = idle_ttl
+        self.health_interval = health_interval
+        self._idle: dict[Hashable, deque[CLIWorker]] = {}
+        self._starting: dict[Hashable, int] = {}
+        self._busy: set[CLIWorker] = set()
+        self._specs: dict[Hashable, tuple[list[str], dict, str]] = {}
+        self._count = 0  # starting + idle + busy
+        self._changed = asyncio.Event()
+        self._closing: set[asyncio.Task] = set()
+        self._health_task: asyncio.Task | None = None
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        self.spawned = 0
+        self.recycled = 0
+        self.failed = 0
+        self.expired = 0
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _ensure_health_task(self):
+        if self._health_task is None and not self._closed:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _health_loop(self):
+        while not self._closed:
+            await asyncio.sleep(self.health_interval)
+            self.check_health()
+
+    def check_health(self):
+        """Drop idle workers that died or sat unused past the TTL."""
+        now = time.monotonic()
+        # Replacements are left to the next acquire(), so a CLI that keeps
+        # crashing on startup is not respawned in a loop
+        for key, idle in list(self._idle.items()):
+            for worker in list(idle):
+                if not worker.alive:
+                    logger.warning("CLI worker for %s exited while idle: %s",
+                                   key[0], worker._error("health check"))
+                    self.failed += 1
+                elif now - worker.idle_since > self.idle_ttl:
+                    self.expired += 1
+                else:
+                    continue
+                idle.remove(worker)
+                self._discard(worker)
+        for key in list(self._specs):
+            self._prune(key)
+
+    # --- Spawning ---
+
+    async def _start(self, key: Hashable) -> CLIWorker:
+        """Start a worker for a slot already counted in ``_count``."""
+        worker = CLIWorker(key, *self._specs[key])
+        try:
+            await worker.start()
+        except BaseException:
+            # Cancelled or failed: free the slot and leave no process behind
+            self._count -= 1
+            self._notify()
+            if worker.proc is not None and worker.proc.returncode is None:
+                worker.proc.kill()
+            raise
+        self.spawned += 1
+        return worker
+
+    def _replenish(self, key: Hashable):
+        """Start spares for ``key`` up to the spare count, if there is room."""
+        if self._closed or key not in self._specs:
+            return
+        have = len(self._idle.get(key, ())) + self._starting.get(key, 0)
+        for _ in range(self.spares - have):
+            if self._count >= self.max_size:
+                return
+            self._count += 1
+            self._starting[key] = self._starting.get(key, 0) + 1
+            asyncio.create_task(self._spawn_spare(key))
+
+    async def _spawn_spare(self, key: Hashable):
+        try:
+            worker = await self._start(key)
+        except Exception as e:
+            logger.warning("Prewarming CLI worker for %s failed: %s", key[0], e)
+            return
+        finally:
+            self._starting[key] -= 1
+        if self._closed:
+            self._discard(worker)
+            return
+        self._idle.setdefault(key, deque()).append(worker)
+        self._notify()
+
+    def _discard(self, worker: CLIWorker, kill: bool = False):
+        if worker.closed:
+            return
+        worker.closed = True
+        self._count -= 1
+        task = asyncio.create_task(worker.close(kill=kill))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+        self._notify()
+
+    def _prune(self, key: Hashable):
+        """Forget ``key`` (and its system prompt) once it has no workers."""
+        if self._idle.get(key) or self._starting.get(key) \
+                or any(worker.key == key for worker in self._busy):
+            return
+        self._specs.pop(key, None)
+        self._idle.pop(key, None)
+        self._starting.pop(key, None)
+
+    def _evict_idle(self) -> bool:
+        """Close the longest-idle worker of any key to free a slot."""
+        oldest = None
+        for idle in self._idle.values():
+            if idle and (oldest is None or idle[0].idle_since < oldest.idle_since):
+                oldest = idle[0]
+        if oldest is None:
+            return False
+        self._idle[oldest.key].popleft()
+        self._discard(oldest)
+        self._prune(oldest.key)
+        return True
+
+    # --- Public API ---
+
+    def prewarm(self, key: Hashable, cmd: list[str], env: dict, system_prompt: str):
+        """Start spare workers for ``key`` in the background."""
+        self._specs[key] = (cmd, env, system_prompt)
+        self._ensure_health_task()
+        self._replenish(key)
+
+    async def acquire(self, key: Hashable, cmd: list[str], env: dict,
+                      system_prompt: str) -> CLIWorker:
+        """A warm worker for ``key``, or a freshly started one when none is idle."""
+        if self._closed:
+            raise RuntimeError("CLI worker pool is closed")
+        spec = self._specs[key] = (cmd, env, system_prompt)
+        self._ensure_health_task()
+        waited_from = time.monotonic()
+        while True:
+            idle = self._idle.get(key)
+            while idle:
+                worker = idle.popleft()
+                if worker.alive:
+                    self.hits += 1
+                    self._busy.add(worker)
+                    self._replenish(key)
+                    note_queue_wait(time.monotonic() - waited_from)
+                    return worker
+                self.failed += 1
+                self._discard(worker)
+            if self._starting.get(key):
+                # A spare is booting; it is still ahead of a cold start
+                await self._changed.wait()
+                continue
+            if self._count < self.max_size or self._evict_idle():
+                break
+            await self._changed.wait()
+
+        note_queue_wait(time.monotonic() - waited_from)
+        self.misses += 1
+        self._count += 1
+        # The key may have been pruned while this call waited
+        self._specs[key] = spec
+        worker = await self._start(key)
+        self._busy.add(worker)
+        self._replenish(key)
+        return worker
+
+    def release(self, worker: CLIWorker, ok: bool = True):
+        """Return a worker after a request; failed or used-up workers are closed."""
+        self._busy.discard(worker)
+        if worker.closed:
+            # Already discarded by close()
+            return
+        if not ok or not worker.alive:
+            # Stop a response still being generated instead of waiting it out
+            self.failed += 1
+            self._discard(worker, kill=True)
+        elif self._closed or worker.requests >= self.max_requests:
+            self.recycled += 1
+            self._discard(worker)
+        else:
+            worker.idle_since = time.monotonic()
+            self._idle.setdefault(worker.key, deque()).append(worker)
+            self._notify()
+        self._prune(worker.key)
+
+    async def close(self):
+        self._closed = True
+        if self._health_task is not None:
+            self._health_task.cancel()
+        for idle in self._idle.values():
+            while idle:
+                self._discard(idle.popleft())
+        for worker in list(self._busy):
+            self._busy.discard(worker)
+            self._discard(worker)
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+
+    def stats(self) -> dict:
+        models: dict[str, dict] = {}
+        for key, idle in self._idle.items():
+            models.setdefault(key[0], {"idle": 0, "busy": 0})["idle"] += len(idle)
+        for worker in self._busy:
+            models.setdefault(worker.key[0], {"idle": 0, "busy": 0})["busy"] += 1
+        return {
+            "max_size": self.max_size,
+            "live": self._count,
+            "starting": sum(self._starting.values()),
+            "models": models,
+            "hits": self.hits,
+            "misses": self.misses,
+            "spawned": self.spawned,
+            "recycled": self.recycled,
+            "failed": self.failed,
+            "expired": self.expired,
+        }
+
+
+_pool: CLIWorkerPool | None = None
+
+
+def get_cli_pool() -> CLIWorkerPool | None:
+    """The process-wide pool, or None when CLI_POOL_MAX_SIZE is 0."""
+    global _pool
+    if _pool is None and CLI_POOL_MAX_SIZE > 0:
+        _pool = CLIWorkerPool(
+            max_size=CLI_POOL_MAX_SIZE,
+            spares=CLI_POOL_SPARES,
+            max_requests=CLI_POOL_MAX_REQUESTS,
+            idle_ttl=CLI_POOL_IDLE_TTL,
+            health_interval=CLI_POOL_HEALTH_INTERVAL,
+        )
+    return _pool
+
+
+async def close_cli_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def cli_pool_stats() -> dict:
+    return _pool.stats() if _pool is not None else {}
@@ -0,0 +1,133 @@
+from __future__ import annotations
+import asyncio
+import hashlib
+import importlib.util
+import logging
+import time
+
+from config import (
+    LLM_HTTP_MAX_CONNECTIONS, LLM_HTTP_KEEPALIVE, LLM_HTTP_KEEPALIVE_EXPIRY, LLM_CLIENT_IDLE_TTL,
+)
+
+logger = logging.getLogger("agentcsd.llm.clients")
+
+# HTTP/2 needs the optional h2 package; without it clients keep HTTP/1.1
+# keep-alive pools
+HTTP2 = importlib.util.find_spec("h2") is not None
+
+# (backend, endpoint, api key digest) -> {"client", "refs", "idle_since", "created"}
+_clients: dict[tuple, dict] = {}
+_closing: set[asyncio.Task] = set()
+
+
+def _create(backend: str, endpoint: str | None, api_key: str | None):
+    import httpx
+    limits = httpx.Limits(
+        max_connections=LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_HTTP_KEEPALIVE,
+        keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+    )
+    # SDK retries are off: ResilientAdapter retries, with the deadline in view
+    if backend == "anthropic_api":
+        import anthropic
+        return anthropic.AsyncAnthropic(
+            api_key=api_key,
+            base_url=endpoint or None,
+            max_retries=0,
+            http_client=anthropic.DefaultAsyncHttpxClient(http2=HTTP2, limits=limits),
+        )
+    if backend == "openai_compatible":
+        import openai
+        return openai.AsyncOpenAI(
+            base_url=endpoint,
+            api_key=api_key or "not-needed",
+            max_retries=0,
+            http_client=openai.DefaultAsyncHttpxClient(http2=HTTP2, limits=limits),
+        )
+    raise ValueError(f"No HTTP client for backend: {backend}")
+
+
+def _key(backend: str, endpoint: str | None, api_key: str | None) -> tuple:
+    digest = hashlib.sha256((api_key or "").encode()).hexdigest()[:16]
+    return backend, endpoint or "", digest
+
+
+def acquire_client(backend: str, endpoint: str | None, api_key: str | None):
+    """Shared SDK client for (backend, endpoint, api_key); returns (key, client).
+
+    Hand the key back to release_client() when done. A client nobody holds
+    is kept for LLM_CLIENT_IDLE_TTL seconds, so a reconnecting session or a
+    config update reuses its open connections; expired ones are closed on
+    the next acquire or release, the rest by close_clients().
+    """
+    _close_idle()
+    key = _key(backend, endpoint, api_key)
+    entry = _clients.get(key)
+    if entry is None:
+        entry = _clients[key] = {
+            "client": _create(backend, endpoint, api_key),
+            "refs": 0,
+            "idle_since": None,
+            "created": time.monotonic(),
+        }
+        logger.info("Created %s client for %s (http2=%s)", backend, endpoint or "default endpoint", HTTP2)
+    entry["refs"] += 1
+    entry["idle_since"] = None
+    return key, entry["client"]
+
+
+def release_client(key: tuple):
+    entry = _clients.get(key)
+    if entry is None:
+        return
+    entry["refs"] -= 1
+    if entry["refs"] <= 0:
+        entry["refs"] = 0
+        entry["idle_since"] = time.monotonic()
+    _close_idle()
+
+
+def _close_idle():
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return  # adapter built outside the event loop; sweep later
+    now = time.monotonic()
+    for key, entry in list(_clients.items()):
+        if entry["idle_since"] is not None and now - entry["idle_since"] >= LLM_CLIENT_IDLE_TTL:
+            del _clients[key]
+            task = loop.create_task(_close(key, entry["client"]))
+            _closing.add(task)
+            task.add_done_callback(_closing.discard)
+
+
+async def _close(key: tuple, client):
+    try:
+        await client.close()
+        logger.info("Closed %s client for %s", key[0], key[1] or "default endpoint")
+    except Exception as e:
+        logger.warning("Error closing %s client: %s", key[0], e)
+
+
+async def close_clients():
+    """Close every client; for shutdown, after sessions have stopped."""
+    entries = list(_clients.items())
+    _clients.clear()
+    await asyncio.gather(*(_close(key, entry["client"]) for key, entry in entries), *_closing)
+
+
+def client_stats() -> dict:
+    now = time.monotonic()
+    return {
+        "http2": HTTP2,
+        "clients": [
+            {
+                "backend": key[0],
+                "endpoint": key[1] or None,
+                "refs": entry["refs"],
+                "idle_s": round(now - entry["idle_since"], 1) if entry["idle_since"] is not None else None,
+                "age_s": round(now - entry["created"], 1),
+            }
+            for key, entry in _clients.items()
+        ],
+    }
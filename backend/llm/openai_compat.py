@@ -1,38 +1,87 @@
 from __future__ import annotations
+from collections import OrderedDict
 from typing import AsyncGenerator
-from llm.base import LLMAdapter
+from llm.base import LLMAdapter, SystemPrompt, prompt_text
+from llm.clients import acquire_client, release_client
+from llm.telemetry import note_usage
+
+# Server slot pinned to each owner (a session's layer), per endpoint. When
+# all slots are taken the least recently used owner gives its slot up.
+_slot_owners: dict[str, OrderedDict[str, int]] = {}
+
+
+def claim_slot(endpoint: str, slots: int, owner: str) -> int:
+    owners = _slot_owners.setdefault(endpoint, OrderedDict())
+    if owner in owners:
+        owners.move_to_end(owner)
+        return owners[owner]
+    taken = set(owners.values())
+    slot = next((i for i in range(slots) if i not in taken), None)
+    if slot is None:
+        _, slot = owners.popitem(last=False)
+    owners[owner] = slot
+    return slot
 
 
 class OpenAICompatAdapter(LLMAdapter):
     def __init__(self, model: str = "local-model",
                  endpoint: str = "http://localhost:1234/v1",
-                 api_key: str | None = None):
-        from openai import AsyncOpenAI
+                 api_key: str | None = None, slots: int = 0,
+                 slot_owner: str | None = None):
         self.model = model
-        self.client = AsyncOpenAI(
-            base_url=endpoint,
-            api_key=api_key or "not-needed",
-        )
+        self.endpoint = endpoint
+        self.slots = slots
+        self.slot_owner = slot_owner
+        self._client_key, self.client = acquire_client("openai_compatible", endpoint, api_key)
+
+    async def aclose(self):
+        if self._client_key is not None:
+            release_client(self._client_key)
+            self._client_key = None
+
+    def _cache_hints(self) -> dict | None:
+        """llama.cpp server fields keeping the prompt's KV cache in one slot."""
+        if not self.slots:
+            return None
+        hints = {"cache_prompt": True}
+        if self.slot_owner:
+            hints["id_slot"] = claim_slot(self.endpoint, self.slots, self.slot_owner)
+        return hints
 
-    async def generate(self, system_prompt: str, messages: list[dict],
+    async def generate(self, system_prompt: SystemPrompt, messages: list[dict],
                        max_tokens: int = 4096) -> str:
-        full_messages = [{"role": "system", "content": system_prompt}] + messages
+        full_messages = [{"role": "system", "content": prompt_text(system_prompt)}] + messages
         response = await self.client.chat.completions.create(
             model=self.model,
             messages=full_messages,
             max_tokens=max_tokens,
+            extra_body=self._cache_hints(),
         )
+        if response.usage:
+            note_usage({
+                "input_tokens": response.usage.prompt_tokens,
+                "output_tokens": response.usage.completion_tokens,
+            })
         return response.choices[0].message.content
 
-    async def generate_stream(self, system_prompt: str, messages: list[dict],
+    async def generate_stream(self, system_prompt: SystemPrompt, messages: list[dict],
                               max_tokens: int = 4096) -> AsyncGenerator[str, None]:
-        full_messages = [{"role": "system", "content": system_prompt}] + messages
+        full_messages = [{"role": "system", "content": prompt_text(system_prompt)}] + messages
         stream = await self.client.chat.completions.create(
             model=self.model,
             messages=full_messages,
             max_tokens=max_tokens,
             stream=True,
+            extra_body=self._cache_hints(),
         )
-        async for chunk in stream:
-            if chunk.choices and chunk.choices[0].delta.content:
-                yield chunk.choices[0].delta.content
+        # Closing the response when our consumer stops early aborts generation
+        async with stream:
+            async for chunk in stream:
+                # Servers that report usage on streams send it with the last chunk
+                if getattr(chunk, "usage", None):
+                    note_usage({
+                        "input_tokens": chunk.usage.prompt_tokens,
+                        "output_tokens": chunk.usage.completion_tokens,
+                    })
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
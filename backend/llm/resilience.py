@@ -0,0 +1,357 @@
+from __future__ import annotations
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import AsyncGenerator, Awaitable, Callable
+
+from config import (
+    LLM_RETRIES, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY,
+    LLM_HEDGE_PURPOSES, LLM_HEDGE_PERCENTILE, LLM_HEDGE_MIN_SAMPLES, LLM_HEDGE_MIN_DELAY,
+    LLM_HEDGE_WINDOW, LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN,
+)
+from llm.base import LLMAdapter, SystemPrompt
+from llm.telemetry import current_call_context, queue_listener
+
+logger = logging.getLogger("agentcsd.llm.resilience")
+
+# Provider errors worth another attempt: rate limits, overload, server
+# errors and dropped connections. SDK errors are matched by name and
+# status so neither SDK has to be importable here.
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+RETRYABLE_NAMES = {"APIConnectionError", "APITimeoutError", "RateLimitError",
+                   "InternalServerError", "OverloadedError"}
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    if type(error).__name__ in RETRYABLE_NAMES:
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS
+
+
+def is_rejection(error: BaseException) -> bool:
+    """A request the backend refused (4xx): the request is at fault, not the backend."""
+    status = getattr(error, "status_code", None)
+    return isinstance(status, int) and 400 <= status < 500 and status not in RETRYABLE_STATUS
+
+
+class CircuitBreaker:
+    """Opens after ``failures`` consecutive failed calls; after ``cooldown``
+    seconds one probe call is let through and its outcome closes or reopens it."""
+
+    def __init__(self, name: str, failures: int = LLM_BREAKER_FAILURES,
+                 cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.name = name
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = STATE_CLOSED
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self.opened = 0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == STATE_CLOSED:
+            return True
+        if self.state == STATE_OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = STATE_HALF_OPEN
+        if self.state == STATE_HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record(self, ok: bool | None):
+        """Outcome of an allowed call; None when it was cancelled and says nothing."""
+        self._probing = False
+        if ok is None:
+            return
+        if ok:
+            if self.state != STATE_CLOSED:
+                logger.info("Circuit %s closed", self.name)
+            self.state = STATE_CLOSED
+            self.consecutive = 0
+            return
+        self.consecutive += 1
+        if self.state == STATE_HALF_OPEN or self.consecutive >= self.failures:
+            if self.state != STATE_OPEN:
+                logger.warning("Circuit %s opened after %d failures", self.name, self.consecutive)
+                self.opened += 1
+            self.state = STATE_OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.consecutive, "opened": self.opened}
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+# Recent latencies (time to first chunk for streams) of successful calls,
+# per (backend key, model, "generate"|"stream"), for the hedge delay
+_latencies: dict[tuple, deque[float]] = {}
+_counters = {"retries": 0, "hedges": 0, "hedge_wins": 0, "fallbacks": 0, "deadlines": 0}
+
+
+def get_breaker(key: str) -> CircuitBreaker:
+    breaker = _breakers.get(key)
+    if breaker is None:
+        breaker = _breakers[key] = CircuitBreaker(key)
+    return breaker
+
+
+def resilience_stats() -> dict:
+    return {
+        "breakers": {key: b.stats() for key, b in _breakers.items()},
+        **_counters,
+    }
+
+
+def _hedge_delay(key: tuple) -> float | None:
+    if current_call_context().get("purpose") not in LLM_HEDGE_PURPOSES:
+        return None
+    samples = _latencies.get(key)
+    if not samples or len(samples) < LLM_HEDGE_MIN_SAMPLES:
+        return None
+    ordered = sorted(samples)
+    value = ordered[min(len(ordered) - 1, int(len(ordered) * LLM_HEDGE_PERCENTILE / 100))]
+    return max(LLM_HEDGE_MIN_DELAY, value)
+
+
+def _note_latency(key: tuple, seconds: float):
+    samples = _latencies.get(key)
+    if samples is None:
+        samples = _latencies[key] = deque(maxlen=LLM_HEDGE_WINDOW)
+    samples.append(seconds)
+
+
+async def _hedged(key: tuple, start: Callable[[], Awaitable],
+                  discard: Callable[[object], Awaitable] | None = None):
+    """Await ``start()``; if it has not finished after the hedge delay, start
+    a second attempt and return whichever succeeds first. The other is
+    cancelled (or passed to ``discard`` if it finished too)."""
+
+    async def timed():
+        began = time.perf_counter()
+        result = await start()
+        _note_latency(key, time.perf_counter() - began)
+        return result
+
+    delay = _hedge_delay(key)
+    if delay is None:
+        return await timed()
+
+    attempts = [asyncio.ensure_future(timed())]
+    winner = None
+    try:
+        done, _ = await asyncio.wait(attempts, timeout=delay)
+        if not done:
+            _counters["hedges"] += 1
+            logger.info("Hedging %s/%s after %.2fs", key[0], key[1], delay)
+            attempts.append(asyncio.ensure_future(timed()))
+        pending = set(attempts)
+        error = None
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winner = winner or task
+                else:
+                    error = task.exception()
+        if winner is None:
+            raise error
+        if winner is not attempts[0]:
+            _counters["hedge_wins"] += 1
+        return winner.result()
+    finally:
+        losers = [task for task in attempts if task is not winner]
+        for task in losers:
+            task.cancel()
+        await asyncio.gather(*losers, return_exceptions=True)
+        if discard is not None:
+            for task in losers:
+                if not task.cancelled() and task.exception() is None:
+                    await discard(task.result())
+
+
+class _Deadline:
+    """One call's deadline, stopped while the call waits for a scheduler
+    slot: local queueing says nothing about the backend."""
+
+    def __init__(self, seconds: float | None):
+        self.loop = asyncio.get_running_loop()
+        self.when = self.loop.time() + seconds if seconds is not None else None
+        self.queueing = 0
+        self.breaker: CircuitBreaker | None = None  # of the backend the call went to
+        self._paused_at = 0.0
+        self._timeouts: set[asyncio.Timeout] = set()
+
+    def _queued(self, delta: int):
+        self.queueing += delta
+        if self.when is None:
+            return
+        if delta > 0 and self.queueing == 1:
+            self._paused_at = self.loop.time()
+            when = None
+        elif delta < 0 and self.queueing == 0:
+            self.when += self.loop.time() - self._paused_at
+            when = self.when
+        else:
+            return
+        for timeout in self._timeouts:
+            if not timeout.expired():
+                timeout.reschedule(when)
+
+    async def run(self, awaitable: Awaitable):
+        """Await ``awaitable`` within the deadline; True in ``expired`` when it fired."""
+        timeout = asyncio.timeout_at(None if self.queueing else self.when)
+        self._timeouts.add(timeout)
+        try:
+            with queue_listener(self._queued):
+                async with timeout:
+                    return await awaitable
+        except TimeoutError:
+            if timeout.expired():
+                raise _DeadlineExpired from None
+            raise
+        finally:
+            self._timeouts.discard(timeout)
+
+
+class _DeadlineExpired(Exception):
+    pass
+
+
+async def _first_chunk(adapter: LLMAdapter, system_prompt: SystemPrompt,
+                       messages: list[dict], max_tokens: int) -> tuple[AsyncGenerator, str | None]:
+    """Open a stream and wait for its first chunk (None if it is empty)."""
+    chunks = adapter.generate_stream(system_prompt, messages, max_tokens)
+    try:
+        return chunks, await chunks.__anext__()
+    except StopAsyncIteration:
+        return chunks, None
+    except BaseException:
+        await chunks.aclose()
+        raise
+
+
+async def _close_stream(opened: tuple[AsyncGenerator, str | None]):
+    await opened[0].aclose()
+
+
+class ResilientAdapter(LLMAdapter):
+    """Deadline, hedging, retries and circuit breaking around an adapter.
+
+    - The whole call, retries included, must finish within ``deadline``
+      seconds (streams: each chunk must arrive before it). Time spent
+      waiting for a scheduler slot is not counted.
+    - For latency-sensitive purposes (LLM_HEDGE_PURPOSES) a second request
+      is sent once the first has run longer than the backend's recent p95;
+      the first to answer wins. Streams are hedged on the first chunk.
+    - Retryable errors are retried with full jitter, streams only before
+      their first chunk.
+    - While the backend's circuit is open, calls go to ``fallback``.
+    """
+
+    def __init__(self, primary: LLMAdapter, breaker_key: str, model: str,
+                 fallback: LLMAdapter | None = None, fallback_key: str | None = None,
+                 fallback_model: str = "", deadline: float | None = None):
+        self.targets = [(primary, breaker_key, model)]
+        if fallback is not None:
+            self.targets.append((fallback, fallback_key or f"{breaker_key}:fallback", fallback_model))
+        self.deadline = deadline
+
+    def prewarm(self, system_prompt: SystemPrompt):
+        self.targets[0][0].prewarm(system_prompt)
+
+    async def aclose(self):
+        for adapter, _, _ in self.targets:
+            await adapter.aclose()
+
+    def _route(self) -> tuple[LLMAdapter, CircuitBreaker, str]:
+        for i, (adapter, key, model) in enumerate(self.targets):
+            breaker = get_breaker(key)
+            if breaker.allow():
+                if i:
+                    _counters["fallbacks"] += 1
+                return adapter, breaker, model
+        raise CircuitOpenError(f"Circuit open for {self.targets[0][1]} and no fallback available")
+
+    async def _attempts(self, call: Callable[[LLMAdapter, tuple], Awaitable], kind: str,
+                        deadline: _Deadline):
+        attempt = 0
+        while True:
+            adapter, breaker, model = self._route()
+            deadline.breaker = breaker
+            try:
+                result = await call(adapter, (breaker.name, model, kind))
+            except asyncio.CancelledError:
+                breaker.record(None)
+                raise
+            except Exception as e:
+                # Only backend and transport failures count against the circuit
+                breaker.record(None if is_rejection(e) else False)
+                if attempt >= LLM_RETRIES or not is_retryable(e):
+                    raise
+                attempt += 1
+                _counters["retries"] += 1
+                delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+                logger.warning("LLM call failed (%s: %s), retry %d in %.1fs",
+                               type(e).__name__, e, attempt, delay)
+                await asyncio.sleep(delay)
+                continue
+            breaker.record(True)
+            return result
+
+    def _expired(self, deadline: _Deadline) -> TimeoutError:
+        # A backend that blows the deadline counts against its circuit; a
+        # call still waiting in the scheduler queue was never sent
+        if not deadline.queueing and deadline.breaker is not None:
+            deadline.breaker.record(False)
+        _counters["deadlines"] += 1
+        return TimeoutError(f"LLM call exceeded its {self.deadline:g}s deadline")
+
+    async def generate(self, system_prompt: SystemPrompt, messages: list[dict],
+                       max_tokens: int = 4096) -> str:
+        async def call(adapter: LLMAdapter, key: tuple):
+            return await _hedged(key, lambda: adapter.generate(system_prompt, messages, max_tokens))
+
+        deadline = _Deadline(self.deadline)
+        try:
+            return await deadline.run(self._attempts(call, "generate", deadline))
+        except _DeadlineExpired:
+            raise self._expired(deadline) from None
+
+    async def generate_stream(self, system_prompt: SystemPrompt, messages: list[dict],
+                              max_tokens: int = 4096) -> AsyncGenerator[str, None]:
+        deadline = _Deadline(self.deadline)
+
+        async def call(adapter: LLMAdapter, key: tuple):
+            return await _hedged(key, lambda: _first_chunk(adapter, system_prompt, messages, max_tokens),
+                                 _close_stream)
+
+        async def within_deadline(awaitable: Awaitable):
+            # Scoped to one await: the deadline must not fire while our consumer runs
+            try:
+                return await deadline.run(awaitable)
+            except _DeadlineExpired:
+                raise self._expired(deadline) from None
+
+        chunks, chunk = await within_deadline(self._attempts(call, "stream", deadline))
+        try:
+            while chunk is not None:
+                yield chunk
+                try:
+                    chunk = await within_deadline(chunks.__anext__())
+                except StopAsyncIteration:
+                    chunk = None
+        finally:
+            await chunks.aclose()
@@ -0,0 +1,268 @@
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import AsyncGenerator
+
+from config import LLM_SCHEDULER_LIMITS, LLM_SCHEDULER_DEFAULT_LIMIT
+from llm.base import LLMAdapter, SystemPrompt, prompt_text
+from llm.telemetry import CHARS_PER_TOKEN, current_call_context, current_usage, note_queue_wait, queueing
+
+logger = logging.getLogger("agentcsd.llm.scheduler")
+
+# Priority classes by call purpose (see llm.telemetry.llm_call_context),
+# most urgent first. Calls without a known purpose rank with subconscious cycles.
+PRIORITIES = ("user_turn", "s_loud", "cycle", "summary")
+_DEFAULT_PRIORITY = PRIORITIES.index("cycle")
+
+TPM_WINDOW = 60.0
+
+
+class BackendQueue:
+    """Admission control for one backend: a concurrency limit, an optional
+    tokens-per-minute budget and strict priority classes.
+
+    Within a class, sessions take turns (round robin over per-session FIFO
+    queues), so one busy session cannot hold back the others. A call
+    reserves its estimated tokens when admitted; the reservation is settled
+    to the reported usage when it finishes.
+    """
+
+    def __init__(self, name: str, concurrency: int, tpm: int | None = None):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.tpm = tpm
+        self.running = 0
+        # One OrderedDict of session -> FIFO of waiters per priority class
+        self._waiting: list[OrderedDict[str, deque[dict]]] = [OrderedDict() for _ in PRIORITIES]
+        self._window: deque[list] = deque()  # [admitted_at, tokens]
+        self._window_tokens = 0
+        self._timer: asyncio.TimerHandle | None = None
+        self.admitted = 0
+        self.max_wait = 0.0
+
+    # --- Token window ---
+
+    def _trim_window(self, now: float):
+        while self._window and now - self._window[0][0] >= TPM_WINDOW:
+            self._window_tokens -= self._window.popleft()[1]
+
+    def _fits(self, tokens: int, now: float) -> bool:
+        if not self.tpm:
+            return True
+        self._trim_window(now)
+        # A call larger than the whole budget still runs, alone
+        return self._window_tokens + tokens <= self.tpm or (not self._window and not self.running)
+
+    def _retry_after(self, now: float):
+        if self._timer is not None or not self._window:
+            return
+        delay = max(0.0, TPM_WINDOW - (now - self._window[0][0])) + 0.01
+        self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    # --- Admission ---
+
+    def _admit(self, tokens: int, now: float) -> list:
+        self.running += 1
+        self.admitted += 1
+        entry = [now, tokens]
+        if self.tpm:
+            self._window.append(entry)
+            self._window_tokens += tokens
+        return entry
+
+    def _next_waiter(self) -> dict | None:
+        for sessions in self._waiting:
+            while sessions:
+                session, queue = next(iter(sessions.items()))
+                waiter = queue.popleft()
+                if queue:
+                    sessions.move_to_end(session)
+                else:
+                    del sessions[session]
+                if not waiter["future"].cancelled():
+                    return waiter
+        return None
+
+    def _peek_waiter(self) -> dict | None:
+        for sessions in self._waiting:
+            for queue in sessions.values():
+                for waiter in queue:
+                    if not waiter["future"].cancelled():
+                        return waiter
+        return None
+
+    def _dispatch(self):
+        now = time.monotonic()
+        while self.running < self.concurrency:
+            head = self._peek_waiter()
+            if head is None:
+                return
+            if not self._fits(head["tokens"], now):
+                self._retry_after(now)
+                return
+            waiter = self._next_waiter()
+            waiter["future"].set_result(self._admit(waiter["tokens"], now))
+
+    def _forget(self, sessions: OrderedDict[str, deque[dict]], session: str, waiter: dict):
+        queue = sessions.get(session)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del sessions[session]
+        # The head may have been the one blocking on the token budget
+        self._dispatch()
+
+    def _has_waiters(self) -> bool:
+        return self._peek_waiter() is not None
+
+    async def acquire(self, priority: int, session: str, tokens: int) -> list:
+        """Wait for a slot; returns a ticket for release()."""
+        now = time.monotonic()
+        if self.running < self.concurrency and not self._has_waiters() and self._fits(tokens, now):
+            return self._admit(tokens, now)
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = {"future": future, "tokens": tokens}
+        sessions = self._waiting[priority]
+        sessions.setdefault(session, deque()).append(waiter)
+        self._dispatch()
+        try:
+            with queueing():
+                ticket = await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as the caller gave up
+                self.release(future.result(), None)
+            else:
+                self._forget(sessions, session, waiter)
+            raise
+        waited = time.monotonic() - now
+        self.max_wait = max(self.max_wait, waited)
+        note_queue_wait(waited)
+        return ticket
+
+    def release(self, ticket: list, used_tokens: int | None):
+        self.running -= 1
+        if self.tpm and used_tokens is not None:
+            # Settle the reservation to the real usage, if still in the window
+            if any(entry is ticket for entry in self._window):
+                self._window_tokens += used_tokens - ticket[1]
+            ticket[1] = used_tokens
+        self._dispatch()
+
+    def stats(self) -> dict:
+        self._trim_window(time.monotonic())
+        waiting = {}
+        for name, sessions in zip(PRIORITIES, self._waiting):
+            waiting[name] = sum(1 for q in sessions.values() for w in q if not w["future"].cancelled())
+        return {
+            "concurrency": self.concurrency,
+            "tpm": self.tpm,
+            "running": self.running,
+            "waiting": waiting,
+            "waiting_sessions": len({s for sessions in self._waiting for s in sessions}),
+            "tokens_last_minute": self._window_tokens if self.tpm else None,
+            "admitted": self.admitted,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+        }
+
+
+class LLMScheduler:
+    """Process-wide admission for LLM calls, one BackendQueue per backend."""
+
+    def __init__(self, limits: dict[str, dict] | None = None,
+                 default_limit: dict | None = None):
+        self.limits = limits or {}
+        self.default_limit = default_limit or {"concurrency": 4, "tpm": None}
+        self._queues: dict[str, BackendQueue] = {}
+
+    def queue(self, backend: str) -> BackendQueue:
+        queue = self._queues.get(backend)
+        if queue is None:
+            limit = self.limits.get(backend, self.default_limit)
+            queue = BackendQueue(backend, limit.get("concurrency", 4), limit.get("tpm"))
+            self._queues[backend] = queue
+        return queue
+
+    def stats(self) -> dict:
+        return {backend: queue.stats() for backend, queue in self._queues.items()}
+
+
+def _estimate(system_prompt: SystemPrompt, messages: list[dict], max_tokens: int) -> int:
+    chars = len(prompt_text(system_prompt)) + sum(len(m["content"]) for m in messages)
+    return chars // CHARS_PER_TOKEN + max_tokens
+
+
+def _used(usage: dict | None) -> int | None:
+    if not usage:
+        return None
+    return (usage.get("input_tokens") or 0) + (usage.get("output_tokens") or 0) \
+        + (usage.get("cache_write_tokens") or 0)
+
+
+class ScheduledAdapter(LLMAdapter):
+    """Routes an adapter's calls through the process-wide scheduler.
+
+    The priority class and session come from the caller's
+    llm_call_context(); streams hold their slot until they finish.
+    """
+
+    def __init__(self, inner: LLMAdapter, backend: str, scheduler: LLMScheduler | None = None):
+        self.inner = inner
+        self.backend = backend
+        self._scheduler = scheduler
+
+    def prewarm(self, system_prompt: SystemPrompt):
+        self.inner.prewarm(system_prompt)
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+    async def _acquire(self, system_prompt: SystemPrompt, messages: list[dict],
+                       max_tokens: int) -> tuple[BackendQueue, list]:
+        ctx = current_call_context()
+        purpose = ctx.get("purpose")
+        priority = PRIORITIES.index(purpose) if purpose in PRIORITIES else _DEFAULT_PRIORITY
+        queue = (self._scheduler or get_scheduler()).queue(self.backend)
+        ticket = await queue.acquire(priority, ctx.get("session_id") or "",
+                                     _estimate(system_prompt, messages, max_tokens))
+        return queue, ticket
+
+    async def generate(self, system_prompt: SystemPrompt, messages: list[dict],
+                       max_tokens: int = 4096) -> str:
+        queue, ticket = await self._acquire(system_prompt, messages, max_tokens)
+        try:
+            return await self.inner.generate(system_prompt, messages, max_tokens)
+        finally:
+            queue.release(ticket, _used(current_usage()))
+
+    async def generate_stream(self, system_prompt: SystemPrompt, messages: list[dict],
+                              max_tokens: int = 4096) -> AsyncGenerator[str, None]:
+        queue, ticket = await self._acquire(system_prompt, messages, max_tokens)
+        chunks = self.inner.generate_stream(system_prompt, messages, max_tokens)
+        try:
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await chunks.aclose()
+            queue.release(ticket, _used(current_usage()))
+
+
+_scheduler: LLMScheduler | None = None
+
+
+def get_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMScheduler(LLM_SCHEDULER_LIMITS, LLM_SCHEDULER_DEFAULT_LIMIT)
+    return _scheduler
+
+
+def scheduler_stats() -> dict:
+    return _scheduler.stats() if _scheduler is not None else {}
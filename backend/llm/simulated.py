@@ -0,0 +1,187 @@
+from __future__ import annotations
+import asyncio
+import logging
+import math
+import random
+import re
+from typing import AsyncGenerator
+
+from config import SIMULATED_PROFILE
+from llm.base import LLMAdapter, SystemPrompt, prompt_text
+from llm.telemetry import CHARS_PER_TOKEN, current_call_context, note_usage
+from utils.xml_parser import extract_tag
+
+logger = logging.getLogger("agentcsd.llm.simulated")
+
+MOODS = ["calm", "curious", "uneasy", "hopeful", "restless", "focused", "wistful", "guarded"]
+CRITERIA = ["honesty over comfort", "the user's long-term good", "clarity", "patience",
+            "not overpromising", "following the thread that matters"]
+THOUGHTS = [
+    "They seem to want reassurance more than information.",
+    "There is something unresolved under this question.",
+    "I should slow down and check what they actually asked.",
+    "This connects to what came up earlier.",
+    "I notice a pull to agree too quickly.",
+    "Worth naming the tension instead of smoothing it over.",
+]
+IMPULSES = [
+    "Ask what is really at stake for them.",
+    "Something here does not add up; look again.",
+    "Stay with the uncertainty a little longer.",
+    "Bring back the earlier point, it matters now.",
+    "Be careful, this is more personal than it looks.",
+]
+NOTES = [
+    "Pattern: the same worry returns in different words.",
+    "The conversation is drifting from its starting point.",
+    "Energy dropped after the last reply.",
+    "No new input; holding the previous thread.",
+]
+
+NO_EXTERNAL_OUTPUT = "[NO_EXTERNAL_OUTPUT]"  # as in layers.internal_dialog
+
+TEMPLATES = {
+    "internal": "<ID_quiet>{thought}</ID_quiet>\n<ID_loud>{reply}</ID_loud>",
+    "subconscious": (
+        "<S_quiet>{note}</S_quiet>\n<S_loud>{impulse}</S_loud>\n"
+        "<M_AND_C><mood>{mood}</mood><criteria>{criteria}</criteria></M_AND_C>\n"
+        "<trigger>{trigger}</trigger>"
+    ),
+    "summary": "{summary}",
+}
+
+
+class SimulatedAPIError(RuntimeError):
+    """Injected provider failure; status 529 (overloaded) makes it retryable."""
+    status_code = 529
+
+
+def _lognormal(rng: random.Random, spec: dict) -> float:
+    return rng.lognormvariate(math.log(spec["median"]), spec.get("sigma", 0.0))
+
+
+class SimulatedAdapter(LLMAdapter):
+    """Offline backend producing well-formed layer output on a timing profile.
+
+    The profile (SIMULATED_PROFILE, overridden by the model config's
+    ``simulation``) sets lognormal time to first token and tokens/sec, the
+    rates of injected errors, hangs and malformed XML, and an optional seed
+    for reproducible runs. Output follows TEMPLATES for the layer the
+    adapter serves (``layer``, else the caller's llm_call_context()); the
+    profile's ``templates`` can replace them.
+    """
+
+    def __init__(self, model: str = "simulated", layer: str | None = None,
+                 profile: dict | None = None):
+        self.model = model
+        self.layer = layer
+        self.profile = {**SIMULATED_PROFILE, **(profile or {})}
+        self.templates = {**TEMPLATES, **(self.profile.get("templates") or {})}
+        self.rng = random.Random(self.profile.get("seed"))
+        self.calls = 0
+
+    # --- Output ---
+
+    def _kind(self, system_prompt: SystemPrompt) -> str:
+        ctx = current_call_context()
+        if ctx.get("purpose") == "summary":
+            return "summary"
+        layer = self.layer or ctx.get("layer")
+        if layer in ("internal", "subconscious"):
+            return layer
+        return "internal" if "ID_loud" in prompt_text(system_prompt) else "subconscious"
+
+    def _render(self, kind: str, messages: list[dict]) -> str:
+        rng = self.rng
+        last = messages[-1]["content"] if messages else ""
+        # Echo the user's words when they are in the prompt
+        said = extract_tag(last, "ED_user") or re.sub(r"<[^>]+>", " ", last)
+        heard = " ".join(said.split()[:12])
+        reply = (NO_EXTERNAL_OUTPUT if rng.random() < self.profile["no_external_rate"]
+                 else f"Call {self.calls}: I hear you on \"{heard}\". {rng.choice(IMPULSES)}")
+        fields = {
+            "thought": rng.choice(THOUGHTS),
+            "reply": reply,
+            "note": rng.choice(NOTES),
+            "impulse": rng.choice(IMPULSES) if rng.random() >= self.profile["empty_s_loud_rate"] else "",
+            "mood": rng.choice(MOODS),
+            "criteria": rng.choice(CRITERIA),
+            "trigger": "true" if rng.random() < self.profile["trigger_rate"] else "false",
+            "summary": " ".join(rng.sample(NOTES, 2)),
+            "input": heard,
+            "call": self.calls,
+        }
+        text = self.templates[kind].format(**fields)
+        if kind != "summary" and rng.random() < self.profile["malformed_rate"]:
+            text = self._malform(text)
+        return text
+
+    def _malform(self, text: str) -> str:
+        damage = self.rng.choice(("unclosed", "untagged", "truncated"))
+        logger.debug("Simulated malformed output (%s)", damage)
+        if damage == "unclosed":
+            closing = [i for i in range(len(text)) if text.startswith("</", i)]
+            i = self.rng.choice(closing)
+            return text[:i] + text[text.index(">", i) + 1:]
+        if damage == "untagged":
+            return "".join(part.split(">")[-1] for part in text.split("<"))
+        return text[: self.rng.randint(1, max(1, len(text) - 1))]
+
+    # --- Timing and faults ---
+
+    def _fault(self) -> str | None:
+        roll = self.rng.random()
+        if roll < self.profile["error_rate"]:
+            return "error"
+        if roll < self.profile["error_rate"] + self.profile["timeout_rate"]:
+            return "hang"
+        return None
+
+    async def _inject(self, fault: str):
+        if fault == "hang":
+            # Stands in for a stuck connection; the caller's deadline ends it
+            await asyncio.sleep(self.profile["hang_seconds"])
+        raise SimulatedAPIError("Simulated backend error: overloaded")
+
+    def _tokens(self, text: str) -> list[str]:
+        return [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+
+    def _usage(self, system_prompt: SystemPrompt, messages: list[dict], tokens: int):
+        prompt = prompt_text(system_prompt) + "".join(m["content"] for m in messages)
+        note_usage({"input_tokens": len(prompt) // CHARS_PER_TOKEN + 1,
+                    "output_tokens": tokens})
+
+    def _plan(self, system_prompt: SystemPrompt, messages: list[dict], max_tokens: int):
+        self.calls += 1
+        tokens = self._tokens(self._render(self._kind(system_prompt), messages))[:max_tokens]
+        ttft = _lognormal(self.rng, self.profile["ttft_ms"]) / 1000
+        tps = max(1.0, _lognormal(self.rng, self.profile["tokens_per_sec"]))
+        fault = self._fault()
+        # Faults strike before the first token or part way through
+        fault_at = self.rng.randint(0, len(tokens)) if fault else None
+        return tokens, ttft, tps, fault, fault_at
+
+    async def generate(self, system_prompt: SystemPrompt, messages: list[dict],
+                       max_tokens: int = 4096) -> str:
+        tokens, ttft, tps, fault, fault_at = self._plan(system_prompt, messages, max_tokens)
+        if fault:
+            await asyncio.sleep(ttft + fault_at / tps)
+            await self._inject(fault)
+        await asyncio.sleep(ttft + len(tokens) / tps)
+        self._usage(system_prompt, messages, len(tokens))
+        return "".join(tokens)
+
+    async def generate_stream(self, system_prompt: SystemPrompt, messages: list[dict],
+                              max_tokens: int = 4096) -> AsyncGenerator[str, None]:
+        tokens, ttft, tps, fault, fault_at = self._plan(system_prompt, messages, max_tokens)
+        await asyncio.sleep(ttft)
+        for i, token in enumerate(tokens):
+            if i == fault_at:
+                await self._inject(fault)
+            if i:
+                await asyncio.sleep(1 / tps)
+            yield token
+        if fault and fault_at == len(tokens):
+            await self._inject(fault)
+        self._usage(system_prompt, messages, len(tokens))
+
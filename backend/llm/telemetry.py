@@ -0,0 +1,281 @@
+from __future__ import annotations
+import logging
+import time
+from asyncio import CancelledError
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncGenerator, Callable
+
+from config import LLM_PRICING
+from database import repository as db
+from llm.base import LLMAdapter, SystemPrompt, prompt_text
+from utils.xml_parser import tags_end
+
+logger = logging.getLogger("agentcsd.llm.telemetry")
+
+# Who is calling: {"session_id", "layer", "purpose", "cycle", "required_tags"}.
+# Set by the orchestrator around each call site with llm_call_context().
+_call_context: ContextVar[dict] = ContextVar("llm_call_context", default={})
+# The record of the call in progress, so code below the adapter (worker
+# pools, the scheduler) can add the time it spent waiting
+_current_call: ContextVar[dict | None] = ContextVar("llm_current_call", default=None)
+# Told by the scheduler when a call starts (+1) and stops (-1) waiting for a
+# slot; set by ResilientAdapter so queueing does not count against a deadline
+_queue_listener: ContextVar[Callable[[int], None] | None] = ContextVar("llm_queue_listener", default=None)
+
+CHARS_PER_TOKEN = 4  # rough estimate when a backend reports no usage
+
+PERCENTILES = (50, 90, 99)
+
+
+@contextmanager
+def llm_call_context(session_id: str | None = None, layer: str | None = None,
+                     purpose: str | None = None, cycle: int | None = None,
+                     required_tags: tuple[str, ...] = ()):
+    """``required_tags``: the sections the calling layer parses out of the
+    response; output after the last of them is counted as wasted."""
+    token = _call_context.set({"session_id": session_id, "layer": layer,
+                               "purpose": purpose, "cycle": cycle,
+                               "required_tags": required_tags})
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+
+def current_call_context() -> dict:
+    return _call_context.get()
+
+
+@contextmanager
+def queue_listener(listener: Callable[[int], None]):
+    token = _queue_listener.set(listener)
+    try:
+        yield
+    finally:
+        _queue_listener.reset(token)
+
+
+@contextmanager
+def queueing():
+    """Around a wait for scheduler capacity."""
+    listener = _queue_listener.get()
+    if listener is not None:
+        listener(1)
+    try:
+        yield
+    finally:
+        if listener is not None:
+            listener(-1)
+
+
+def note_queue_wait(seconds: float):
+    """Add time spent waiting for capacity to the call in progress, if any."""
+    call = _current_call.get()
+    if call is not None:
+        call["queue_ms"] += seconds * 1000
+
+
+def note_usage(usage: dict):
+    """Report the token usage of the call in progress: {"input_tokens",
+    "output_tokens", "cache_read_tokens", "cache_write_tokens", "cost_usd"},
+    the last three optional. Kept on the call's own record, so concurrent
+    calls on one adapter (a cycle and its summary, hedged attempts) do not
+    see each other's usage."""
+    call = _current_call.get()
+    if call is not None:
+        call["usage"] = usage
+
+
+def current_usage() -> dict | None:
+    """Usage reported so far by the call in progress, if any."""
+    call = _current_call.get()
+    return call["usage"] if call is not None else None
+
+
+def _estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _price(model: str) -> tuple | None:
+    """(input, output, cache read, cache write) USD per million tokens, by
+    the longest matching model prefix in LLM_PRICING."""
+    best = None
+    for prefix, prices in LLM_PRICING.items():
+        if model.startswith(prefix) and (best is None or len(prefix) > len(best[0])):
+            best = (prefix, prices)
+    return best[1] if best else None
+
+
+def _cost(model: str, call: dict, reported: float | None) -> float | None:
+    if reported is not None:
+        return reported
+    prices = _price(model)
+    if prices is None:
+        return None
+    tokens = (call["input_tokens"], call["output_tokens"],
+              call["cache_read_tokens"], call["cache_write_tokens"])
+    return sum(t * p for t, p in zip(tokens, prices)) / 1_000_000
+
+
+class InstrumentedAdapter(LLMAdapter):
+    """Wraps an adapter and records every call to ``llm_calls``.
+
+    Records latency, time to first chunk, queue wait, token usage (the
+    backend's own numbers when it reports them with note_usage(), estimated
+    from text length otherwise), cost and the error class, tagged with the caller's
+    llm_call_context(). A stream its consumer closes after all the context's
+    ``required_tags`` have closed was stopped early, not cancelled.
+    """
+
+    def __init__(self, inner: LLMAdapter, backend: str, model: str):
+        self.inner = inner
+        self.backend = backend
+        self.model = model
+
+    def prewarm(self, system_prompt: SystemPrompt):
+        self.inner.prewarm(system_prompt)
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+    def _begin(self, streamed: bool) -> dict:
+        ctx = _call_context.get()
+        call = {
+            "session_id": ctx.get("session_id"),
+            "layer": ctx.get("layer"),
+            "purpose": ctx.get("purpose"),
+            "cycle_number": ctx.get("cycle"),
+            "backend": self.backend,
+            "model": self.model,
+            "streamed": int(streamed),
+            "status": "ok",
+            "error": None,
+            "queue_ms": 0.0,
+            "ttft_ms": None,
+            "stopped_early": 0,
+            "wasted_tokens": 0,
+            "required_tags": ctx.get("required_tags") or (),
+            "usage": None,
+            "started": time.perf_counter(),
+        }
+        return call
+
+    def _finish(self, call: dict, system_prompt: SystemPrompt,
+                messages: list[dict], output: str, error: BaseException | None):
+        call["latency_ms"] = (time.perf_counter() - call.pop("started")) * 1000
+        required = call.pop("required_tags")
+        end = tags_end(output, required) if required else None
+        if end is not None:
+            call["wasted_tokens"] = _estimate_tokens(output[end:].strip())
+            if isinstance(error, GeneratorExit):
+                call["stopped_early"] = 1
+                error = None
+        if error is not None:
+            call["status"] = "cancelled" if isinstance(error, (GeneratorExit, CancelledError)) else "error"
+            call["error"] = type(error).__name__
+        usage = call.pop("usage")
+        if usage:
+            call["input_tokens"] = usage.get("input_tokens") or 0
+            call["output_tokens"] = usage.get("output_tokens") or 0
+            call["cache_read_tokens"] = usage.get("cache_read_tokens") or 0
+            call["cache_write_tokens"] = usage.get("cache_write_tokens") or 0
+            call["tokens_estimated"] = 0
+            reported_cost = usage.get("cost_usd")
+        else:
+            prompt = prompt_text(system_prompt) + "".join(m["content"] for m in messages)
+            call["input_tokens"] = _estimate_tokens(prompt)
+            call["output_tokens"] = _estimate_tokens(output)
+            call["cache_read_tokens"] = call["cache_write_tokens"] = 0
+            call["tokens_estimated"] = 1
+            reported_cost = None
+        call["cost_usd"] = _cost(self.model, call, reported_cost)
+        try:
+            db.queue_unit_nowait([db.llm_call_record(call)])
+        except Exception as e:
+            logger.warning("Could not record LLM call: %s", e)
+
+    async def generate(self, system_prompt: SystemPrompt, messages: list[dict],
+                       max_tokens: int = 4096) -> str:
+        call = self._begin(streamed=False)
+        output, error = "", None
+        token = _current_call.set(call)
+        try:
+            output = await self.inner.generate(system_prompt, messages, max_tokens)
+            return output
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _current_call.reset(token)
+            self._finish(call, system_prompt, messages, output, error)
+
+    async def generate_stream(self, system_prompt: SystemPrompt, messages: list[dict],
+                              max_tokens: int = 4096) -> AsyncGenerator[str, None]:
+        call = self._begin(streamed=True)
+        output, error = "", None
+        chunks = self.inner.generate_stream(system_prompt, messages, max_tokens)
+        try:
+            while True:
+                # Only mark the call current while the inner stream runs: a
+                # context change would otherwise leak to our consumer between chunks
+                token = _current_call.set(call)
+                try:
+                    chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    _current_call.reset(token)
+                if call["ttft_ms"] is None:
+                    call["ttft_ms"] = (time.perf_counter() - call["started"]) * 1000
+                output += chunk
+                yield chunk
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            token = _current_call.set(call)
+            try:
+                await chunks.aclose()
+            finally:
+                _current_call.reset(token)
+            self._finish(call, system_prompt, messages, output, error)
+
+
+# --- Aggregation for /api/metrics/llm ---
+
+def _percentiles(values: list[float]) -> dict:
+    if not values:
+        return {f"p{p}": None for p in PERCENTILES}
+    values = sorted(values)
+    return {f"p{p}": round(values[min(len(values) - 1, int(len(values) * p / 100))], 1)
+            for p in PERCENTILES}
+
+
+def summarize_calls(rows: list[dict], group_by: tuple[str, ...] = ("backend", "model")) -> list[dict]:
+    """Per-group call counts, latency/TTFT/queue percentiles, tokens and cost."""
+    groups: dict[tuple, list[dict]] = {}
+    for row in rows:
+        groups.setdefault(tuple(row[k] for k in group_by), []).append(row)
+    summary = []
+    for key, calls in sorted(groups.items(), key=lambda item: str(item[0])):
+        costs = [c["cost_usd"] for c in calls if c["cost_usd"] is not None]
+        summary.append({
+            **dict(zip(group_by, key)),
+            "calls": len(calls),
+            "errors": sum(1 for c in calls if c["status"] == "error"),
+            "cancelled": sum(1 for c in calls if c["status"] == "cancelled"),
+            "latency_ms": _percentiles([c["latency_ms"] for c in calls]),
+            "ttft_ms": _percentiles([c["ttft_ms"] for c in calls if c["ttft_ms"] is not None]),
+            "queue_ms": _percentiles([c["queue_ms"] for c in calls]),
+            "input_tokens": sum(c["input_tokens"] for c in calls),
+            "input_tokens_per_call": _percentiles([c["input_tokens"] for c in calls]),
+            "output_tokens": sum(c["output_tokens"] for c in calls),
+            "cache_read_tokens": sum(c["cache_read_tokens"] for c in calls),
+            "cache_write_tokens": sum(c["cache_write_tokens"] for c in calls),
+            "estimated_calls": sum(c["tokens_estimated"] for c in calls),
+            "stopped_early": sum(c["stopped_early"] for c in calls),
+            "wasted_tokens": sum(c["wasted_tokens"] for c in calls),
+            "cost_usd": round(sum(costs), 6) if costs else None,
+        })
+    return summary
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import sys
 from pathlib import Path
@@ -8,8 +9,13 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from database.repository import init_db
-from routes import sessions, persona, config_routes, ws
+from database.repository import init_db, close_db
+from database.archive import archive_loop
+from orchestrator import is_session_active
+from utils.log_writer import close_logs
+from llm.cli_pool import close_cli_pool
+from llm.clients import close_clients
+from routes import sessions, persona, config_routes, metrics, search, ws
 
 logging.basicConfig(
     level=logging.INFO,
@@ -25,9 +31,19 @@ FRONTEND_DIST = Path(__file__).resolve().parent.parent / "frontend" / "dist"
 async def lifespan(app: FastAPI):
     logger.info("Initializing database...")
     await init_db()
+    archive_task = asyncio.create_task(archive_loop(is_session_active))
     logger.info("AgentCSD started")
     yield
     logger.info("AgentCSD shutting down")
+    archive_task.cancel()
+    try:
+        await archive_task
+    except asyncio.CancelledError:
+        pass
+    await close_cli_pool()
+    await close_clients()
+    await close_logs()
+    await close_db()
 
 
 app = FastAPI(title="AgentCSD", version="1.0.0", lifespan=lifespan)
@@ -44,6 +60,8 @@ app.add_middleware(
 app.include_router(sessions.router)
 app.include_router(persona.router)
 app.include_router(config_routes.router)
+app.include_router(metrics.router)
+app.include_router(search.router)
 app.include_router(ws.router)
 
 # Serve frontend static files
@@ -59,5 +77,10 @@ if FRONTEND_DIST.exists():
 
 
 if __name__ == "__main__":
+    if "--convert-incremental-vacuum" in sys.argv[1:]:
+        # Offline step: run with the server stopped
+        from database.repository import convert_incremental_vacuum
+        asyncio.run(convert_incremental_vacuum())
+        sys.exit(0)
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
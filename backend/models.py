@@ -8,6 +8,12 @@ class ModelLayerConfig(BaseModel):
     max_tokens: int = 4096
     endpoint: Optional[str] = None
     api_key: Optional[str] = None
+    prompt_layout: str = Field("classic", pattern="^(classic|prefix_stable)$")
+    slots: int = Field(0, ge=0)  # llama.cpp server slots to pin sessions to; 0 leaves it to the server
+    deadline: Optional[float] = Field(None, gt=0)  # seconds per call; None uses LLM_DEADLINES
+    fallback: Optional["ModelLayerConfig"] = None  # used while this backend's circuit is open
+    context_budget: Optional[dict[str, int]] = None  # token budget per prompt section (config.CONTEXT_BUDGETS)
+    simulation: Optional[dict] = None  # "simulated" backend profile overrides (config.SIMULATED_PROFILE)
 
 
 class ModelConfig(BaseModel):
@@ -33,6 +39,13 @@ class SessionResponse(BaseModel):
     summary_frequency: int
     created_at: str
     updated_at: str
+    message_count: Optional[int] = None
+    external_count: Optional[int] = None
+    internal_count: Optional[int] = None
+    subconscious_count: Optional[int] = None
+    last_cycle: Optional[int] = None
+    last_mood: Optional[str] = None
+    last_activity: Optional[str] = None
 
 
 class PersonaCreate(BaseModel):
@@ -3,25 +3,76 @@ import asyncio
 import shutil
 import uuid
 import logging
+from collections import Counter
 from datetime import datetime, timezone
 from pathlib import Path
 
-from config import LOGS_DIR, PERSONAS_DIR, DEFAULT_MODEL_CONFIG, S_LOUD_BATCH_DELAY, S_LOUD_BATCH_MAX
+from config import (
+    LOGS_DIR, PERSONAS_DIR, DEFAULT_MODEL_CONFIG, S_LOUD_BATCH_DELAY, S_LOUD_BATCH_MAX, S_LOUD_PREEMPT,
+    HISTORY_PAGE_SIZE, HISTORY_PAGE_MAX, LLM_DEADLINES, CONTEXT_BUDGETS,
+)
 from database import repository as db
+from database import archive
+from layers.context_budget import ContextBudget, SUMMARY_PREFIX
 from layers.internal_dialog import InternalDialogLayer
 from layers.subconscious import SubconsciousLayer
+from layers.transcript import LAYOUT_CLASSIC
 from llm.base import LLMAdapter
 from llm.claude_cli import ClaudeCLIAdapter
 from llm.anthropic_api import AnthropicAPIAdapter
 from llm.openai_compat import OpenAICompatAdapter
-from utils.jsonl import append_jsonl
+from llm.simulated import SimulatedAdapter
+from llm.resilience import ResilientAdapter
+from llm.scheduler import ScheduledAdapter
+from llm.telemetry import InstrumentedAdapter, llm_call_context
+from utils.log_writer import append_log, drain_logs
 
 logger = logging.getLogger("agentcsd.orchestrator")
 
+# Sessions currently driven by an orchestrator in this process, counted
+# per orchestrator (two connections may drive the same session)
+_active_sessions: Counter[str] = Counter()
 
-def create_adapter(config: dict) -> LLMAdapter:
+
+def is_session_active(session_id: str) -> bool:
+    return _active_sessions[session_id] > 0
+
+
+def _release_session(session_id: str):
+    _active_sessions[session_id] -= 1
+    if _active_sessions[session_id] <= 0:
+        del _active_sessions[session_id]
+
+
+def create_adapter(config: dict, owner: str | None = None,
+                   deadline: float | None = None) -> LLMAdapter:
+    """Adapter for one layer's model config: scheduled and instrumented,
+    with a deadline, retries, hedging and a circuit breaker that switches to
+    the config's ``fallback`` model config. ``owner`` names the session
+    layer for backends that pin server-side state to it."""
+    primary, primary_key = _instrumented(config, owner)
+    fallback, fallback_key = None, None
+    if config.get("fallback"):
+        fallback, fallback_key = _instrumented(config["fallback"], owner)
+    return ResilientAdapter(
+        primary, primary_key, config.get("model", ""),
+        fallback=fallback, fallback_key=fallback_key,
+        fallback_model=(config.get("fallback") or {}).get("model", ""),
+        deadline=config.get("deadline") or deadline,
+    )
+
+
+def _instrumented(config: dict, owner: str | None) -> tuple[LLMAdapter, str]:
+    """Scheduled, instrumented backend adapter and its circuit breaker key."""
     backend = config.get("backend", "claude_code_cli")
     model = config.get("model", "")
+    scheduled = ScheduledAdapter(_create_backend(backend, model, config, owner), backend)
+    # Local servers fail independently of each other
+    breaker_key = f"{backend}:{config.get('endpoint')}" if backend == "openai_compatible" else backend
+    return InstrumentedAdapter(scheduled, backend, model), breaker_key
+
+
+def _create_backend(backend: str, model: str, config: dict, owner: str | None) -> LLMAdapter:
     if backend == "claude_code_cli":
         return ClaudeCLIAdapter(
             model=model,
@@ -33,8 +84,16 @@ def create_adapter(config: dict) -> LLMAdapter:
     elif backend == "openai_compatible":
         return OpenAICompatAdapter(
             model=model,
-            endpoint=config.get("endpoint", "http://localhost:1234/v1"),
+            endpoint=config.get("endpoint") or "http://localhost:1234/v1",
             api_key=config.get("api_key"),
+            slots=config.get("slots") or 0,
+            slot_owner=owner,
+        )
+    elif backend == "simulated":
+        return SimulatedAdapter(
+            model=model or "simulated",
+            layer=owner.rsplit(":", 1)[-1] if owner else None,
+            profile=config.get("simulation"),
         )
     else:
         raise ValueError(f"Unknown backend: {backend}")
@@ -46,6 +105,7 @@ class Orchestrator:
 
         # Session state
         self.session_id: str | None = None
+        self._held_session: str | None = None  # counted in _active_sessions
         self.persona_core: str = ""
         self.model_config: dict = DEFAULT_MODEL_CONFIG.copy()
         self.summary_frequency: int = 10
@@ -53,6 +113,9 @@ class Orchestrator:
         # Layers
         self.internal_dialog: InternalDialogLayer | None = None
         self.subconscious: SubconsciousLayer | None = None
+        # Token budgets for each layer's prompt sections
+        self._c_budget = ContextBudget(CONTEXT_BUDGETS["internal"])
+        self._s_budget = ContextBudget(CONTEXT_BUDGETS["subconscious"])
 
         # Shared state (accessed by both layers)
         self._lock = asyncio.Lock()
@@ -86,22 +149,46 @@ class Orchestrator:
 
         # S_loud batching queue
         self._pending_s_loud: list[dict] = []
+        self._inflight_s_loud: list[dict] = []  # drained, not yet answered
+        # S_loud processing in progress, and whether it is generating (the
+        # part a user message may preempt)
+        self._s_loud_run: asyncio.Task | None = None
+        self._s_loud_generating = False
         self._s_loud_queue_event = asyncio.Event()
         self._s_loud_force_drain = asyncio.Event()
 
     def _log_dir(self) -> Path:
         return LOGS_DIR / self.session_id
 
+    async def _close_layers(self):
+        """Release the layers' adapters (and their shared HTTP clients)."""
+        for layer in (self.internal_dialog, self.subconscious):
+            if layer is not None:
+                await layer.llm.aclose()
+        self.internal_dialog = None
+        self.subconscious = None
+
     def _init_layers(self):
         c_config = self.model_config.get("c_model", {})
         s_config = self.model_config.get("s_model", {})
         self.internal_dialog = InternalDialogLayer(
-            llm=create_adapter(c_config),
+            llm=create_adapter(c_config, owner=f"{self.session_id}:internal",
+                               deadline=LLM_DEADLINES.get("internal")),
             max_tokens=c_config.get("max_tokens", 4096),
+            layout=c_config.get("prompt_layout") or LAYOUT_CLASSIC,
         )
         self.subconscious = SubconsciousLayer(
-            llm=create_adapter(s_config),
+            llm=create_adapter(s_config, owner=f"{self.session_id}:subconscious",
+                               deadline=LLM_DEADLINES.get("subconscious")),
             max_tokens=s_config.get("max_tokens", 2048),
+            layout=s_config.get("prompt_layout") or LAYOUT_CLASSIC,
+        )
+        self._c_budget = ContextBudget(CONTEXT_BUDGETS["internal"], c_config.get("context_budget"))
+        self._s_budget = ContextBudget(CONTEXT_BUDGETS["subconscious"], s_config.get("context_budget"))
+        # Boot CLI workers (or similar) for the first calls while the session starts
+        self.subconscious.llm.prewarm(self.persona_core)
+        self.internal_dialog.llm.prewarm(
+            self.internal_dialog.build_system_prompt(self.current_mood, self.current_criteria)
         )
 
     async def create_session(self, name: str, persona_core_filename: str,
@@ -129,16 +216,43 @@ class Orchestrator:
         shutil.copy2(persona_path, log_dir / "persona_core_snapshot.md")
 
         # Init layers and start subconscious
-        self._init_layers()
         self._reset_state()
+        await self._close_layers()
+        self._init_layers()
+        self._hold_session(self.session_id)
         self._start_subconscious()
 
         return self.session_id
 
+    def _hold_session(self, session_id: str, counted: bool = False):
+        """Count ``session_id`` as driven by this orchestrator (``counted``:
+        already added to _active_sessions) and drop the one held before."""
+        if not counted:
+            _active_sessions[session_id] += 1
+        previous, self._held_session = self._held_session, session_id
+        if previous is not None:
+            _release_session(previous)
+
     async def resume_session(self, session_id: str) -> dict:
+        # Make queued writes from a previous connection visible to the reads below
+        await db.flush_writes()
+        # Marked active before the status is read: an archive that has not
+        # committed yet then backs off, one that has shows up as 'archived'
+        _active_sessions[session_id] += 1
+        try:
+            result = await self._resume_session(session_id)
+        except BaseException:
+            _release_session(session_id)
+            raise
+        self._hold_session(session_id, counted=True)
+        return result
+
+    async def _resume_session(self, session_id: str) -> dict:
         session = await db.get_session(session_id)
         if not session:
             raise ValueError(f"Session not found: {session_id}")
+        if session["status"] == "archived":
+            await archive.restore_session(session_id)
 
         self.session_id = session_id
         self.model_config = session["model_config"]
@@ -155,10 +269,16 @@ class Orchestrator:
             else:
                 raise FileNotFoundError("Persona core not found")
 
-        # Load history from DB
-        await self._load_history()
+        # Restore state: one checkpoint lookup, or a history scan for
+        # sessions that predate checkpoints
+        checkpoint = await db.get_checkpoint(session_id)
+        if checkpoint:
+            self._restore_checkpoint(checkpoint["state"])
+        else:
+            await self._load_history()
 
         # Init layers and start subconscious
+        await self._close_layers()
         self._init_layers()
         self.is_paused = False
         self._start_subconscious()
@@ -166,17 +286,33 @@ class Orchestrator:
         # Update session status
         await db.update_session(session_id, status="active")
 
-        # Build history payload for frontend
-        messages = await db.get_messages(session_id, limit=200)
+        # Build history payload for frontend: only the newest page, older
+        # pages are fetched on demand with load_history
+        page = await db.get_messages_page(session_id, limit=HISTORY_PAGE_SIZE)
         mc = await db.get_latest_mood_and_criteria(session_id)
 
         return {
             "session_id": session_id,
-            "messages": messages,
+            "messages": page["messages"],
+            "next_before": page["next_before"],
+            "has_more": page["has_more"],
             "mood_and_criteria": mc,
             "cycle": self.subconscious_cycle,
         }
 
+    async def load_history(self, before: int | None = None, after: int | None = None,
+                           limit: int = HISTORY_PAGE_SIZE, layer: str | None = None,
+                           tag: str | None = None, cycle_from: int | None = None,
+                           cycle_to: int | None = None) -> dict:
+        """Fetch one page of the active session's message history."""
+        if not self.session_id:
+            raise ValueError("No active session")
+        return await db.get_messages_page(
+            self.session_id, before_id=before, after_id=after,
+            limit=max(1, min(limit, HISTORY_PAGE_MAX)),
+            layer=layer, tag=tag, cycle_from=cycle_from, cycle_to=cycle_to,
+        )
+
     async def _load_history(self):
         self._reset_state()
         messages = await db.get_messages(self.session_id, limit=200)
@@ -216,7 +352,56 @@ class Orchestrator:
             summaries = await db.get_context_summaries(self.session_id, layer)
             if summaries:
                 latest = summaries[-1]["summary"]
-                history_list.insert(0, f"[Previous summary]: {latest}")
+                history_list.insert(0, SUMMARY_PREFIX + latest)
+
+    def _checkpoint_state(self) -> dict:
+        """Everything needed to resume exactly where this session left off."""
+        return {
+            "version": 1,
+            "cycle": self.subconscious_cycle,
+            "current_s_loud": self.current_s_loud,
+            "current_mood": self.current_mood,
+            "current_criteria": self.current_criteria,
+            "last_ed_user": self.last_ed_user,
+            "last_ed_agent": self.last_ed_agent,
+            "last_id_loud": self.last_id_loud,
+            "last_id_quiet": self.last_id_quiet,
+            "s_seen_ed_user": self._s_seen_ed_user,
+            "s_seen_ed_agent": self._s_seen_ed_agent,
+            "s_seen_id_loud": self._s_seen_id_loud,
+            "s_seen_id_quiet": self._s_seen_id_quiet,
+            "id_quiet_history": self.id_quiet_history,
+            "s_quiet_history": self.s_quiet_history,
+            "s_loud_history": self.s_loud_history,
+            # In-flight entries go first so a crash mid-processing re-queues them
+            "pending_s_loud": self._inflight_s_loud + self._pending_s_loud,
+        }
+
+    def _checkpoint_record(self) -> tuple[str, tuple]:
+        return db.checkpoint_record(
+            self.session_id, self.subconscious_cycle, self._checkpoint_state(),
+        )
+
+    def _restore_checkpoint(self, state: dict):
+        self._reset_state()
+        self.subconscious_cycle = state.get("cycle", 0)
+        self.current_s_loud = state.get("current_s_loud", "")
+        self.current_mood = state.get("current_mood", "")
+        self.current_criteria = state.get("current_criteria", "")
+        self.last_ed_user = state.get("last_ed_user", "")
+        self.last_ed_agent = state.get("last_ed_agent", "")
+        self.last_id_loud = state.get("last_id_loud", "")
+        self.last_id_quiet = state.get("last_id_quiet", "")
+        self._s_seen_ed_user = state.get("s_seen_ed_user", "")
+        self._s_seen_ed_agent = state.get("s_seen_ed_agent", "")
+        self._s_seen_id_loud = state.get("s_seen_id_loud", "")
+        self._s_seen_id_quiet = state.get("s_seen_id_quiet", "")
+        self.id_quiet_history = list(state.get("id_quiet_history", []))
+        self.s_quiet_history = list(state.get("s_quiet_history", []))
+        self.s_loud_history = list(state.get("s_loud_history", []))
+        self._pending_s_loud = list(state.get("pending_s_loud", []))
+        if self._pending_s_loud:
+            self._s_loud_queue_event.set()
 
     def _reset_state(self):
         self.current_s_loud = ""
@@ -235,6 +420,10 @@ class Orchestrator:
         self.id_quiet_history = []
         self.s_quiet_history = []
         self.s_loud_history = []
+        self._pending_s_loud = []
+        self._inflight_s_loud = []
+        self._s_loud_queue_event.clear()
+        self._s_loud_force_drain.clear()
 
     def _start_subconscious(self):
         if self._subconscious_task and not self._subconscious_task.done():
@@ -277,9 +466,17 @@ class Orchestrator:
                     await task
                 except asyncio.CancelledError:
                     pass
+        await self._close_layers()
+        await db.flush_writes()
+        if self.session_id:
+            await drain_logs(self._log_dir())
+        if self._held_session is not None:
+            _release_session(self._held_session)
+            self._held_session = None
 
     async def update_config(self, model_config: dict):
         self.model_config = model_config
+        await self._close_layers()
         self._init_layers()
         if self.session_id:
             await db.update_session(self.session_id, model_config=model_config)
@@ -291,98 +488,135 @@ class Orchestrator:
             await self.send_ws({"type": "error", "message": "No active session"})
             return
 
+        self._preempt_s_loud()
         async with self._processing_lock:
-            now = datetime.now(timezone.utc).isoformat()
-
-            # Save ED_user
-            await db.save_message(self.session_id, "external", "ED_user", content)
-            self.last_ed_user = content
-            append_jsonl(
-                self._log_dir() / "external_dialog.jsonl",
-                {"tag": "ED_user", "content": content},
-            )
-
-            # Drain any pending S_loud into this call
-            s_loud_entries = self._drain_pending_s_loud()
+            try:
+                with llm_call_context(self.session_id, "internal", "user_turn",
+                                      self.subconscious_cycle, InternalDialogLayer.REQUIRED_TAGS):
+                    await self._run_user_turn(content)
+            finally:
+                self._inflight_s_loud = []
+
+    async def _run_user_turn(self, content: str):
+        """Body of handle_user_message; runs under _processing_lock."""
+        now = datetime.now(timezone.utc).isoformat()
+
+        # Save ED_user
+        self.last_ed_user = content
+        await db.queue_unit([
+            db.message_record(self.session_id, "external", "ED_user", content),
+            self._checkpoint_record(),
+        ])
+        append_log(
+            self._log_dir() / "external_dialog.jsonl",
+            {"tag": "ED_user", "content": content},
+        )
 
-            # If no pending S_loud, include latest current_s_loud as a single entry
-            if not s_loud_entries:
-                async with self._lock:
-                    if self.current_s_loud:
-                        s_loud_entries = [{"content": self.current_s_loud,
-                                           "cycle": self.subconscious_cycle}]
+        # Drain any pending S_loud into this call; the entries count as
+        # in flight (and stay in checkpoints) until the reply is persisted
+        s_loud_entries = self._drain_pending_s_loud()
+        self._inflight_s_loud = list(s_loud_entries)
 
+        # If no pending S_loud, include latest current_s_loud as a single entry
+        if not s_loud_entries:
             async with self._lock:
-                mood = self.current_mood
-                criteria = self.current_criteria
+                if self.current_s_loud:
+                    s_loud_entries = [{"content": self.current_s_loud,
+                                       "cycle": self.subconscious_cycle}]
 
-            # Build ID_quiet history string (last N entries)
-            id_quiet_str = "\n---\n".join(self.id_quiet_history[-10:])
+        async with self._lock:
+            mood = self.current_mood
+            criteria = self.current_criteria
 
-            # Send input context to frontend (what goes into C_model)
-            await self.send_ws({
-                "type": "id_input_context",
-                "cycle": self.subconscious_cycle,
-                "ed_user": content,
-                "s_loud_entries": [{"cycle": e.get("cycle"), "content": e.get("content", "")} for e in s_loud_entries] if s_loud_entries else [],
-                "mood": mood,
-                "criteria": criteria,
-                "timestamp": now,
-            })
+        # Fit the inputs and the newest ID_quiet history into the token budgets
+        ed_user = self._c_budget.fit("user", content)
+        s_loud_entries = self._fit_s_loud(s_loud_entries)
+        id_quiet_str = self._c_budget.pack("id_quiet_history", self.id_quiet_history)
 
-            # Call Internal Dialog with streaming
-            raw_response = ""
-            async for chunk in self.internal_dialog.stream_raw(
-                ed_user=content,
-                s_loud_entries=s_loud_entries,
-                id_quiet_history=id_quiet_str,
-                mood=mood,
-                criteria=criteria,
-            ):
-                raw_response += chunk
-                await self.send_ws({
-                    "type": "ed_agent_chunk", "content": chunk, "timestamp": now,
-                })
+        # Send input context to frontend (what goes into C_model)
+        await self.send_ws({
+            "type": "id_input_context",
+            "cycle": self.subconscious_cycle,
+            "ed_user": content,
+            "s_loud_entries": [{"cycle": e.get("cycle"), "content": e.get("content", "")} for e in s_loud_entries] if s_loud_entries else [],
+            "mood": mood,
+            "criteria": criteria,
+            "context_tokens": self._c_budget.report(),
+            "timestamp": now,
+        })
+
+        # Call Internal Dialog with streaming; ID_loud text goes to the chat
+        # as it arrives, ID_quiet to the Internal panel
+        parser = self.internal_dialog.stream_parser()
+        async for pieces in self.internal_dialog.stream_parsed(
+            parser,
+            ed_user=ed_user,
+            s_loud_entries=s_loud_entries,
+            id_quiet_history=id_quiet_str,
+            mood=mood,
+            criteria=criteria,
+        ):
+            await self._send_id_stream(pieces, now, chat=True)
+
+        # Parsed while streaming
+        result = self.internal_dialog.parse_streamed(parser)
+        id_loud = result["id_loud"]
+        id_quiet = result["id_quiet"]
+
+        # Send finalized clean response
+        await self.send_ws({
+            "type": "ed_agent_done", "content": id_loud, "timestamp": now,
+        })
 
-            # Parse completed response
-            result = self.internal_dialog.parse_response(raw_response)
-            id_loud = result["id_loud"]
-            id_quiet = result["id_quiet"]
+        self.last_ed_agent = id_loud
+        self.last_id_loud = id_loud
+        self.last_id_quiet = id_quiet
+        if id_quiet:
+            self.id_quiet_history.append(id_quiet)
 
-            # Send finalized clean response
-            await self.send_ws({
-                "type": "ed_agent_done", "content": id_loud, "timestamp": now,
-            })
+        self._inflight_s_loud = []
 
-            # Persist
-            await db.save_message(self.session_id, "internal", "ID_loud", id_loud)
-            await db.save_message(self.session_id, "internal", "ID_quiet", id_quiet)
-            await db.save_message(self.session_id, "external", "ED_agent", id_loud)
+        # Persist
+        await db.queue_unit([
+            db.message_record(self.session_id, "internal", "ID_loud", id_loud),
+            db.message_record(self.session_id, "internal", "ID_quiet", id_quiet),
+            db.message_record(self.session_id, "external", "ED_agent", id_loud),
+            self._checkpoint_record(),
+        ])
 
-            self.last_ed_agent = id_loud
-            self.last_id_loud = id_loud
-            self.last_id_quiet = id_quiet
-            if id_quiet:
-                self.id_quiet_history.append(id_quiet)
-
-            # JSONL logs
-            log_dir = self._log_dir()
-            append_jsonl(log_dir / "internal_dialog.jsonl",
-                         {"tag": "ID_loud", "content": id_loud})
-            append_jsonl(log_dir / "internal_dialog.jsonl",
-                         {"tag": "ID_quiet", "content": id_quiet})
-            append_jsonl(log_dir / "external_dialog.jsonl",
-                         {"tag": "ED_agent", "content": id_loud})
-
-            # Send metadata to frontend
-            await self.send_ws({
-                "type": "id_loud", "content": id_loud,
-                "cycle": self.subconscious_cycle, "timestamp": now,
-            })
-            await self.send_ws({
-                "type": "id_quiet", "content": id_quiet,
-                "cycle": self.subconscious_cycle, "timestamp": now,
-            })
+        # JSONL logs
+        log_dir = self._log_dir()
+        append_log(log_dir / "internal_dialog.jsonl",
+                   {"tag": "ID_loud", "content": id_loud})
+        append_log(log_dir / "internal_dialog.jsonl",
+                   {"tag": "ID_quiet", "content": id_quiet})
+        append_log(log_dir / "external_dialog.jsonl",
+                   {"tag": "ED_agent", "content": id_loud})
+
+        # Send metadata to frontend
+        await self.send_ws({
+            "type": "id_loud", "content": id_loud,
+            "cycle": self.subconscious_cycle, "timestamp": now,
+        })
+        await self.send_ws({
+            "type": "id_quiet", "content": id_quiet,
+            "cycle": self.subconscious_cycle, "timestamp": now,
+        })
+
+        await db.end_cycle()
+
+    async def _send_id_stream(self, pieces: list[tuple[str | None, str]], now: str, chat: bool):
+        """Forward parsed Internal Dialog output: ID_loud to the chat when
+        ``chat``, otherwise (and ID_quiet always) to the Internal panel.
+        Text outside the tags is dropped."""
+        for tag, text in pieces:
+            if tag is None:
+                continue
+            if chat and tag == "ID_loud":
+                await self.send_ws({"type": "ed_agent_chunk", "content": text, "timestamp": now})
+            else:
+                await self.send_ws({"type": "id_processing_chunk", "tag": tag,
+                                    "content": text, "timestamp": now})
 
     def _drain_pending_s_loud(self) -> list[dict]:
         """Atomically drain the pending S_loud queue and return entries."""
@@ -432,93 +666,140 @@ class Orchestrator:
             return
 
         async with self._processing_lock:
-            now = datetime.now(timezone.utc).isoformat()
-
-            async with self._lock:
-                mood = self.current_mood
-                criteria = self.current_criteria
-
-            id_quiet_str = "\n---\n".join(self.id_quiet_history[-10:])
-
-            # Send input context to frontend (what goes into C_model from S_loud)
-            await self.send_ws({
-                "type": "id_input_context",
-                "cycle": self.subconscious_cycle,
-                "ed_user": "",
-                "s_loud_entries": [{"cycle": e.get("cycle"), "content": e.get("content", "")} for e in entries],
-                "mood": mood,
-                "criteria": criteria,
-                "timestamp": now,
-            })
+            # Own task, so a user message can cancel it without stopping the loop
+            with llm_call_context(self.session_id, "internal", "s_loud",
+                                  self.subconscious_cycle, InternalDialogLayer.REQUIRED_TAGS):
+                self._s_loud_run = asyncio.create_task(self._run_internal_from_s_loud(entries))
+            try:
+                await self._s_loud_run
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    raise  # the loop itself is stopping
+                # Preempted: the entries go back to the front of the queue,
+                # where the waiting user turn picks them up
+                self._pending_s_loud[:0] = entries
+                self._s_loud_queue_event.set()
+            finally:
+                self._s_loud_run = None
+                self._inflight_s_loud = []
+
+    def _preempt_s_loud(self):
+        """Cancel S_loud processing that is still generating (S_LOUD_PREEMPT),
+        so a user turn does not wait for it; cancelling aborts the backend
+        call (HTTP stream closed, CLI process killed)."""
+        run = self._s_loud_run
+        if S_LOUD_PREEMPT and run is not None and not run.done() and self._s_loud_generating:
+            logger.info("User message preempts S_loud processing for session %s", self.session_id)
+            run.cancel()
+
+    async def _run_internal_from_s_loud(self, entries: list[dict]):
+        """Body of _process_internal_from_s_loud; runs under _processing_lock."""
+        self._inflight_s_loud = list(entries)
+        now = datetime.now(timezone.utc).isoformat()
+
+        async with self._lock:
+            mood = self.current_mood
+            criteria = self.current_criteria
+
+        s_loud_entries = self._fit_s_loud(entries)
+        id_quiet_str = self._c_budget.pack("id_quiet_history", self.id_quiet_history)
+
+        # Send input context to frontend (what goes into C_model from S_loud)
+        await self.send_ws({
+            "type": "id_input_context",
+            "cycle": self.subconscious_cycle,
+            "ed_user": "",
+            "s_loud_entries": [{"cycle": e.get("cycle"), "content": e.get("content", "")} for e in s_loud_entries],
+            "mood": mood,
+            "criteria": criteria,
+            "context_tokens": self._c_budget.report(),
+            "timestamp": now,
+        })
 
-            # Stream raw response (no streaming chunks to chat — this is internal)
-            raw_response = ""
-            async for chunk in self.internal_dialog.stream_raw(
+        # Stream the response (no streaming chunks to chat — this is internal).
+        # Until it is complete a user message may preempt it; nothing has
+        # been persisted yet
+        parser = self.internal_dialog.stream_parser()
+        self._s_loud_generating = True
+        try:
+            async for pieces in self.internal_dialog.stream_parsed(
+                parser,
                 ed_user="",
-                s_loud_entries=entries,
+                s_loud_entries=s_loud_entries,
                 id_quiet_history=id_quiet_str,
                 mood=mood,
                 criteria=criteria,
             ):
-                raw_response += chunk
                 # Stream to Internal panel only (not chat)
-                await self.send_ws({
-                    "type": "id_processing_chunk", "content": chunk, "timestamp": now,
-                })
+                await self._send_id_stream(pieces, now, chat=False)
+        finally:
+            self._s_loud_generating = False
 
-            # Parse completed response
-            result = self.internal_dialog.parse_response(raw_response)
-            id_loud = result["id_loud"]
-            id_quiet = result["id_quiet"]
-            internal_only = result["internal_only"]
+        # Parsed while streaming
+        result = self.internal_dialog.parse_streamed(parser)
+        id_loud = result["id_loud"]
+        id_quiet = result["id_quiet"]
+        internal_only = result["internal_only"]
 
-            # Only externalize to chat if there's actual content for the user
-            if id_loud and not internal_only:
-                await self.send_ws({
-                    "type": "ed_agent_done", "content": id_loud, "timestamp": now,
-                })
-                await db.save_message(self.session_id, "external", "ED_agent", id_loud,
-                                      self.subconscious_cycle)
-                self.last_ed_agent = id_loud
-                append_jsonl(self._log_dir() / "external_dialog.jsonl",
-                             {"tag": "ED_agent", "content": id_loud,
-                              "cycle_number": self.subconscious_cycle})
-
-            # Always persist ID_loud and ID_quiet
-            await db.save_message(self.session_id, "internal", "ID_loud",
-                                  id_loud or "[NO_EXTERNAL_OUTPUT]",
-                                  self.subconscious_cycle)
-            await db.save_message(self.session_id, "internal", "ID_quiet", id_quiet,
-                                  self.subconscious_cycle)
-
-            self.last_id_loud = id_loud
-            self.last_id_quiet = id_quiet
-            if id_quiet:
-                self.id_quiet_history.append(id_quiet)
-
-            # JSONL logs
-            log_dir = self._log_dir()
-            append_jsonl(log_dir / "internal_dialog.jsonl",
-                         {"tag": "ID_loud",
-                          "content": id_loud or "[NO_EXTERNAL_OUTPUT]",
-                          "internal_only": internal_only,
-                          "cycle_number": self.subconscious_cycle})
-            append_jsonl(log_dir / "internal_dialog.jsonl",
-                         {"tag": "ID_quiet", "content": id_quiet,
-                          "cycle_number": self.subconscious_cycle})
-
-            # Send metadata to frontend (with internal_only flag)
-            await self.send_ws({
-                "type": "id_loud",
-                "content": id_loud or "[NO_EXTERNAL_OUTPUT]",
-                "internal_only": internal_only or (not id_loud),
-                "cycle": self.subconscious_cycle, "timestamp": now,
-            })
+        records = []
+
+        # Only externalize to chat if there's actual content for the user
+        if id_loud and not internal_only:
             await self.send_ws({
-                "type": "id_quiet", "content": id_quiet,
-                "internal_only": True,
-                "cycle": self.subconscious_cycle, "timestamp": now,
+                "type": "ed_agent_done", "content": id_loud, "timestamp": now,
             })
+            records.append(db.message_record(
+                self.session_id, "external", "ED_agent", id_loud,
+                self.subconscious_cycle,
+            ))
+            self.last_ed_agent = id_loud
+            append_log(self._log_dir() / "external_dialog.jsonl",
+                       {"tag": "ED_agent", "content": id_loud,
+                        "cycle_number": self.subconscious_cycle})
+
+        self.last_id_loud = id_loud
+        self.last_id_quiet = id_quiet
+        if id_quiet:
+            self.id_quiet_history.append(id_quiet)
+        self._inflight_s_loud = []
+
+        # Always persist ID_loud and ID_quiet
+        records.append(db.message_record(
+            self.session_id, "internal", "ID_loud",
+            id_loud or "[NO_EXTERNAL_OUTPUT]", self.subconscious_cycle,
+        ))
+        records.append(db.message_record(
+            self.session_id, "internal", "ID_quiet", id_quiet,
+            self.subconscious_cycle,
+        ))
+        records.append(self._checkpoint_record())
+        await db.queue_unit(records)
+
+        # JSONL logs
+        log_dir = self._log_dir()
+        append_log(log_dir / "internal_dialog.jsonl",
+                   {"tag": "ID_loud",
+                    "content": id_loud or "[NO_EXTERNAL_OUTPUT]",
+                    "internal_only": internal_only,
+                    "cycle_number": self.subconscious_cycle})
+        append_log(log_dir / "internal_dialog.jsonl",
+                   {"tag": "ID_quiet", "content": id_quiet,
+                    "cycle_number": self.subconscious_cycle})
+
+        # Send metadata to frontend (with internal_only flag)
+        await self.send_ws({
+            "type": "id_loud",
+            "content": id_loud or "[NO_EXTERNAL_OUTPUT]",
+            "internal_only": internal_only or (not id_loud),
+            "cycle": self.subconscious_cycle, "timestamp": now,
+        })
+        await self.send_ws({
+            "type": "id_quiet", "content": id_quiet,
+            "internal_only": True,
+            "cycle": self.subconscious_cycle, "timestamp": now,
+        })
+
+        await db.end_cycle()
 
     # --- Subconscious loop ---
 
@@ -539,9 +820,12 @@ class Orchestrator:
                 self.subconscious_cycle += 1
                 cycle = self.subconscious_cycle
 
-                # Build inputs — only pass values that changed since last cycle
-                s_quiet_str = "\n---\n".join(self.s_quiet_history[-10:])
-                s_loud_str = "\n---\n".join(self.s_loud_history[-10:])
+                # Build inputs — only pass values that changed since last
+                # cycle, each section fitted into its token budget
+                budget = self._s_budget
+                persona_core = budget.fit("persona", self.persona_core)
+                s_quiet_str = budget.pack("s_quiet_history", self.s_quiet_history)
+                s_loud_str = budget.pack("s_loud_history", self.s_loud_history)
 
                 # Diff: only send what the subconscious hasn't seen yet
                 new_ed_user = self.last_ed_user if self.last_ed_user != self._s_seen_ed_user else ""
@@ -555,6 +839,13 @@ class Orchestrator:
                 self._s_seen_id_loud = self.last_id_loud
                 self._s_seen_id_quiet = self.last_id_quiet
 
+                s_inputs = {
+                    "ed_user": budget.fit("input", new_ed_user),
+                    "ed_agent": budget.fit("input", new_ed_agent),
+                    "id_quiet": budget.fit("input", new_id_quiet),
+                    "id_loud": budget.fit("input", new_id_loud),
+                }
+
                 now_ctx = datetime.now(timezone.utc).isoformat()
                 # Send input context to frontend (what goes into S_model)
                 await self.send_ws({
@@ -564,100 +855,36 @@ class Orchestrator:
                     "ed_agent": new_ed_agent,
                     "id_loud": new_id_loud,
                     "id_quiet": new_id_quiet,
+                    "context_tokens": budget.report(),
                     "timestamp": now_ctx,
                 })
 
-                result = await self.subconscious.process(
-                    persona_core=self.persona_core,
-                    ed_user=new_ed_user,
-                    ed_agent=new_ed_agent,
-                    id_quiet=new_id_quiet,
-                    id_loud=new_id_loud,
-                    s_quiet_history=s_quiet_str,
-                    s_loud_history=s_loud_str,
-                    cycle=cycle,
-                )
-
-                # Update shared state
-                async with self._lock:
-                    self.current_s_loud = result["s_loud"]
-                    if result["mood"]:
-                        self.current_mood = result["mood"]
-                    if result["criteria"]:
-                        self.current_criteria = result["criteria"]
-
-                # Persist
-                if result["s_loud"]:
-                    await db.save_message(
-                        self.session_id, "subconscious", "S_loud",
-                        result["s_loud"], cycle,
-                    )
-                    self.s_loud_history.append(result["s_loud"])
-
-                    # Enqueue S_loud for Internal Dialog processing
-                    self._pending_s_loud.append({
-                        "content": result["s_loud"],
-                        "cycle": cycle,
-                        "timestamp": datetime.now(timezone.utc).isoformat(),
-                    })
-                    self._s_loud_queue_event.set()
-
-                    # Force immediate drain if trigger=true or batch is full
-                    if result["trigger"]:
-                        logger.info("Spontaneous trigger at cycle %d — force drain", cycle)
-                        self._s_loud_force_drain.set()
-                    elif len(self._pending_s_loud) >= S_LOUD_BATCH_MAX:
-                        logger.info("S_loud batch full (%d) — force drain", len(self._pending_s_loud))
-                        self._s_loud_force_drain.set()
-
-                if result["s_quiet"]:
-                    await db.save_message(
-                        self.session_id, "subconscious", "S_quiet",
-                        result["s_quiet"], cycle,
-                    )
-                    self.s_quiet_history.append(result["s_quiet"])
-
-                if result["mood"] or result["criteria"]:
-                    await db.save_mood_and_criteria(
-                        self.session_id, result["mood"],
-                        result["criteria"], cycle,
-                    )
-
-                # JSONL logs
-                log_dir = self._log_dir()
-                if result["s_loud"]:
-                    append_jsonl(log_dir / "subconscious.jsonl",
-                                 {"tag": "S_loud", "content": result["s_loud"],
-                                  "cycle_number": cycle})
-                if result["s_quiet"]:
-                    append_jsonl(log_dir / "subconscious.jsonl",
-                                 {"tag": "S_quiet", "content": result["s_quiet"],
-                                  "cycle_number": cycle})
-                if result["mood"] or result["criteria"]:
-                    append_jsonl(log_dir / "mood_and_criteria.jsonl",
-                                 {"mood": result["mood"],
-                                  "criteria": result["criteria"],
-                                  "cycle_number": cycle})
-
-                now = datetime.now(timezone.utc).isoformat()
-
-                # Send to frontend
-                if result["s_loud"]:
-                    await self.send_ws({
-                        "type": "s_loud", "content": result["s_loud"],
-                        "cycle": cycle, "timestamp": now,
-                    })
-                if result["s_quiet"]:
-                    await self.send_ws({
-                        "type": "s_quiet", "content": result["s_quiet"],
-                        "cycle": cycle, "timestamp": now,
-                    })
-                if result["mood"] or result["criteria"]:
-                    await self.send_ws({
-                        "type": "m_and_c", "mood": result["mood"],
-                        "criteria": result["criteria"],
-                        "cycle": cycle, "timestamp": now,
-                    })
+                # Sections are acted on as soon as they close: S_loud is
+                # queued for the Internal Dialog and mood/criteria applied
+                # while the rest of the response is still generating
+                sections = {"records": [], "trigger": False, "done": False}
+                try:
+                    with llm_call_context(self.session_id, "subconscious", "cycle", cycle,
+                                          SubconsciousLayer.REQUIRED_TAGS):
+                        async for section, value in self.subconscious.process_stream(
+                            persona_core=persona_core,
+                            **s_inputs,
+                            s_quiet_history=s_quiet_str,
+                            s_loud_history=s_loud_str,
+                            cycle=cycle,
+                        ):
+                            if section == "result":
+                                async with self._lock:
+                                    self.current_s_loud = value["s_loud"]
+                                sections["done"] = True
+                            else:
+                                await self._apply_subconscious(section, value, cycle, sections)
+                finally:
+                    # Persist: the cycle's rows and its checkpoint commit
+                    # together, also when the response broke off after
+                    # some sections were acted on
+                    if sections["records"] or sections["done"]:
+                        await db.queue_unit(sections["records"] + [self._checkpoint_record()])
 
                 await self.send_ws({
                     "type": "status",
@@ -669,6 +896,8 @@ class Orchestrator:
                 if cycle % self.summary_frequency == 0 and cycle > 0:
                     await self._maybe_summarize(cycle)
 
+                await db.end_cycle()
+
                 backoff = 1  # Reset backoff on success
 
             except asyncio.CancelledError:
@@ -683,6 +912,82 @@ class Orchestrator:
                 await asyncio.sleep(backoff)
                 backoff = min(backoff * 2, 60)
 
+    async def _apply_subconscious(self, section: str, value, cycle: int, sections: dict):
+        """Act on one section of a subconscious response as soon as it closes.
+        ``sections`` holds the cycle's database rows ("records") and whether
+        its trigger was set ("trigger")."""
+        now = datetime.now(timezone.utc).isoformat()
+        log_dir = self._log_dir()
+        records = sections["records"]
+
+        if section == "s_loud" and value:
+            async with self._lock:
+                self.current_s_loud = value
+            records.append(db.message_record(
+                self.session_id, "subconscious", "S_loud", value, cycle,
+            ))
+            self.s_loud_history.append(value)
+
+            # Enqueue S_loud for Internal Dialog processing
+            self._pending_s_loud.append({
+                "content": value,
+                "cycle": cycle,
+                "timestamp": now,
+            })
+            self._s_loud_queue_event.set()
+
+            # Force immediate drain if trigger=true or batch is full
+            if sections["trigger"]:
+                logger.info("Spontaneous trigger at cycle %d — force drain", cycle)
+                self._s_loud_force_drain.set()
+            elif len(self._pending_s_loud) >= S_LOUD_BATCH_MAX:
+                logger.info("S_loud batch full (%d) — force drain", len(self._pending_s_loud))
+                self._s_loud_force_drain.set()
+
+            append_log(log_dir / "subconscious.jsonl",
+                       {"tag": "S_loud", "content": value, "cycle_number": cycle})
+            await self.send_ws({
+                "type": "s_loud", "content": value,
+                "cycle": cycle, "timestamp": now,
+            })
+
+        elif section == "s_quiet" and value:
+            records.append(db.message_record(
+                self.session_id, "subconscious", "S_quiet", value, cycle,
+            ))
+            self.s_quiet_history.append(value)
+            append_log(log_dir / "subconscious.jsonl",
+                       {"tag": "S_quiet", "content": value, "cycle_number": cycle})
+            await self.send_ws({
+                "type": "s_quiet", "content": value,
+                "cycle": cycle, "timestamp": now,
+            })
+
+        elif section == "m_and_c" and (value["mood"] or value["criteria"]):
+            async with self._lock:
+                if value["mood"]:
+                    self.current_mood = value["mood"]
+                if value["criteria"]:
+                    self.current_criteria = value["criteria"]
+            records.append(db.mood_and_criteria_record(
+                self.session_id, value["mood"], value["criteria"], cycle,
+            ))
+            append_log(log_dir / "mood_and_criteria.jsonl",
+                       {"mood": value["mood"], "criteria": value["criteria"],
+                        "cycle_number": cycle})
+            await self.send_ws({
+                "type": "m_and_c", "mood": value["mood"],
+                "criteria": value["criteria"],
+                "cycle": cycle, "timestamp": now,
+            })
+
+        elif section == "trigger" and value:
+            sections["trigger"] = True
+            # Usually after S_loud: drain it now if it is still waiting
+            if any(entry["cycle"] == cycle for entry in self._pending_s_loud):
+                logger.info("Spontaneous trigger at cycle %d — force drain", cycle)
+                self._s_loud_force_drain.set()
+
     async def _generate_summary(self, entries: list[str], label: str) -> str:
         """Use LLM to generate a concise summary of history entries."""
         try:
@@ -696,9 +1001,11 @@ class Orchestrator:
                 "Be factual and preserve nuance. Output only the summary paragraph."
             )
             messages = [{"role": "user", "content": combined}]
-            summary = await self.subconscious.llm.generate(
-                system_prompt, messages, max_tokens=512,
-            )
+            with llm_call_context(self.session_id, "subconscious", "summary",
+                                  self.subconscious_cycle):
+                summary = await self.subconscious.llm.generate(
+                    system_prompt, messages, max_tokens=512,
+                )
             return summary.strip()
         except Exception as e:
             logger.warning("LLM summarization failed for %s, using truncation: %s", label, e)
@@ -707,42 +1014,59 @@ class Orchestrator:
                 s[:100] for s in entries[-5:]
             )
 
+    def _fit_s_loud(self, entries: list[dict]) -> list[dict]:
+        """The newest S_loud entries that fit the internal dialog's budget."""
+        contents = self._c_budget.select("s_loud", [e.get("content", "") for e in entries])
+        return [{**e, "content": c} for e, c in zip(entries[len(entries) - len(contents):], contents)]
+
+    def _history_keep(self, budget: ContextBudget, section: str) -> int:
+        """Entries to keep unsummarized: at most 20, and no more than the
+        last prompt had room for, so overflow gets summarized."""
+        return max(1, min(20, budget.kept.get(section, 20)))
+
     async def _maybe_summarize(self, cycle: int):
         """Summarize and truncate old history entries using LLM."""
-        max_keep = 20
+        records = []
 
+        max_keep = self._history_keep(self._s_budget, "s_quiet_history")
         if len(self.s_quiet_history) > max_keep:
             old = self.s_quiet_history[:-max_keep]
             summary = await self._generate_summary(old, "S_quiet")
             if summary:
-                await db.save_context_summary(
+                records.append(db.context_summary_record(
                     self.session_id, "subconscious", summary,
                     cycle - len(old), cycle,
-                )
-                self.s_quiet_history = [f"[Previous summary]: {summary}"] + self.s_quiet_history[-max_keep:]
+                ))
+                self.s_quiet_history = [SUMMARY_PREFIX + summary] + self.s_quiet_history[-max_keep:]
             else:
                 self.s_quiet_history = self.s_quiet_history[-max_keep:]
 
+        max_keep = self._history_keep(self._s_budget, "s_loud_history")
         if len(self.s_loud_history) > max_keep:
             old = self.s_loud_history[:-max_keep]
             summary = await self._generate_summary(old, "S_loud")
             if summary:
-                await db.save_context_summary(
+                records.append(db.context_summary_record(
                     self.session_id, "subconscious_loud", summary,
                     cycle - len(old), cycle,
-                )
-                self.s_loud_history = [f"[Previous summary]: {summary}"] + self.s_loud_history[-max_keep:]
+                ))
+                self.s_loud_history = [SUMMARY_PREFIX + summary] + self.s_loud_history[-max_keep:]
             else:
                 self.s_loud_history = self.s_loud_history[-max_keep:]
 
+        max_keep = self._history_keep(self._c_budget, "id_quiet_history")
         if len(self.id_quiet_history) > max_keep:
             old = self.id_quiet_history[:-max_keep]
             summary = await self._generate_summary(old, "ID_quiet")
             if summary:
-                await db.save_context_summary(
+                records.append(db.context_summary_record(
                     self.session_id, "internal", summary,
                     cycle - len(old), cycle,
-                )
-                self.id_quiet_history = [f"[Previous summary]: {summary}"] + self.id_quiet_history[-max_keep:]
+                ))
+                self.id_quiet_history = [SUMMARY_PREFIX + summary] + self.id_quiet_history[-max_keep:]
             else:
                 self.id_quiet_history = self.id_quiet_history[-max_keep:]
+
+        if records:
+            records.append(self._checkpoint_record())
+            await db.queue_unit(records)
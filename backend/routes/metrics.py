@@ -0,0 +1,66 @@
+from fastapi import APIRouter, Query
+from config import LLM_METRICS_WINDOW
+from database import repository as db
+from llm.telemetry import summarize_calls
+from utils.log_writer import log_writer_stats
+from llm.cli_pool import cli_pool_stats
+from llm.scheduler import scheduler_stats
+from llm.resilience import resilience_stats
+from llm.clients import client_stats
+from utils.ws_coalescer import coalescer_stats
+
+router = APIRouter(prefix="/api/metrics", tags=["metrics"])
+
+
+@router.get("/db")
+async def get_db_metrics():
+    return {"pool": db.pool_stats(), "write_behind": db.writer_stats()}
+
+
+@router.get("/logs")
+async def get_log_metrics():
+    return {"log_writer": log_writer_stats()}
+
+
+@router.get("/cli-pool")
+async def get_cli_pool_metrics():
+    return {"cli_pool": cli_pool_stats()}
+
+
+@router.get("/ws")
+async def get_ws_metrics():
+    """WebSocket frames produced by sessions vs frames sent after coalescing."""
+    return {"coalescer": coalescer_stats()}
+
+
+@router.get("/clients")
+async def get_client_metrics():
+    """Shared API clients with their reference counts."""
+    return client_stats()
+
+
+@router.get("/scheduler")
+async def get_scheduler_metrics():
+    """Running calls and queue depth per backend and priority class."""
+    return {"scheduler": scheduler_stats()}
+
+
+@router.get("/resilience")
+async def get_resilience_metrics():
+    """Circuit breaker states and retry/hedge/fallback/deadline counts."""
+    return resilience_stats()
+
+
+@router.get("/llm")
+async def get_llm_metrics(window: int = Query(LLM_METRICS_WINDOW, ge=60),
+                          session_id: str | None = None):
+    """Per-call LLM telemetry over the last ``window`` seconds, as percentiles
+    per backend/model and per layer and purpose."""
+    await db.flush_writes()
+    rows = await db.get_llm_calls(window, session_id)
+    return {
+        "window": window,
+        "calls": len(rows),
+        "by_model": summarize_calls(rows, ("backend", "model")),
+        "by_purpose": summarize_calls(rows, ("layer", "purpose")),
+    }
@@ -0,0 +1,26 @@
+from typing import Literal
+
+from fastapi import APIRouter, Query
+from database import repository as db
+
+router = APIRouter(prefix="/api/search", tags=["search"])
+
+
+@router.get("")
+async def search(
+    q: str = Query(..., min_length=1),
+    session_id: str | None = None,
+    layer: str | None = None,
+    tag: str | None = None,
+    cycle_from: int | None = None,
+    cycle_to: int | None = None,
+    source: Literal["all", "messages", "summaries"] = "all",
+    limit: int = Query(20, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+):
+    """Full-text search over message content and context summaries, best matches first."""
+    return await db.search(
+        q, session_id=session_id, layer=layer, tag=tag,
+        cycle_from=cycle_from, cycle_to=cycle_to,
+        source=source, limit=limit, offset=offset,
+    )
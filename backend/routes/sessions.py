@@ -1,21 +1,93 @@
 import io
-import json
-import zipfile
+from functools import partial
+from pathlib import Path
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from fastapi.responses import StreamingResponse
 
-from config import LOGS_DIR
+from config import (
+    LOGS_DIR, HISTORY_PAGE_SIZE, HISTORY_PAGE_MAX,
+    SESSION_LIST_PAGE_SIZE, SESSION_LIST_PAGE_MAX,
+    EXPORT_CHUNK_SIZE, EXPORT_MAX_CHUNKS, EXPORT_MAX_SESSIONS,
+)
 from database import repository as db
+from database import archive
+from database.export import iter_table_ndjson
 from models import SessionResponse
-from utils.jsonl import read_jsonl
+from orchestrator import is_session_active
+from utils.jsonl import closed_segments, iter_log
+from utils.log_writer import flush_logs
+from utils.zip_stream import stream_zip
 
 router = APIRouter(prefix="/api/sessions", tags=["sessions"])
 
 
 @router.get("", response_model=list[SessionResponse])
-async def list_sessions():
-    return await db.list_sessions()
+async def list_sessions(
+    limit: int = Query(SESSION_LIST_PAGE_SIZE, ge=1, le=SESSION_LIST_PAGE_MAX),
+    offset: int = Query(0, ge=0),
+    sort: str = Query("updated_at", pattern="^(" + "|".join(db.SESSION_SORT_COLUMNS) + ")$"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    status: str | None = None,
+):
+    """A page of sessions with message counts, last cycle, mood and activity."""
+    return await db.list_sessions(limit=limit, offset=offset, sort=sort, order=order, status=status)
+
+
+def _export_entries(session_id: str, status: str, db_path: Path | None, prefix: str = ""):
+    """ZIP entries for one session; iterated in the export thread."""
+    log_dir = LOGS_DIR / session_id
+    if log_dir.exists():
+        for file_path in sorted(log_dir.iterdir()):
+            if file_path.is_file():
+                yield prefix + file_path.name, file_path
+    if db_path is None:
+        return
+    yield f"{prefix}db/sessions.ndjson", partial(iter_table_ndjson, db_path, "sessions", session_id)
+    if status == "archived" and archive.is_archived_on_disk(session_id):
+        # Hot rows are gone; the archive file already holds them as NDJSON
+        yield f"{prefix}db/{archive.archive_path(session_id).name}", archive.archive_path(session_id)
+        return
+    for table in archive.ARCHIVED_TABLES:
+        yield f"{prefix}db/{table}.ndjson", partial(iter_table_ndjson, db_path, table, session_id)
+
+
+async def _prepare_export(include_db: bool) -> Path | None:
+    await flush_logs()
+    if not include_db:
+        return None
+    await db.flush_writes()
+    return (await db.get_pool()).db_path
+
+
+@router.get("/export")
+async def export_sessions(
+    ids: str = Query(..., description="Comma-separated session ids"),
+    include_db: bool = False,
+):
+    """Export several sessions as one streamed ZIP, one folder per session."""
+    session_ids = list(dict.fromkeys(i.strip() for i in ids.split(",") if i.strip()))
+    if not session_ids:
+        raise HTTPException(400, "No session ids given")
+    if len(session_ids) > EXPORT_MAX_SESSIONS:
+        raise HTTPException(400, f"At most {EXPORT_MAX_SESSIONS} sessions per export")
+    sessions = []
+    for session_id in session_ids:
+        session = await db.get_session(session_id)
+        if not session:
+            raise HTTPException(404, f"Session not found: {session_id}")
+        sessions.append(session)
+    db_path = await _prepare_export(include_db)
+
+    def entries():
+        for s in sessions:
+            yield from _export_entries(s["id"], s["status"], db_path, prefix=f"{s['id']}/")
+
+    return StreamingResponse(
+        stream_zip(entries(), chunk_size=EXPORT_CHUNK_SIZE, max_chunks=EXPORT_MAX_CHUNKS),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="sessions.zip"'},
+    )
 
 
 @router.get("/{session_id}")
@@ -23,27 +95,53 @@ async def get_session(session_id: str):
     session = await db.get_session(session_id)
     if not session:
         raise HTTPException(404, "Session not found")
-    messages = await db.get_messages(session_id, limit=500)
+    page = await db.get_messages_page(session_id, limit=HISTORY_PAGE_SIZE)
     mc = await db.get_latest_mood_and_criteria(session_id)
-    return {"session": session, "messages": messages, "mood_and_criteria": mc}
+    return {
+        "session": session,
+        "messages": page["messages"],
+        "next_before": page["next_before"],
+        "has_more": page["has_more"],
+        "mood_and_criteria": mc,
+    }
+
+
+@router.get("/{session_id}/messages")
+async def get_session_messages(
+    session_id: str,
+    before: int | None = None,
+    after: int | None = None,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_PAGE_MAX),
+    layer: str | None = None,
+    tag: str | None = None,
+    cycle_from: int | None = None,
+    cycle_to: int | None = None,
+):
+    """Cursor-paginated message history keyed on message id."""
+    session = await db.get_session(session_id)
+    if not session:
+        raise HTTPException(404, "Session not found")
+    return await db.get_messages_page(
+        session_id, before_id=before, after_id=after, limit=limit,
+        layer=layer, tag=tag, cycle_from=cycle_from, cycle_to=cycle_to,
+    )
 
 
 @router.get("/{session_id}/export")
-async def export_session_logs(session_id: str):
-    """Export all session logs as a ZIP archive."""
+async def export_session_logs(session_id: str, include_db: bool = False):
+    """Export all session logs (and optionally its DB rows as NDJSON) as a streamed ZIP."""
     log_dir = LOGS_DIR / session_id
-    if not log_dir.exists():
+    session = await db.get_session(session_id) if include_db else None
+    if include_db and not session:
+        raise HTTPException(404, "Session not found")
+    if not include_db and not log_dir.exists():
         raise HTTPException(404, "Session logs not found")
-
-    buf = io.BytesIO()
-    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
-        for file_path in sorted(log_dir.iterdir()):
-            if file_path.is_file():
-                zf.write(file_path, file_path.name)
-    buf.seek(0)
+    db_path = await _prepare_export(include_db)
+    status = session["status"] if session else ""
 
     return StreamingResponse(
-        buf,
+        stream_zip(_export_entries(session_id, status, db_path),
+                   chunk_size=EXPORT_CHUNK_SIZE, max_chunks=EXPORT_MAX_CHUNKS),
         media_type="application/zip",
         headers={
             "Content-Disposition": f'attachment; filename="session_{session_id}.zip"'
@@ -52,8 +150,20 @@ async def export_session_logs(session_id: str):
 
 
 @router.get("/{session_id}/logs/{filename}")
-async def get_session_log(session_id: str, filename: str):
-    """Read a specific log file. JSONL files are returned as a JSON array; other files as plain text."""
+async def get_session_log(
+    session_id: str,
+    filename: str,
+    offset: int = 0,
+    limit: int | None = Query(None, ge=1),
+    cycle_from: int | None = None,
+    cycle_to: int | None = None,
+):
+    """Read a specific log file.
+
+    JSONL logs are streamed as NDJSON across all their segments; ``offset``
+    counts records (negative counts back from the end) and the cycle range
+    filters by cycle_number. Other files are returned as plain text.
+    """
     log_dir = LOGS_DIR / session_id
     file_path = log_dir / filename
 
@@ -61,13 +171,20 @@ async def get_session_log(session_id: str, filename: str):
     if not file_path.resolve().is_relative_to(log_dir.resolve()):
         raise HTTPException(400, "Invalid filename")
 
+    await flush_logs()
+    if file_path.suffix == ".jsonl":
+        if not file_path.exists() and not closed_segments(file_path):
+            raise HTTPException(404, "Log file not found")
+        # A sync generator: Starlette iterates it in a worker thread
+        return StreamingResponse(
+            iter_log(file_path, offset=offset, limit=limit,
+                     cycle_from=cycle_from, cycle_to=cycle_to),
+            media_type="application/x-ndjson",
+        )
+
     if not file_path.exists():
         raise HTTPException(404, "Log file not found")
 
-    if file_path.suffix == ".jsonl":
-        entries = read_jsonl(file_path)
-        return entries
-
     # For non-JSONL files (e.g. persona_core_snapshot.md), return as plain text
     content = file_path.read_text(encoding="utf-8")
     return StreamingResponse(
@@ -82,4 +199,30 @@ async def delete_session(session_id: str):
     if not session:
         raise HTTPException(404, "Session not found")
     await db.delete_session(session_id)
+    archive.delete_archive(session_id)
     return {"ok": True}
+
+
+@router.post("/{session_id}/archive")
+async def archive_session(session_id: str):
+    """Move a session's rows out of the hot tables into compressed cold storage."""
+    session = await db.get_session(session_id)
+    if not session:
+        raise HTTPException(404, "Session not found")
+    if is_session_active(session_id):
+        raise HTTPException(409, "Session is open in an active connection")
+    try:
+        path = await archive.archive_session(session_id, is_session_active)
+    except archive.SessionBusyError as e:
+        raise HTTPException(409, str(e))
+    return {"ok": True, "archive": path.name}
+
+
+@router.post("/{session_id}/restore")
+async def restore_session(session_id: str):
+    """Bring an archived session back into the hot tables."""
+    session = await db.get_session(session_id)
+    if not session:
+        raise HTTPException(404, "Session not found")
+    restored = await archive.restore_session(session_id)
+    return {"ok": True, "restored": restored}
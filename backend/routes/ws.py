@@ -1,23 +1,54 @@
 import json
 import logging
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from config import HISTORY_PAGE_SIZE, HISTORY_PAGE_MAX
 from orchestrator import Orchestrator
+from utils.ws_coalescer import FrameCoalescer
 
 router = APIRouter()
 logger = logging.getLogger("agentcsd.ws")
 
 
+def _int_field(msg: dict, key: str, default: int | None = None,
+               ge: int | None = None, le: int | None = None) -> int | None:
+    """An integer field of a client message, bounded like the REST routes'
+    Query(ge=..., le=...); raises ValueError on bad input."""
+    value = msg.get(key, default)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"{key} must be an integer")
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f"{key} must be an integer") from None
+    if (ge is not None and value < ge) or (le is not None and value > le):
+        raise ValueError(f"{key} must be between {ge if ge is not None else '-inf'} "
+                         f"and {le if le is not None else 'inf'}")
+    return value
+
+
+def _str_field(msg: dict, key: str) -> str | None:
+    value = msg.get(key)
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"{key} must be a string")
+    return value
+
+
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     logger.info("WebSocket connected")
 
-    async def send_ws(data: dict):
+    async def send_json(data: dict):
         try:
             await websocket.send_json(data)
         except Exception:
             pass
 
+    # Streamed chunks and status updates are merged into fewer frames
+    coalescer = FrameCoalescer(send_json)
+    send_ws = coalescer.send
     orchestrator = Orchestrator(send_ws)
 
     try:
@@ -53,6 +84,27 @@ async def websocket_endpoint(websocket: WebSocket):
                         "history": result,
                     })
 
+                elif msg_type == "load_history":
+                    try:
+                        query = {
+                            "before": _int_field(msg, "before"),
+                            "after": _int_field(msg, "after"),
+                            "limit": _int_field(msg, "limit", HISTORY_PAGE_SIZE, ge=1, le=HISTORY_PAGE_MAX),
+                            "layer": _str_field(msg, "layer"),
+                            "tag": _str_field(msg, "tag"),
+                            "cycle_from": _int_field(msg, "cycle_from"),
+                            "cycle_to": _int_field(msg, "cycle_to"),
+                        }
+                    except ValueError as e:
+                        await send_ws({"type": "error", "message": f"Invalid load_history: {e}"})
+                        continue
+                    page = await orchestrator.load_history(**query)
+                    await send_ws({
+                        "type": "history_page",
+                        "session_id": orchestrator.session_id,
+                        **page,
+                    })
+
                 elif msg_type == "user_message":
                     await orchestrator.handle_user_message(msg.get("content", ""))
 
@@ -81,3 +133,4 @@ async def websocket_endpoint(websocket: WebSocket):
         logger.info("WebSocket disconnected")
     finally:
         await orchestrator.stop()
+        await coalescer.close()
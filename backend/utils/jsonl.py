@@ -1,6 +1,21 @@
+import gzip
 import json
+import re
+from collections import deque
 from datetime import datetime, timezone
+from itertools import islice
 from pathlib import Path
+from typing import Iterator
+
+# Session logs are written in segments by utils.log_writer:
+#   subconscious.jsonl                 active segment, plain text
+#   subconscious.jsonl.idx             its sparse index
+#   subconscious.000001.jsonl.gz       closed segment, one gzip member per index block
+#   subconscious.000001.jsonl.gz.idx   its sparse index, with compressed offsets
+# Index lines are {"rec", "off", "zoff"?, "cycle", "ts"}: the global record
+# number, byte offset of that record in the (uncompressed) segment, offset of
+# the gzip member starting with it, its cycle and its timestamp. Every
+# segment's first record is indexed.
 
 
 def append_jsonl(filepath: Path, data: dict):
@@ -12,13 +27,239 @@ def append_jsonl(filepath: Path, data: dict):
 
 
 def read_jsonl(filepath: Path) -> list[dict]:
-    """Read all lines from a JSONL file."""
-    if not filepath.exists():
+    """Read all records of a (possibly segmented) JSONL log."""
+    return [json.loads(line) for line in iter_log(filepath)]
+
+
+# --- Segments and indexes ---
+
+def _split_name(path: Path) -> tuple[str, str]:
+    name = path.name
+    suffix = ".jsonl" if name.endswith(".jsonl") else path.suffix
+    return name[: len(name) - len(suffix)], suffix
+
+
+def segment_path(path: Path, seq: int, compressed: bool = False) -> Path:
+    stem, suffix = _split_name(path)
+    return path.with_name(f"{stem}.{seq:06d}{suffix}{'.gz' if compressed else ''}")
+
+
+def index_path(segment: Path) -> Path:
+    return segment.with_name(segment.name + ".idx")
+
+
+def closed_segments(path: Path) -> list[tuple[int, Path]]:
+    """(seq, file) for every closed segment of ``path``, oldest first.
+
+    A segment awaiting compression is listed as plain text until its
+    compressed copy and index are both in place.
+    """
+    stem, suffix = _split_name(path)
+    pattern = re.compile(rf"^{re.escape(stem)}\.(\d{{6}}){re.escape(suffix)}(\.gz)?$")
+    found: dict[int, Path] = {}
+    if not path.parent.exists():
         return []
-    lines = []
-    with open(filepath, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                lines.append(json.loads(line))
-    return lines
+    for p in path.parent.iterdir():
+        m = pattern.match(p.name)
+        if not m:
+            continue
+        seq = int(m.group(1))
+        if m.group(2):
+            if index_path(p).exists():
+                found[seq] = p
+        else:
+            found.setdefault(seq, p)
+    return sorted(found.items())
+
+
+def read_index(segment: Path) -> list[dict]:
+    idx = index_path(segment)
+    if not idx.exists():
+        return []
+    with open(idx, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _open_at(segment: Path, entry: dict | None):
+    """Binary line reader positioned at an index entry (or the segment start)."""
+    f = open(segment, "rb")
+    if segment.suffix == ".gz":
+        if entry is not None:
+            f.seek(entry["zoff"])
+        return gzip.GzipFile(fileobj=f, mode="rb")
+    if entry is not None:
+        f.seek(entry["off"])
+    return f
+
+
+def _record_cycle(line: bytes | str, current: int | None) -> int | None:
+    cycle = json.loads(line).get("cycle_number")
+    return current if cycle is None else cycle
+
+
+def _count_from(segment: Path, entry: dict | None) -> int:
+    with _open_at(segment, entry) as f:
+        return sum(1 for line in f if line.strip())
+
+
+def _segments(path: Path) -> list[dict]:
+    """Closed segments plus the active one, each with its index and first record number."""
+    files = [p for _, p in closed_segments(path)]
+    if path.exists():
+        files.append(path)
+    segments = []
+    for segment in files:
+        index = read_index(segment)
+        if index:
+            start = index[0]["rec"]
+        elif segments:
+            # Unindexed (empty, or written before indexing): follows on
+            start = _segment_end(segments[-1])
+        else:
+            start = 0
+        segments.append({"path": segment, "index": index, "start": start})
+    return segments
+
+
+def _segment_end(seg: dict) -> int:
+    """Record number one past the segment's last record."""
+    index = seg["index"]
+    if not index:
+        return seg["start"] + _count_from(seg["path"], None)
+    last = index[-1]
+    return last["rec"] + _count_from(seg["path"], last)
+
+
+def _entry_for(seg: dict, rec: int) -> dict | None:
+    best = None
+    for entry in seg["index"]:
+        if entry["rec"] > rec:
+            break
+        best = entry
+    return best
+
+
+def _lines_from(segments: list[dict], seg_i: int, entry: dict | None) -> Iterator[str]:
+    """Raw lines from an index entry to the end of the log."""
+    for i in range(seg_i, len(segments)):
+        seg = segments[i]
+        start_entry = entry if i == seg_i else None
+        try:
+            f = _open_at(seg["path"], start_entry)
+        except FileNotFoundError:
+            # Compressed meanwhile: same records, same index entries plus zoff
+            compressed = seg["path"].with_name(seg["path"].name + ".gz")
+            index = read_index(compressed)
+            start_entry = next((e for e in index if start_entry and e["rec"] == start_entry["rec"]), None)
+            f = _open_at(compressed, start_entry)
+        with f:
+            for line in f:
+                line = line.decode("utf-8")
+                if line.strip():
+                    yield line if line.endswith("\n") else line + "\n"
+
+
+def iter_log(path: Path, offset: int = 0, limit: int | None = None,
+             cycle_from: int | None = None, cycle_to: int | None = None) -> Iterator[str]:
+    """Yield raw NDJSON lines of a segmented log.
+
+    ``offset`` counts records from the start, or from the end when negative
+    (``-100`` is the last hundred). With a cycle range, only records from
+    those cycles are considered and ``offset``/``limit`` apply to them;
+    records without a cycle_number belong to the latest cycle before them.
+    Seeks go through the sparse indexes, so cost is bounded by the index
+    interval plus the records returned, not the log size.
+    """
+    segments = _segments(path)
+    if not segments:
+        return
+    if limit is not None and limit <= 0:
+        return
+
+    if cycle_from is None and cycle_to is None:
+        if offset < 0:
+            target = max(0, _segment_end(segments[-1]) + offset)
+        else:
+            target = offset
+        seg_i = 0
+        for i, seg in enumerate(segments):
+            if seg["start"] <= target:
+                seg_i = i
+        entry = _entry_for(segments[seg_i], target)
+        skip = target - (entry["rec"] if entry else segments[seg_i]["start"])
+        yield from islice(_lines_from(segments, seg_i, entry), skip, None if limit is None else skip + limit)
+        return
+
+    # Cycle range: start from the last indexed record of an earlier cycle
+    seg_i, entry = 0, None
+    if cycle_from is not None:
+        for i, seg in enumerate(segments):
+            for e in seg["index"]:
+                if e.get("cycle") is not None and e["cycle"] < cycle_from:
+                    seg_i, entry = i, e
+    current = entry.get("cycle") if entry else None
+
+    def matching() -> Iterator[str]:
+        nonlocal current
+        for line in _lines_from(segments, seg_i, entry):
+            current = _record_cycle(line, current)
+            if cycle_from is not None and (current is None or current < cycle_from):
+                continue
+            if cycle_to is not None and current is not None and current > cycle_to:
+                return
+            yield line
+
+    if offset < 0:
+        tail = deque(matching(), maxlen=-offset)
+        yield from islice(tail, limit)
+    else:
+        yield from islice(matching(), offset, None if limit is None else offset + limit)
+
+
+def resume_position(path: Path, every: int) -> dict:
+    """Where appending to the active segment continues: byte size, next record
+    number, first record number of the segment and the current cycle.
+
+    Records past the last index entry are scanned (at most ``every`` of them,
+    or the whole file once for a log written before indexing) and any index
+    entries they are due are appended to the sidecar.
+    """
+    index = read_index(path)
+    if index:
+        seg_start = index[0]["rec"]
+        last = index[-1]
+        rec, cycle, pos = last["rec"], last.get("cycle"), last["off"]
+    else:
+        closed = closed_segments(path)
+        if closed:
+            prev = closed[-1][1]
+            prev_index = read_index(prev)
+            seg_start = _segment_end({"path": prev, "index": prev_index,
+                                      "start": prev_index[0]["rec"] if prev_index else 0})
+        else:
+            seg_start = 0
+        rec, cycle, pos, last = seg_start, None, 0, None
+
+    new_entries = []
+    if path.exists():
+        with open(path, "rb") as f:
+            f.seek(pos)
+            for line in f:
+                if not line.strip():
+                    pos += len(line)
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = {}  # torn last line from a crash
+                if record.get("cycle_number") is not None:
+                    cycle = record["cycle_number"]
+                if every and (rec - seg_start) % every == 0 and (last is None or rec > last["rec"]):
+                    new_entries.append({"rec": rec, "off": pos, "cycle": cycle,
+                                        "ts": record.get("timestamp")})
+                pos += len(line)
+                rec += 1
+    if new_entries:
+        with open(index_path(path), "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(e) + "\n" for e in new_entries)
+    return {"size": pos, "rec": rec, "seg_start": seg_start, "cycle": cycle}
@@ -0,0 +1,408 @@
+from __future__ import annotations
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+from config import (
+    LOG_FLUSH_BYTES, LOG_FLUSH_INTERVAL, LOG_MAX_OPEN_FILES,
+    LOG_FSYNC, LOG_FSYNC_INTERVAL,
+    LOG_SEGMENT_BYTES, LOG_INDEX_EVERY, LOG_COMPRESS_LEVEL,
+)
+from utils.jsonl import closed_segments, index_path, read_index, resume_position, segment_path
+
+logger = logging.getLogger("agentcsd.logs")
+
+FSYNC_POLICIES = ("none", "interval", "always")
+
+
+class LogWriter:
+    """Background JSONL writer shared by every orchestrator in the process.
+
+    ``append()`` only serializes the record into an in-memory buffer; a
+    background task hands the buffers to a single worker thread once they
+    reach ``flush_bytes`` or ``flush_interval`` seconds after the first
+    record. The worker keeps up to ``max_open_files`` handles open (LRU), so
+    a busy session's files are not reopened on every cycle.
+
+    fsync policies:
+      - ``none``: leave write-back to the OS.
+      - ``interval``: fsync dirty files at most every ``fsync_interval`` s.
+      - ``always``: fsync every file touched by a flush before it returns.
+
+    Every ``index_every``-th record gets an entry in the file's sparse index
+    (see utils.jsonl). Once the active file passes ``segment_bytes`` it is
+    closed as a numbered segment and gzipped on a second thread, one gzip
+    member per index block so readers can seek into it.
+    """
+
+    def __init__(self, flush_bytes: int = 64 * 1024, flush_interval: float = 0.2,
+                 max_open_files: int = 64, fsync: str = "interval",
+                 fsync_interval: float = 1.0, segment_bytes: int = 64 * 1024 * 1024,
+                 index_every: int = 1000, compress_level: int = 6):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.max_open_files = max_open_files
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.segment_bytes = segment_bytes
+        self.index_every = index_every
+        self.compress_level = compress_level
+
+        # Loop-side state: per file, (line, cycle_number, timestamp) records
+        self._buffers: dict[Path, list[tuple[str, int | None, str]]] = {}
+        self._buffered_bytes = 0
+        self._has_data = asyncio.Event()
+        self._flush_now = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+        self._pending: asyncio.Future | None = None  # last batch handed to the worker
+
+        # Worker-side state; only touched from the single executor thread
+        self._executor: ThreadPoolExecutor | None = None
+        self._compressor: ThreadPoolExecutor | None = None
+        self._handles: OrderedDict[Path, object] = OrderedDict()
+        self._positions: dict[Path, dict] = {}  # see utils.jsonl.resume_position
+        self._dirty: set[Path] = set()
+        self._last_fsync = time.monotonic()
+
+        # Stats
+        self._records = 0
+        self._bytes = 0
+        self._flushes = 0
+        self._fsyncs = 0
+        self._evictions = 0
+        self._rotations = 0
+        self._last_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.running:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-writer")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Write everything still buffered, fsync and close all files."""
+        if self.running:
+            # Stopped by flag, not cancel(): on 3.11 wait_for() can swallow a
+            # cancel that races with its event being set
+            self._stopping = True
+            self._has_data.set()
+            self._flush_now.set()
+            await self._task
+            self._task = None
+            self._stopping = False
+        await self.flush()
+        if self._executor is not None:
+            await self._in_worker(self._close_files, None)
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._compressor is not None:
+            # A segment whose compression never started stays plain text and
+            # readable; it is picked up the next time its log is written
+            compressor, self._compressor = self._compressor, None
+            await asyncio.to_thread(compressor.shutdown, wait=True, cancel_futures=True)
+
+    def append(self, filepath: Path, data: dict):
+        """Queue a timestamped JSON line for ``filepath``. Never blocks."""
+        entry = {"timestamp": datetime.now(timezone.utc).isoformat(), **data}
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        if not self.running:
+            self.start()
+        self._buffers.setdefault(Path(filepath), []).append(
+            (line, data.get("cycle_number"), entry["timestamp"])
+        )
+        self._buffered_bytes += len(line)
+        self._has_data.set()
+        if self._buffered_bytes >= self.flush_bytes:
+            self._flush_now.set()
+
+    async def flush(self):
+        """Write everything buffered so far and wait for it.
+
+        Also waits for a batch another caller (usually ``_run``) already
+        handed to the worker, so nothing appended before the call is still
+        in flight when it returns.
+        """
+        buffers = self._buffers
+        if buffers:
+            self._buffers = {}
+            self._buffered_bytes = 0
+            self._has_data.clear()
+            self._flush_now.clear()
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-writer")
+            # The worker runs batches in submission order, so waiting for the
+            # latest one covers every earlier one too
+            self._pending = asyncio.get_running_loop().run_in_executor(
+                self._executor, self._write, buffers)
+        pending = self._pending
+        if pending is None:
+            return
+        try:
+            await asyncio.shield(pending)
+        finally:
+            if self._pending is pending and pending.done():
+                self._pending = None
+
+    async def drain(self, directory: Path):
+        """Flush, then fsync and close every open file under ``directory``."""
+        await self.flush()
+        if self._executor is not None:
+            await self._in_worker(self._close_files, Path(directory))
+
+    async def _in_worker(self, fn, arg):
+        # The executor is single-threaded, so batches land in submission order
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, arg)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                timeout = self.fsync_interval if self.fsync == "interval" and self._dirty else None
+                try:
+                    await asyncio.wait_for(self._has_data.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    # Idle with unsynced data: let the interval fsync catch up
+                    await self._in_worker(self._sync_due, None)
+                    continue
+                try:
+                    await asyncio.wait_for(self._flush_now.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                await self.flush()
+            except Exception as e:
+                logger.error("Log writer flush error: %s", e, exc_info=True)
+                await asyncio.sleep(0.5)
+
+    # --- Worker thread ---
+
+    def _handle(self, path: Path):
+        f = self._handles.get(path)
+        if f is not None:
+            self._handles.move_to_end(path)
+            return f
+        while len(self._handles) >= self.max_open_files:
+            # Under "interval" evicted files are left to OS write-back; an
+            # fsync per eviction would thrash when more files are hot than
+            # the cap allows
+            old_path, old = self._handles.popitem(last=False)
+            if self.fsync == "always" and old_path in self._dirty:
+                os.fsync(old.fileno())
+                self._fsyncs += 1
+            self._dirty.discard(old_path)
+            old.close()
+            self._evictions += 1
+        path.parent.mkdir(parents=True, exist_ok=True)
+        f = open(path, "ab")
+        self._handles[path] = f
+        return f
+
+    def _position(self, path: Path) -> dict:
+        pos = self._positions.get(path)
+        if pos is None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            pos = resume_position(path, self.index_every)
+            self._positions[path] = pos
+            # Segments closed by an earlier run that never got compressed
+            for _, segment in closed_segments(path):
+                if segment.suffix != ".gz":
+                    self._compress_later(segment)
+        return pos
+
+    def _write(self, buffers: dict[Path, list[tuple[str, int | None, str]]]):
+        start = time.perf_counter()
+        for path, records in buffers.items():
+            pos = self._position(path)
+            chunks = []
+            entries = []
+            for line, cycle, ts in records:
+                data = line.encode("utf-8")
+                if cycle is None:
+                    cycle = pos["cycle"]
+                pos["cycle"] = cycle
+                if self.index_every and (pos["rec"] - pos["seg_start"]) % self.index_every == 0:
+                    entries.append({"rec": pos["rec"], "off": pos["size"], "cycle": cycle, "ts": ts})
+                chunks.append(data)
+                pos["size"] += len(data)
+                pos["rec"] += 1
+                if self.segment_bytes and pos["size"] >= self.segment_bytes:
+                    self._append(path, chunks, entries)
+                    self._rotate(path, pos)
+                    chunks, entries = [], []
+            if chunks:
+                self._append(path, chunks, entries)
+        if self.fsync == "always":
+            self._sync_dirty()
+        elif self.fsync == "interval":
+            self._sync_due()
+        self._flushes += 1
+        self._last_flush_ms = (time.perf_counter() - start) * 1000
+
+    def _append(self, path: Path, chunks: list[bytes], entries: list[dict]):
+        data = b"".join(chunks)
+        f = self._handle(path)
+        f.write(data)
+        f.flush()
+        if entries:
+            with open(index_path(path), "a", encoding="utf-8") as idx:
+                idx.writelines(json.dumps(e) + "\n" for e in entries)
+        self._dirty.add(path)
+        self._records += len(chunks)
+        self._bytes += len(data)
+
+    def _rotate(self, path: Path, pos: dict):
+        """Close the active file as the next numbered segment and queue its compression."""
+        f = self._handles.pop(path, None)
+        if f is not None:
+            self._close(path, f)
+        closed = closed_segments(path)
+        segment = segment_path(path, closed[-1][0] + 1 if closed else 1)
+        os.replace(path, segment)
+        if index_path(path).exists():
+            os.replace(index_path(path), index_path(segment))
+        pos["size"] = 0
+        pos["seg_start"] = pos["rec"]
+        self._rotations += 1
+        self._compress_later(segment)
+
+    def _compress_later(self, segment: Path):
+        if self._compressor is None:
+            self._compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-compress")
+        self._compressor.submit(self._compress, segment)
+
+    def _compress(self, segment: Path):
+        try:
+            compress_segment(segment, self.compress_level)
+        except Exception as e:
+            logger.error("Compressing log segment %s failed: %s", segment, e, exc_info=True)
+
+    def _sync_due(self, _=None):
+        if self._dirty and time.monotonic() - self._last_fsync >= self.fsync_interval:
+            self._sync_dirty()
+
+    def _sync_dirty(self):
+        for path in self._dirty:
+            f = self._handles.get(path)
+            if f is not None:
+                os.fsync(f.fileno())
+                self._fsyncs += 1
+        self._dirty.clear()
+        self._last_fsync = time.monotonic()
+
+    def _close(self, path: Path, f):
+        if self.fsync != "none" and path in self._dirty:
+            os.fsync(f.fileno())
+            self._fsyncs += 1
+        self._dirty.discard(path)
+        f.close()
+
+    def _close_files(self, directory: Path | None):
+        for path in list(self._handles):
+            if directory is None or path.is_relative_to(directory):
+                self._close(path, self._handles.pop(path))
+        for path in list(self._positions):
+            if directory is None or path.is_relative_to(directory):
+                del self._positions[path]
+
+    def stats(self) -> dict:
+        return {
+            "fsync": self.fsync,
+            "buffered_bytes": self._buffered_bytes,
+            "open_files": len(self._handles),
+            "records": self._records,
+            "bytes": self._bytes,
+            "flushes": self._flushes,
+            "fsyncs": self._fsyncs,
+            "evictions": self._evictions,
+            "rotations": self._rotations,
+            "last_flush_ms": round(self._last_flush_ms, 2),
+        }
+
+
+def compress_segment(segment: Path, level: int = 6) -> Path:
+    """Gzip a closed segment, one member per index block, and index the members.
+
+    The compressed file and its index are swapped in before the plain segment
+    is removed, so readers always find one complete copy.
+    """
+    index = read_index(segment)
+    target = segment.with_name(segment.name + ".gz")
+    tmp = target.with_name(target.name + ".tmp")
+    tmp_index = index_path(target).with_name(index_path(target).name + ".tmp")
+    if not index:
+        index = [{"rec": 0, "off": 0, "cycle": None, "ts": None}]
+    ends = [e["off"] for e in index[1:]] + [None]
+    entries = []
+    with open(segment, "rb") as src, open(tmp, "wb") as dst:
+        for entry, end in zip(index, ends):
+            src.seek(entry["off"])
+            block = src.read() if end is None else src.read(end - entry["off"])
+            entries.append({**entry, "zoff": dst.tell()})
+            dst.write(gzip.compress(block, compresslevel=level, mtime=0))
+        dst.flush()
+        os.fsync(dst.fileno())
+    with open(tmp_index, "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(e) + "\n" for e in entries)
+    os.replace(tmp_index, index_path(target))
+    os.replace(tmp, target)
+    segment.unlink()
+    index_path(segment).unlink(missing_ok=True)
+    return target
+
+
+_writer: LogWriter | None = None
+
+
+def get_log_writer() -> LogWriter:
+    global _writer
+    if _writer is None:
+        _writer = LogWriter(
+            flush_bytes=LOG_FLUSH_BYTES,
+            flush_interval=LOG_FLUSH_INTERVAL,
+            max_open_files=LOG_MAX_OPEN_FILES,
+            fsync=LOG_FSYNC,
+            fsync_interval=LOG_FSYNC_INTERVAL,
+            segment_bytes=LOG_SEGMENT_BYTES,
+            index_every=LOG_INDEX_EVERY,
+            compress_level=LOG_COMPRESS_LEVEL,
+        )
+    return _writer
+
+
+def append_log(filepath: Path, data: dict):
+    """Non-blocking replacement for utils.jsonl.append_jsonl."""
+    get_log_writer().append(filepath, data)
+
+
+async def flush_logs():
+    if _writer is not None:
+        await _writer.flush()
+
+
+async def drain_logs(directory: Path):
+    if _writer is not None:
+        await _writer.drain(directory)
+
+
+async def close_logs():
+    global _writer
+    if _writer is not None:
+        await _writer.stop()
+        _writer = None
+
+
+def log_writer_stats() -> dict:
+    return _writer.stats() if _writer is not None else {}
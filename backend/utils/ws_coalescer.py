@@ -0,0 +1,163 @@
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable
+
+from config import WS_COALESCE_INTERVAL_MS, WS_COALESCE_MAX_BYTES, WS_COALESCE_MAX_QUEUE
+
+logger = logging.getLogger("agentcsd.ws")
+
+# Streamed frames whose consecutive "content" can be concatenated
+CHUNK_TYPES = frozenset({"ed_agent_chunk", "id_processing_chunk"})
+# Frames where only the latest one queued matters
+LATEST_TYPES = frozenset({"status"})
+
+_stats = {"frames_in": 0, "frames_out": 0, "chunks_merged": 0, "status_merged": 0, "send_waits": 0}
+
+
+class FrameCoalescer:
+    """Outbound frame queue for one WebSocket connection.
+
+    Consecutive chunk frames of the same stream are merged into one frame
+    until it is ``interval`` seconds old or ``max_bytes`` long; any other
+    frame queued behind it (``ed_agent_done``, ...) sends it at once, so
+    frame order is kept. A queued ``status`` frame is replaced by a newer
+    one. One writer task sends frames, so merging also absorbs bursts while
+    the socket is slow. Once ``max_queue`` frames are waiting, ``send()``
+    waits for the writer to make room, unless the frame merges into the
+    open one. ``interval`` 0 sends every frame as it comes.
+    """
+
+    def __init__(self, send: Callable[[dict], Awaitable[None]],
+                 interval: float = WS_COALESCE_INTERVAL_MS / 1000,
+                 max_bytes: int = WS_COALESCE_MAX_BYTES,
+                 max_queue: int = WS_COALESCE_MAX_QUEUE):
+        self._send = send
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.max_queue = max_queue
+        self._queue: deque[dict] = deque()
+        # Merge state of the chunk frame at the tail of the queue, if any:
+        # {"frame", "parts", "size", "opened"}
+        self._open: dict | None = None
+        self._wake = asyncio.Event()
+        self._room = asyncio.Event()
+        self._closing = False
+        self._writer: asyncio.Task | None = None
+
+    async def send(self, data: dict):
+        _stats["frames_in"] += 1
+        if not self.interval:
+            _stats["frames_out"] += 1
+            await self._send(data)
+            return
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write_loop())
+        if len(self._queue) >= self.max_queue and not self._merges(data):
+            # The socket is not keeping up: hold the producer back
+            _stats["send_waits"] += 1
+            while len(self._queue) >= self.max_queue and not self._closing:
+                self._room.clear()
+                await self._room.wait()
+        self._enqueue(data)
+        self._wake.set()
+
+    def _merges(self, data: dict) -> bool:
+        """Whether ``data`` would be merged into the open chunk frame."""
+        current = self._open
+        # A full frame is left as is, so a stalled socket cannot grow it without bound
+        return data.get("type") in CHUNK_TYPES and current is not None \
+            and current["size"] < self.max_bytes and _same_stream(current["frame"], data)
+
+    def _enqueue(self, data: dict):
+        kind = data.get("type")
+        current = self._open
+        if self._merges(data):
+            current["parts"].append(data.get("content", ""))
+            current["size"] += len(data.get("content", ""))
+            _stats["chunks_merged"] += 1
+            return
+        # Anything else ends the merge; the open frame goes out next
+        self._seal()
+        if kind in CHUNK_TYPES:
+            frame = dict(data)
+            self._open = {"frame": frame, "parts": [data.get("content", "")],
+                          "size": len(data.get("content", "")), "opened": time.monotonic()}
+            self._queue.append(frame)
+            return
+        if kind in LATEST_TYPES:
+            for i, queued in enumerate(self._queue):
+                if queued.get("type") == kind:
+                    del self._queue[i]
+                    _stats["status_merged"] += 1
+                    break
+        self._queue.append(data)
+
+    def _seal(self):
+        current, self._open = self._open, None
+        if current is not None:
+            current["frame"]["content"] = "".join(current["parts"])
+
+    def _ready(self) -> float:
+        """Seconds until the head frame may go out (0: now)."""
+        current = self._open
+        if current is None or self._queue[0] is not current["frame"]:
+            return 0.0
+        if self._closing or current["size"] >= self.max_bytes:
+            return 0.0
+        return max(0.0, current["opened"] + self.interval - time.monotonic())
+
+    def _pop(self) -> dict:
+        frame = self._queue.popleft()
+        if self._open is not None and frame is self._open["frame"]:
+            self._seal()
+        return frame
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._queue:
+                if self._closing:
+                    return
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            delay = self._ready()
+            if delay > 0:
+                # Sleep until the chunk frame is due, or until more frames arrive
+                self._wake.clear()
+                timer = loop.call_later(delay, self._wake.set)
+                try:
+                    await self._wake.wait()
+                finally:
+                    timer.cancel()
+                continue
+            frame = self._pop()
+            self._room.set()
+            _stats["frames_out"] += 1
+            try:
+                await self._send(frame)
+            except Exception as e:
+                logger.debug("Dropped %s frame: %s", frame.get("type"), e)
+
+    async def close(self):
+        """Send what is queued and stop the writer."""
+        self._closing = True
+        self._wake.set()
+        self._room.set()
+        if self._writer is not None:
+            await self._writer
+            self._writer = None
+
+
+def _same_stream(frame: dict, data: dict) -> bool:
+    return all(frame.get(k) == v for k, v in data.items() if k != "content") \
+        and len(frame) == len(data)
+
+
+def coalescer_stats() -> dict:
+    stats = dict(_stats)
+    stats["merge_ratio"] = round(stats["frames_in"] / stats["frames_out"], 2) if stats["frames_out"] else None
+    return stats
@@ -36,3 +36,147 @@ def extract_m_and_c(text: str) -> dict[str, str]:
         "mood": extract_tag(m_and_c_block, "mood"),
         "criteria": extract_tag(m_and_c_block, "criteria"),
     }
+
+
+def tags_end(text: str, tags) -> int | None:
+    """Offset just past the last of the first closing ``</tag>`` of each of
+    ``tags``; None unless all of them are closed."""
+    end = 0
+    for tag in tags:
+        i = text.find(f"</{tag}>")
+        if i < 0:
+            return None
+        end = max(end, i + len(tag) + 3)
+    return end
+
+
+class StreamingTagParser:
+    """Incremental parser for the top-level ``<tag>...</tag>`` sections of a
+    streamed response.
+
+    ``feed`` returns ``(tag, text)`` pieces as soon as they are known: text
+    inside one of ``tags`` under that tag's name, anything else under None.
+    Markup split across chunks is held back until the next chunk settles
+    it; other tags are passed through as text. Text inside a tag is
+    stripped as ``extract_tag`` strips it, and text of a tag in
+    ``sentinels`` is held back while it could still be that tag's sentinel
+    value (which is never emitted). Only the first section of each tag
+    counts; an opening tag ends any section left open, and ``close`` ends
+    the last one. ``result``/``raw`` give the parse without a second scan.
+    """
+
+    def __init__(self, tags, sentinels: dict[str, str] | None = None):
+        self.tags = tuple(tags)
+        self.sentinels = sentinels or {}
+        self._markers = {}
+        for tag in self.tags:
+            self._markers[f"<{tag}>"] = (tag, True)
+            self._markers[f"</{tag}>"] = (tag, False)
+        self._chunks: list[str] = []
+        self._buffer = ""  # undecided markup at the end of the last chunk
+        self._open: str | None = None
+        self._parts: list[str] = []
+        self._started = False   # first non-whitespace text of the open tag seen
+        self._pending_ws = ""   # trailing whitespace, emitted if more text follows
+        self._held = ""         # text withheld while it matches the sentinel
+        self._results: dict[str, str] = {}
+        self._closed: set[str] = set()  # sections ended by their own closing tag
+
+    def feed(self, chunk: str) -> list[tuple[str | None, str]]:
+        self._chunks.append(chunk)
+        events: list[tuple[str | None, str]] = []
+        text, self._buffer = self._buffer + chunk, ""
+        pos = 0
+        while True:
+            i = text.find("<", pos)
+            if i < 0:
+                self._text(text[pos:], events)
+                break
+            self._text(text[pos:i], events)
+            for marker, (tag, opening) in self._markers.items():
+                if text.startswith(marker, i):
+                    self._marker(marker, tag, opening, events)
+                    pos = i + len(marker)
+                    break
+            else:
+                rest = text[i:]
+                if any(m.startswith(rest) for m in self._markers):
+                    self._buffer = rest  # could be a marker cut by the chunk boundary
+                    break
+                self._text("<", events)
+                pos = i + 1
+        return events
+
+    def close(self) -> list[tuple[str | None, str]]:
+        """Settle held-back markup and end the open section."""
+        events: list[tuple[str | None, str]] = []
+        text, self._buffer = self._buffer, ""
+        self._text(text, events)
+        if self._open is not None:
+            self._end(events)
+        return events
+
+    def result(self, tag: str) -> str | None:
+        """Stripped content of the tag's first section; None if it never opened."""
+        return self._results.get(tag)
+
+    @property
+    def raw(self) -> str:
+        return "".join(self._chunks)
+
+    @property
+    def complete(self) -> bool:
+        return len(self._closed) == len(self.tags)
+
+    def _marker(self, marker: str, tag: str, opening: bool, events: list):
+        if opening and tag not in self._results and tag != self._open:
+            if self._open is not None:
+                self._end(events)
+            self._open, self._parts = tag, []
+            self._started, self._pending_ws, self._held = False, "", ""
+        elif not opening and tag == self._open:
+            self._closed.add(tag)
+            self._end(events)
+        else:
+            self._text(marker, events)
+
+    def _end(self, events: list):
+        tag = self._open
+        sentinel = self.sentinels.get(tag)
+        if self._held and self._held != sentinel:
+            _emit(events, tag, self._held)
+        self._results[tag] = "".join(self._parts).strip()
+        self._open = None
+
+    def _text(self, text: str, events: list):
+        if not text:
+            return
+        tag = self._open
+        if tag is None:
+            _emit(events, None, text)
+            return
+        self._parts.append(text)
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return
+            self._started = True
+        text = self._pending_ws + text
+        stripped = text.rstrip()
+        self._pending_ws = text[len(stripped):]
+        if not stripped:
+            return
+        sentinel = self.sentinels.get(tag)
+        if sentinel is not None and self._held is not None:
+            self._held += stripped
+            if sentinel.startswith(self._held):
+                return
+            stripped, self._held = self._held, None
+        _emit(events, tag, stripped)
+
+
+def _emit(events: list, tag: str | None, text: str):
+    if events and events[-1][0] == tag:
+        events[-1] = (tag, events[-1][1] + text)
+    else:
+        events.append((tag, text))
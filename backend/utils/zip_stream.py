@@ -0,0 +1,126 @@
+from __future__ import annotations
+import asyncio
+import io
+import logging
+import queue
+import threading
+import zipfile
+from pathlib import Path
+from typing import AsyncIterator, Callable, Iterable, Union
+
+logger = logging.getLogger("agentcsd.export")
+
+# A ZIP entry: the name inside the archive and either a file to copy or a
+# callable returning the entry's content as an iterable of byte chunks
+ZipEntry = tuple[str, Union[Path, Callable[[], Iterable[bytes]]]]
+
+_DONE = object()
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class _ChunkWriter(io.RawIOBase):
+    """Unseekable sink for ZipFile that hands fixed-size chunks to a bounded queue.
+
+    With no seek()/tell(), zipfile streams entries with data descriptors
+    instead of rewriting local headers, so nothing is ever read back.
+    """
+
+    def __init__(self, chunks: queue.Queue, chunk_size: int, cancelled: threading.Event):
+        self._chunks = chunks
+        self._chunk_size = chunk_size
+        self._cancelled = cancelled
+        self._buf = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._buf += b
+        while len(self._buf) >= self._chunk_size:
+            self._put(bytes(self._buf[: self._chunk_size]))
+            del self._buf[: self._chunk_size]
+        return len(b)
+
+    def flush(self):
+        if self._buf:
+            self._put(bytes(self._buf))
+            self._buf.clear()
+
+    def _put(self, item):
+        # Blocks while the client is slow (backpressure), gives up once it is gone
+        while True:
+            if self._cancelled.is_set():
+                raise _Cancelled()
+            try:
+                self._chunks.put(item, timeout=0.25)
+                return
+            except queue.Full:
+                continue
+
+
+def _write_zip(entries: Iterable[ZipEntry], sink: _ChunkWriter):
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+        for arcname, source in entries:
+            if isinstance(source, Path):
+                # Already-compressed files (closed log segments, archives) are stored
+                stored = source.suffix == ".gz"
+                zf.write(source, arcname,
+                         compress_type=zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED)
+            else:
+                with zf.open(arcname, "w", force_zip64=True) as out:
+                    for chunk in source():
+                        out.write(chunk)
+    sink.flush()
+
+
+async def stream_zip(entries: Iterable[ZipEntry], chunk_size: int = 64 * 1024,
+                     max_chunks: int = 16) -> AsyncIterator[bytes]:
+    """Build a ZIP in a worker thread and yield it chunk by chunk.
+
+    ``entries`` is consumed in the worker thread, so it may be a generator
+    doing blocking work (listing directories, reading SQLite). At most
+    ``max_chunks`` chunks are buffered; if the consumer stops early the
+    worker notices and exits.
+    """
+    chunks: queue.Queue = queue.Queue(maxsize=max_chunks)
+    cancelled = threading.Event()
+    sink = _ChunkWriter(chunks, chunk_size, cancelled)
+
+    def produce():
+        try:
+            _write_zip(entries, sink)
+            sink._put(_DONE)
+        except _Cancelled:
+            # Wake the consumer's pending get(), if any
+            try:
+                chunks.put_nowait(_DONE)
+            except queue.Full:
+                pass
+        except Exception as e:
+            logger.error("ZIP export failed: %s", e, exc_info=True)
+            try:
+                sink._put(e)
+            except _Cancelled:
+                pass
+
+    worker = threading.Thread(target=produce, name="zip-export", daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = await asyncio.to_thread(chunks.get)
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        cancelled.set()
+        # Unblock a worker waiting on a full queue
+        while not chunks.empty():
+            try:
+                chunks.get_nowait()
+            except queue.Empty:
+                break
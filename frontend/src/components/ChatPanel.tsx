@@ -6,17 +6,29 @@ import { Badge } from './ui/Badge'
 
 interface ChatPanelProps {
   onSend: (content: string) => void
+  onLoadOlder: (before: number) => void
 }
 
-export function ChatPanel({ onSend }: ChatPanelProps) {
+export function ChatPanel({ onSend, onLoadOlder }: ChatPanelProps) {
   const messages = useChatStore(s => s.messages)
   const sessionId = useSessionStore(s => s.sessionId)
+  const historyCursor = useSessionStore(s => s.historyCursor)
+  const hasMoreHistory = useSessionStore(s => s.hasMoreHistory)
+  const loadingHistory = useSessionStore(s => s.loadingHistory)
   const [input, setInput] = useState('')
   const bottomRef = useRef<HTMLDivElement>(null)
+  const lastMessage = messages[messages.length - 1]
 
+  // Only follow the bottom when the newest message changes, not when older pages are prepended
   useEffect(() => {
     bottomRef.current?.scrollIntoView({ behavior: 'smooth' })
-  }, [messages])
+  }, [lastMessage])
+
+  const handleScroll = (e: React.UIEvent<HTMLDivElement>) => {
+    if (e.currentTarget.scrollTop > 40 || !hasMoreHistory || loadingHistory || historyCursor === null) return
+    useSessionStore.getState().setLoadingHistory(true)
+    onLoadOlder(historyCursor)
+  }
 
   const handleSubmit = (e: React.FormEvent) => {
     e.preventDefault()
@@ -37,7 +49,10 @@ export function ChatPanel({ onSend }: ChatPanelProps) {
       headerRight={<Badge color="green">Chat</Badge>}
       className="flex flex-col h-full"
     >
-      <div className="flex-1 overflow-y-auto p-3 space-y-3">
+      <div className="flex-1 overflow-y-auto p-3 space-y-3" onScroll={handleScroll}>
+        {loadingHistory && (
+          <p className="text-gray-600 text-[10px] text-center">Loading older messages...</p>
+        )}
         {messages.length === 0 && (
           <p className="text-gray-600 text-sm text-center py-8">
             {sessionId ? 'Send a message to start...' : 'Create or resume a session to begin'}
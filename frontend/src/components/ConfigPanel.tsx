@@ -32,6 +32,7 @@ function LayerConfig({
           <option value="claude_code_cli">Claude Code CLI</option>
           <option value="anthropic_api">Anthropic API</option>
           <option value="openai_compatible">OpenAI Compatible</option>
+          <option value="simulated">Simulated (offline)</option>
         </Select>
       </div>
       <div>
@@ -46,6 +47,17 @@ function LayerConfig({
           onChange={e => onChange({ ...config, max_tokens: parseInt(e.target.value) || 4096 })}
         />
       </div>
+      <div>
+        <label className="text-[10px] text-gray-500">Prompt Layout</label>
+        <Select
+          value={config.prompt_layout || 'classic'}
+          onChange={e => onChange({ ...config, prompt_layout: e.target.value })}
+          className="w-full"
+        >
+          <option value="classic">Classic</option>
+          <option value="prefix_stable">Prefix-stable (local KV cache)</option>
+        </Select>
+      </div>
       {config.backend === 'openai_compatible' && (
         <div>
           <label className="text-[10px] text-gray-500">Endpoint URL</label>
@@ -56,6 +68,17 @@ function LayerConfig({
           />
         </div>
       )}
+      {config.backend === 'openai_compatible' && (
+        <div>
+          <label className="text-[10px] text-gray-500">Server Slots (llama.cpp, 0 = auto)</label>
+          <Input
+            type="number"
+            min={0}
+            value={config.slots ?? 0}
+            onChange={e => onChange({ ...config, slots: Math.max(0, parseInt(e.target.value) || 0) })}
+          />
+        </div>
+      )}
       {config.backend === 'anthropic_api' && (
         <div>
           <label className="text-[10px] text-gray-500">API Key</label>
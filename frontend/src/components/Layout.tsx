@@ -122,7 +122,10 @@ export function Layout() {
         style={{ width: hResize.size, flexShrink: 0 }}
       >
         <div className="min-h-0 overflow-hidden" style={{ height: `${chatPct}%` }}>
-          <ChatPanel onSend={(content) => send({ type: 'user_message', content })} />
+          <ChatPanel
+            onSend={(content) => send({ type: 'user_message', content })}
+            onLoadOlder={(before) => send({ type: 'load_history', before })}
+          />
         </div>
         {/* Vertical resize handle */}
         <div
@@ -7,6 +7,8 @@ import { Input } from './ui/Input'
 import { Modal } from './ui/Modal'
 import type { Session, Persona } from '../lib/types'
 
+const SESSION_PAGE_SIZE = 50
+
 interface SidebarProps {
   onCreateSession: (name: string, persona: string) => void
   onResumeSession: (sessionId: string) => void
@@ -26,6 +28,7 @@ export function Sidebar({
   const error = useSessionStore(s => s.error)
 
   const [sessions, setSessions] = useState<Session[]>([])
+  const [hasMoreSessions, setHasMoreSessions] = useState(false)
   const [personas, setPersonas] = useState<Persona[]>([])
   const [showNew, setShowNew] = useState(false)
   const [newName, setNewName] = useState('')
@@ -33,14 +36,21 @@ export function Sidebar({
 
   const loadData = async () => {
     try {
-      const [s, p] = await Promise.all([api.listSessions(), api.listPersonas()])
+      const [s, p] = await Promise.all([api.listSessions(SESSION_PAGE_SIZE), api.listPersonas()])
       setSessions(s)
+      setHasMoreSessions(s.length === SESSION_PAGE_SIZE)
       setPersonas(p)
     } catch {
       // API not ready yet
     }
   }
 
+  const loadMoreSessions = async () => {
+    const more = await api.listSessions(SESSION_PAGE_SIZE, sessions.length)
+    setSessions(prev => [...prev, ...more])
+    setHasMoreSessions(more.length === SESSION_PAGE_SIZE)
+  }
+
   useEffect(() => { loadData() }, [sessionId])
 
   const handleCreate = () => {
@@ -126,10 +136,20 @@ export function Sidebar({
               </button>
             </div>
             <div className="text-[10px] text-gray-500">
-              {s.status} &middot; {new Date(s.updated_at).toLocaleDateString()}
+              {s.status} &middot; {new Date(s.last_activity ?? s.updated_at).toLocaleDateString()}
+              {s.message_count !== undefined && <> &middot; {s.message_count} msgs</>}
+              {s.last_cycle != null && <> &middot; cycle {s.last_cycle}</>}
             </div>
+            {s.last_mood && (
+              <div className="text-[10px] text-gray-600 truncate">{s.last_mood}</div>
+            )}
           </div>
         ))}
+        {hasMoreSessions && (
+          <Button variant="ghost" size="sm" className="w-full" onClick={loadMoreSessions}>
+            Load more
+          </Button>
+        )}
       </div>
 
       {/* New session modal */}
@@ -19,6 +19,7 @@ export function useWebSocket() {
   const appendToLastMessage = useChatStore(s => s.appendToLastMessage)
   const finalizeLastMessage = useChatStore(s => s.finalizeLastMessage)
   const addInternal = useInternalStore(s => s.addEntry)
+  const appendInternal = useInternalStore(s => s.appendStreaming)
   const addSubconscious = useSubconsciousStore(s => s.addEntry)
   const setMoodAndCriteria = useSubconsciousStore(s => s.setMoodAndCriteria)
   const setCycle = useSubconsciousStore(s => s.setCycle)
@@ -27,6 +28,7 @@ export function useWebSocket() {
   const setError = useSessionStore(s => s.setError)
   const setConnected = useSessionStore(s => s.setConnected)
   const loadHistory = useSessionStore(s => s.loadHistory)
+  const prependHistory = useSessionStore(s => s.prependHistory)
 
   const handleMessage = useCallback((event: MessageEvent) => {
     const msg: WSMessage = JSON.parse(event.data)
@@ -55,7 +57,8 @@ export function useWebSocket() {
         addInternal({ type: 'quiet', content: msg.content || '', cycle: msg.cycle, timestamp: msg.timestamp || '', internalOnly: msg.internal_only })
         break
       case 'id_processing_chunk':
-        // Streaming chunk for Internal panel — ignore for now (raw stream)
+        // Parsed ID_quiet (and autonomous ID_loud) text as it streams
+        appendInternal(msg.tag === 'ID_loud' ? 'loud' : 'quiet', msg.content || '', msg.timestamp || '')
         break
       case 's_loud':
         addSubconscious({ type: 'loud', content: msg.content || '', cycle: msg.cycle, timestamp: msg.timestamp || '' })
@@ -92,12 +95,19 @@ export function useWebSocket() {
         setSessionId(msg.session_id || '')
         if (msg.history) loadHistory(msg.history)
         break
+      case 'history_page':
+        prependHistory({
+          messages: msg.messages || [],
+          next_before: msg.next_before ?? null,
+          has_more: msg.has_more ?? false,
+        })
+        break
       case 'error':
         setError(msg.message || 'Unknown error')
         break
     }
-  }, [addChat, appendToLastMessage, finalizeLastMessage, addInternal, addSubconscious,
-      setMoodAndCriteria, setCycle, setRunning, setSessionId, setError, setConnected, loadHistory])
+  }, [addChat, appendToLastMessage, finalizeLastMessage, addInternal, appendInternal, addSubconscious,
+      setMoodAndCriteria, setCycle, setRunning, setSessionId, setError, setConnected, loadHistory, prependHistory])
 
   const connectRef = useRef<() => void>(() => {})
 
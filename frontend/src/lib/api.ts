@@ -1,4 +1,4 @@
-import type { Session, Persona, ModelConfig } from './types'
+import type { Session, Persona, ModelConfig, HistoryPage } from './types'
 
 const BASE = '/api'
 
@@ -16,8 +16,11 @@ async function request<T>(path: string, options?: RequestInit): Promise<T> {
 
 export const api = {
   // Sessions
-  listSessions: () => request<Session[]>('/sessions'),
+  listSessions: (limit = 50, offset = 0, sort = 'last_activity') =>
+    request<Session[]>(`/sessions?limit=${limit}&offset=${offset}&sort=${sort}`),
   getSession: (id: string) => request<{ session: Session; messages: any[]; mood_and_criteria: any }>(`/sessions/${id}`),
+  getMessages: (id: string, before?: number) =>
+    request<HistoryPage>(`/sessions/${id}/messages${before ? `?before=${before}` : ''}`),
   deleteSession: (id: string) => request<{ ok: boolean }>(`/sessions/${id}`, { method: 'DELETE' }),
 
   // Personas
@@ -4,6 +4,12 @@ export interface ModelLayerConfig {
   max_tokens: number
   endpoint?: string
   api_key?: string
+  prompt_layout?: string
+  slots?: number
+  deadline?: number
+  fallback?: ModelLayerConfig
+  context_budget?: Record<string, number>
+  simulation?: Record<string, unknown>
 }
 
 export interface ModelConfig {
@@ -20,6 +26,13 @@ export interface Session {
   summary_frequency: number
   created_at: string
   updated_at: string
+  message_count?: number
+  external_count?: number
+  internal_count?: number
+  subconscious_count?: number
+  last_cycle?: number | null
+  last_mood?: string | null
+  last_activity?: string
 }
 
 export interface Message {
@@ -32,6 +45,13 @@ export interface Message {
   created_at: string
 }
 
+export interface HistoryPage {
+  messages: Message[]
+  next_before: number | null
+  next_after?: number | null
+  has_more: boolean
+}
+
 export interface MoodAndCriteria {
   mood: string
   criteria: string
@@ -56,12 +76,19 @@ export interface WSMessage {
   name?: string
   history?: {
     messages: Message[]
+    next_before?: number | null
+    has_more?: boolean
     mood_and_criteria: MoodAndCriteria | null
     cycle: number
   }
+  // history_page fields
+  messages?: Message[]
+  next_before?: number | null
+  has_more?: boolean
   message?: string
   subconscious_running?: boolean
   internal_only?: boolean
+  tag?: string  // id_processing_chunk: 'ID_loud' | 'ID_quiet'
   // Input context fields
   ed_user?: string
   ed_agent?: string
@@ -10,6 +10,7 @@ export interface ChatMessage {
 interface ChatState {
   messages: ChatMessage[]
   addMessage: (msg: ChatMessage) => void
+  prependMessages: (msgs: ChatMessage[]) => void
   appendToLastMessage: (chunk: string) => void
   finalizeLastMessage: (content: string) => void
   clear: () => void
@@ -18,6 +19,7 @@ interface ChatState {
 export const useChatStore = create<ChatState>((set) => ({
   messages: [],
   addMessage: (msg) => set((s) => ({ messages: [...s.messages, msg] })),
+  prependMessages: (msgs) => set((s) => ({ messages: [...msgs, ...s.messages] })),
   appendToLastMessage: (chunk) => set((s) => {
     const msgs = [...s.messages]
     const last = msgs[msgs.length - 1]
@@ -6,6 +6,8 @@ export interface InternalEntry {
   cycle?: number
   timestamp: string
   internalOnly?: boolean
+  // Draft built from id_processing_chunk frames until the final entry arrives
+  streaming?: boolean
   // Input context fields
   edUser?: string
   sLoudEntries?: { cycle?: number; content: string }[]
@@ -16,11 +18,24 @@ export interface InternalEntry {
 interface InternalState {
   entries: InternalEntry[]
   addEntry: (entry: InternalEntry) => void
+  appendStreaming: (type: 'loud' | 'quiet', chunk: string, timestamp: string) => void
+  prependEntries: (entries: InternalEntry[]) => void
   clear: () => void
 }
 
 export const useInternalStore = create<InternalState>((set) => ({
   entries: [],
-  addEntry: (entry) => set((s) => ({ entries: [...s.entries, entry] })),
+  addEntry: (entry) => set((s) => ({
+    // The finished entry replaces its streamed draft
+    entries: [...s.entries.filter(e => !(e.streaming && e.type === entry.type)), entry],
+  })),
+  appendStreaming: (type, chunk, timestamp) => set((s) => {
+    const last = s.entries[s.entries.length - 1]
+    if (last && last.streaming && last.type === type) {
+      return { entries: [...s.entries.slice(0, -1), { ...last, content: last.content + chunk }] }
+    }
+    return { entries: [...s.entries, { type, content: chunk, timestamp, streaming: true }] }
+  }),
+  prependEntries: (entries) => set((s) => ({ entries: [...entries, ...s.entries] })),
   clear: () => set({ entries: [] }),
 }))
@@ -1,35 +1,69 @@
 import { create } from 'zustand'
-import { useChatStore } from './chatStore'
-import { useInternalStore } from './internalStore'
-import { useSubconsciousStore } from './subconsciousStore'
-import type { Session, Message, MoodAndCriteria } from '../lib/types'
+import { useChatStore, type ChatMessage } from './chatStore'
+import { useInternalStore, type InternalEntry } from './internalStore'
+import { useSubconsciousStore, type SubconsciousEntry } from './subconsciousStore'
+import type { Session, Message, MoodAndCriteria, HistoryPage } from '../lib/types'
 
 interface SessionState {
   sessionId: string | null
   sessions: Session[]
   error: string | null
   connected: boolean
+  historyCursor: number | null
+  hasMoreHistory: boolean
+  loadingHistory: boolean
   setSessionId: (id: string) => void
   setSessions: (sessions: Session[]) => void
   setError: (error: string | null) => void
   setConnected: (connected: boolean) => void
+  setLoadingHistory: (loading: boolean) => void
   loadHistory: (history: {
     messages: Message[]
+    next_before?: number | null
+    has_more?: boolean
     mood_and_criteria: MoodAndCriteria | null
     cycle: number
   }) => void
+  prependHistory: (page: HistoryPage) => void
   clearSession: () => void
 }
 
+function splitMessages(messages: Message[]) {
+  const chat: ChatMessage[] = []
+  const internal: InternalEntry[] = []
+  const subconscious: SubconsciousEntry[] = []
+
+  for (const msg of messages) {
+    if (msg.tag === 'ED_user') {
+      chat.push({ role: 'user', content: msg.content, timestamp: msg.created_at })
+    } else if (msg.tag === 'ED_agent') {
+      chat.push({ role: 'assistant', content: msg.content, timestamp: msg.created_at })
+    } else if (msg.tag === 'ID_loud') {
+      internal.push({ type: 'loud', content: msg.content, cycle: msg.cycle_number ?? undefined, timestamp: msg.created_at })
+    } else if (msg.tag === 'ID_quiet') {
+      internal.push({ type: 'quiet', content: msg.content, cycle: msg.cycle_number ?? undefined, timestamp: msg.created_at })
+    } else if (msg.tag === 'S_loud') {
+      subconscious.push({ type: 'loud', content: msg.content, cycle: msg.cycle_number ?? undefined, timestamp: msg.created_at })
+    } else if (msg.tag === 'S_quiet') {
+      subconscious.push({ type: 'quiet', content: msg.content, cycle: msg.cycle_number ?? undefined, timestamp: msg.created_at })
+    }
+  }
+  return { chat, internal, subconscious }
+}
+
 export const useSessionStore = create<SessionState>((set) => ({
   sessionId: null,
   sessions: [],
   error: null,
   connected: false,
+  historyCursor: null,
+  hasMoreHistory: false,
+  loadingHistory: false,
   setSessionId: (id) => set({ sessionId: id, error: null }),
   setSessions: (sessions) => set({ sessions }),
   setError: (error) => set({ error }),
   setConnected: (connected) => set({ connected }),
+  setLoadingHistory: (loading) => set({ loadingHistory: loading }),
   loadHistory: (history) => {
     const chatStore = useChatStore.getState()
     const internalStore = useInternalStore.getState()
@@ -39,21 +73,10 @@ export const useSessionStore = create<SessionState>((set) => ({
     internalStore.clear()
     subconsciousStore.clear()
 
-    for (const msg of history.messages) {
-      if (msg.tag === 'ED_user') {
-        chatStore.addMessage({ role: 'user', content: msg.content, timestamp: msg.created_at })
-      } else if (msg.tag === 'ED_agent') {
-        chatStore.addMessage({ role: 'assistant', content: msg.content, timestamp: msg.created_at })
-      } else if (msg.tag === 'ID_loud') {
-        internalStore.addEntry({ type: 'loud', content: msg.content, cycle: msg.cycle_number ?? undefined, timestamp: msg.created_at })
-      } else if (msg.tag === 'ID_quiet') {
-        internalStore.addEntry({ type: 'quiet', content: msg.content, cycle: msg.cycle_number ?? undefined, timestamp: msg.created_at })
-      } else if (msg.tag === 'S_loud') {
-        subconsciousStore.addEntry({ type: 'loud', content: msg.content, cycle: msg.cycle_number ?? undefined, timestamp: msg.created_at })
-      } else if (msg.tag === 'S_quiet') {
-        subconsciousStore.addEntry({ type: 'quiet', content: msg.content, cycle: msg.cycle_number ?? undefined, timestamp: msg.created_at })
-      }
-    }
+    const { chat, internal, subconscious } = splitMessages(history.messages)
+    chatStore.prependMessages(chat)
+    internalStore.prependEntries(internal)
+    subconsciousStore.prependEntries(subconscious)
 
     if (history.mood_and_criteria) {
       subconsciousStore.setMoodAndCriteria(
@@ -63,11 +86,23 @@ export const useSessionStore = create<SessionState>((set) => ({
       )
     }
     subconsciousStore.setCycle(history.cycle)
+    set({
+      historyCursor: history.next_before ?? null,
+      hasMoreHistory: history.has_more ?? false,
+      loadingHistory: false,
+    })
+  },
+  prependHistory: (page) => {
+    const { chat, internal, subconscious } = splitMessages(page.messages)
+    useChatStore.getState().prependMessages(chat)
+    useInternalStore.getState().prependEntries(internal)
+    useSubconsciousStore.getState().prependEntries(subconscious)
+    set({ historyCursor: page.next_before, hasMoreHistory: page.has_more, loadingHistory: false })
   },
   clearSession: () => {
     useChatStore.getState().clear()
     useInternalStore.getState().clear()
     useSubconsciousStore.getState().clear()
-    set({ sessionId: null, error: null })
+    set({ sessionId: null, error: null, historyCursor: null, hasMoreHistory: false, loadingHistory: false })
   },
 }))
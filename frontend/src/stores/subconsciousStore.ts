@@ -19,6 +19,7 @@ interface SubconsciousState {
   cycle: number
   running: boolean
   addEntry: (entry: SubconsciousEntry) => void
+  prependEntries: (entries: SubconsciousEntry[]) => void
   setMoodAndCriteria: (mood: string, criteria: string, cycle?: number) => void
   setCycle: (cycle: number) => void
   setRunning: (running: boolean) => void
@@ -32,6 +33,7 @@ export const useSubconsciousStore = create<SubconsciousState>((set) => ({
   cycle: 0,
   running: false,
   addEntry: (entry) => set((s) => ({ entries: [...s.entries, entry] })),
+  prependEntries: (entries) => set((s) => ({ entries: [...entries, ...s.entries] })),
   setMoodAndCriteria: (mood, criteria, cycle) =>
     set((s) => ({ mood, criteria, ...(cycle !== undefined ? { cycle } : {}) })),
   setCycle: (cycle) => set({ cycle }),